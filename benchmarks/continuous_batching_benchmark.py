@@ -0,0 +1,112 @@
+"""
+Compare direct, statically batched and continuously batched generation on a tiny
+randomly initialised GPT-2, so it runs offline without downloading any checkpoint.
+
+    python benchmarks/continuous_batching_benchmark.py --requests 32 --max-batch-size 8
+"""
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import random
+import statistics
+import sys
+import time
+
+import torch
+from transformers import GPT2Config, GPT2LMHeadModel
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "src"))
+
+from mai.generators.gpt2_generator import GPT2Generator
+
+
+def build_generator(args) -> GPT2Generator:
+    torch.manual_seed(args.seed)
+    # No EOS, so every request decodes exactly its own max_new_tokens
+    config = GPT2Config(
+        n_layer=args.layers, n_embd=args.hidden_size, n_head=args.heads, vocab_size=args.vocab_size,
+        bos_token_id=None, eos_token_id=None,
+    )
+    generator = GPT2Generator(pretrained="tiny-random-gpt2")
+    generator.model = GPT2LMHeadModel(config).eval()
+    generator.default_parameters.update({"pad_token_id": 0, "do_sample": False})
+    return generator
+
+
+def build_workload(args):
+    rng = random.Random(args.seed)
+    workload = []
+    for _ in range(args.requests):
+        prompt = torch.tensor([rng.randrange(1, args.vocab_size) for _ in range(rng.randint(8, args.max_prompt_tokens))])
+        # Mostly short completions with a few long ones, like inline code completions
+        max_new_tokens = args.long_tokens if rng.random() < 0.2 else rng.randint(4, args.short_tokens)
+        workload.append((prompt, max_new_tokens))
+    return workload
+
+
+def run(generator: GPT2Generator, workload, concurrency: int):
+    """
+    Send the whole workload at once and measure each request from that moment until its completion.
+    """
+    params = {key: value for key, value in generator.default_parameters.items() if key not in ("temperature", "top_p")}
+
+    def request(item):
+        prompt, max_new_tokens = item
+        output_ids = generator.generate_ids(
+            prompt[None, :], torch.ones_like(prompt)[None, :], {**params, "max_new_tokens": max_new_tokens}
+        )
+        return time.perf_counter() - started, output_ids.shape[-1] - prompt.shape[-1]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(request, workload))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in results)
+    new_tokens = sum(tokens for _, tokens in results)
+    return {
+        "tokens/s": new_tokens / elapsed,
+        "mean latency (s)": statistics.mean(latencies),
+        "p50 latency (s)": latencies[len(latencies) // 2],
+        "p95 latency (s)": latencies[int(len(latencies) * 0.95) - 1],
+        "wall time (s)": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Continuous batching benchmark")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--batch-wait-ms", type=float, default=10)
+    parser.add_argument("--max-prompt-tokens", type=int, default=128)
+    parser.add_argument("--short-tokens", type=int, default=16)
+    parser.add_argument("--long-tokens", type=int, default=128)
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--hidden-size", type=int, default=256)
+    parser.add_argument("--heads", type=int, default=4)
+    parser.add_argument("--vocab-size", type=int, default=2048)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    workload = build_workload(args)
+    results = {}
+
+    generator = build_generator(args)
+    results["direct"] = run(generator, workload, concurrency=1)
+
+    generator = build_generator(args)
+    generator.enable_batching(args.max_batch_size, args.batch_wait_ms)
+    results["batched"] = run(generator, workload, concurrency=len(workload))
+
+    generator = build_generator(args)
+    generator.enable_continuous_batching(args.max_batch_size)
+    results["continuous"] = run(generator, workload, concurrency=len(workload))
+
+    metrics = list(results["direct"].keys())
+    print(f"{'mode':<12}" + "".join(f"{metric:>20}" for metric in metrics))
+    for mode, result in results.items():
+        print(f"{mode:<12}" + "".join(f"{result[metric]:>20.3f}" for metric in metrics))
+
+
+if __name__ == "__main__":
+    main()
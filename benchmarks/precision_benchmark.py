@@ -0,0 +1,129 @@
+"""
+Compare the precisions a generator can be loaded in on a tiny randomly initialised Llama,
+so it runs offline without downloading any checkpoint. Each precision runs in its own
+process, so peak resident memory is measured separately for each. Random weights give
+nearly flat next-token distributions, so agreement with fp32 is a pessimistic estimate.
+
+    python benchmarks/precision_benchmark.py --prompts 8 --max-new-tokens 32
+"""
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import multiprocessing
+import random
+import resource
+import sys
+import time
+
+import torch
+from transformers import LlamaConfig, LlamaForCausalLM
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "src"))
+
+from mai.generators.deepseek_coder_generator import DeepSeekCoderGenerator
+from mai.inference.quantization import PRECISIONS
+
+
+def build_generator(args, precision: str) -> DeepSeekCoderGenerator:
+    torch.manual_seed(args.seed)
+    # No EOS, so every prompt decodes exactly max_new_tokens
+    config = LlamaConfig(
+        hidden_size=args.hidden_size, intermediate_size=args.hidden_size * 4, num_hidden_layers=args.layers,
+        num_attention_heads=args.heads, num_key_value_heads=args.heads, vocab_size=args.vocab_size,
+        bos_token_id=None, eos_token_id=None,
+    )
+    generator = DeepSeekCoderGenerator(pretrained="tiny-random-llama")
+    generator.set_precision(precision)
+    # Initialise directly in the load dtype, as from_pretrained does, so fp32 weights never exist for bf16
+    torch.set_default_dtype(generator.load_dtype())
+    generator.model = LlamaForCausalLM(config).eval()
+    generator.apply_precision()
+    generator.default_parameters.update({"pad_token_id": 0, "do_sample": False, "max_new_tokens": args.max_new_tokens})
+    return generator
+
+
+def build_prompts(args):
+    rng = random.Random(args.seed)
+    return [
+        torch.tensor([rng.randrange(1, args.vocab_size) for _ in range(rng.randint(16, args.max_prompt_tokens))])
+        for _ in range(args.prompts)
+    ]
+
+
+def run(args, precision: str) -> dict:
+    """
+    Greedily complete every prompt, returning throughput, memory and the generated token IDs.
+    """
+    generator = build_generator(args, precision)
+    params = {key: value for key, value in generator.default_parameters.items() if key not in ("temperature", "top_p")}
+    prompts = build_prompts(args)
+
+    # Warm up once so kernel selection is not timed
+    generator.generate_ids(prompts[0][None, :4], torch.ones_like(prompts[0])[None, :4], {**params, "max_new_tokens": 2})
+
+    completions = []
+    started = time.perf_counter()
+    for prompt in prompts:
+        output_ids = generator.generate_ids(prompt[None, :], torch.ones_like(prompt)[None, :], params)
+        completions.append(output_ids[prompt.shape[-1]:].tolist())
+    elapsed = time.perf_counter() - started
+
+    return {
+        "tokens/s": sum(len(completion) for completion in completions) / elapsed,
+        "model (MB)": generator.memory_footprint() / 1024 ** 2,
+        "peak RSS (MB)": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "completions": completions,
+    }
+
+
+def agreement(completions, reference) -> dict:
+    """
+    How closely greedy completions follow the fp32 ones: the share of completions that match
+    exactly, and the share of tokens generated before the first divergence.
+    """
+    matching_prefix = 0
+    for completion, expected in zip(completions, reference):
+        for token, expected_token in zip(completion, expected):
+            if token != expected_token:
+                break
+            matching_prefix += 1
+    return {
+        "exact match": sum(c == e for c, e in zip(completions, reference)) / len(reference),
+        "token agreement": matching_prefix / sum(len(expected) for expected in reference),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precision benchmark")
+    parser.add_argument("--precisions", nargs="+", default=["fp32", "bf16", "int8", "int4"], choices=PRECISIONS)
+    parser.add_argument("--prompts", type=int, default=8)
+    parser.add_argument("--max-prompt-tokens", type=int, default=64)
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--hidden-size", type=int, default=512)
+    parser.add_argument("--heads", type=int, default=8)
+    parser.add_argument("--vocab-size", type=int, default=4096)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = {}
+    for precision in dict.fromkeys(["fp32"] + args.precisions):
+        # A fresh process per precision, so one run's memory does not count towards the next
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            try:
+                results[precision] = executor.submit(run, args, precision).result()
+            except RuntimeError as e:
+                print(f"skipping {precision}: {e}")
+
+    reference = results["fp32"]["completions"]
+    for result in results.values():
+        result.update(agreement(result.pop("completions"), reference))
+
+    metrics = list(results["fp32"].keys())
+    print(f"{'precision':<12}" + "".join(f"{metric:>18}" for metric in metrics))
+    for precision, result in results.items():
+        print(f"{precision:<12}" + "".join(f"{result[metric]:>18.3f}" for metric in metrics))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Compare plain greedy decoding of a registered target generator with prompt lookup and with
+speculative decoding using a smaller registered draft generator, checking that all of them
+produce the same completions.
+
+    python benchmarks/speculative_benchmark.py --target starcoder --draft tinystarcoder --draft-tokens 4
+
+`--target-checkpoint` and `--draft-checkpoint` load other checkpoints into the same generator classes.
+"""
+from pathlib import Path
+import argparse
+import sys
+import time
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "src"))
+
+from mai.generators.generator_manager import GENERATOR_REGISTRY, import_generator
+from mai.inference.usage import TokenUsage
+
+PROMPTS = [
+    "def fibonacci(n):\n",
+    "import os\nimport sys\n\n\ndef main():\n",
+    "class Stack:\n    def __init__(self):\n        self.items = []\n\n    def push(self, item):\n",
+    "def read_json(path):\n    with open(path) as f:\n",
+    "for i in range(10):\n    if i % 2 == 0:\n",
+]
+
+
+def build_generator(name: str, checkpoint: str = None):
+    import_path, arguments = GENERATOR_REGISTRY[name]
+    arguments = {key: value for key, value in arguments.items() if key != "precision"}
+    if checkpoint:
+        arguments["pretrained"] = checkpoint
+    generator = import_generator(import_path, arguments)
+    generator.load()
+    return generator
+
+
+def run(generator, max_new_tokens: int, prompt_lookup: bool = False) -> dict:
+    parameters = {"max_new_tokens": max_new_tokens, "do_sample": False, "prompt_lookup": prompt_lookup}
+    # Warm up once so kernel selection is not timed
+    generator.generate(PROMPTS[0], {"max_new_tokens": 2, "do_sample": False})
+
+    completions = []
+    new_tokens = 0
+    started = time.perf_counter()
+    for prompt in PROMPTS:
+        usage = TokenUsage()
+        completion = generator.generate(prompt, {**parameters, "usage": usage})
+        completions.append(completion)
+        new_tokens += usage.completion_tokens
+    elapsed = time.perf_counter() - started
+    return {"tokens/s": new_tokens / elapsed, "wall time (s)": elapsed, "completions": completions}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Speculative decoding benchmark")
+    parser.add_argument("--target", default="starcoder", choices=GENERATOR_REGISTRY.keys())
+    parser.add_argument("--draft", default="tinystarcoder", choices=GENERATOR_REGISTRY.keys())
+    parser.add_argument("--no-draft", action="store_true", help="Only compare plain decoding with prompt lookup")
+    parser.add_argument("--target-checkpoint")
+    parser.add_argument("--draft-checkpoint")
+    parser.add_argument("--draft-tokens", type=int, default=4)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    target = build_generator(args.target, args.target_checkpoint)
+    results = {"plain": run(target, args.max_new_tokens), "prompt lookup": run(target, args.max_new_tokens, prompt_lookup=True)}
+    stats = {"prompt lookup": target.speculative_decoder.stats()["prompt_lookup"]}
+    if not args.no_draft:
+        target.enable_speculative_decoding(build_generator(args.draft, args.draft_checkpoint), args.draft_tokens)
+        results["draft model"] = run(target, args.max_new_tokens)
+        stats["draft model"] = target.speculative_decoder.stats()["draft_model"]
+
+    print(f"{'mode':<16}{'tokens/s':>12}{'speedup':>10}{'acceptance':>12}{'accepted/step':>15}{'same output':>13}")
+    for mode, result in results.items():
+        method_stats = stats.get(mode, {})
+        matching = sum(a == b for a, b in zip(results["plain"]["completions"], result["completions"]))
+        print(
+            f"{mode:<16}{result['tokens/s']:>12.2f}{result['tokens/s'] / results['plain']['tokens/s']:>9.2f}x"
+            f"{method_stats.get('acceptance_rate', 0):>12.1%}{method_stats.get('accepted_per_step', 0):>15.2f}"
+            f"{f'{matching}/{len(PROMPTS)}':>13}"
+        )
+
+
+if __name__ == "__main__":
+    main()
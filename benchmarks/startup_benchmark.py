@@ -0,0 +1,120 @@
+"""
+Measure how quickly a fresh server process starts listening, reports ready and serves
+its first completion. Runs the API with uvicorn in a subprocess, so import and model
+load times are included exactly as in production.
+
+    python benchmarks/startup_benchmark.py --model gpt2 --runs 3
+"""
+from pathlib import Path
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+SRC_PATH = Path(__file__).resolve().parent.parent / "src"
+
+
+def wait_until(condition, timeout: float, interval: float = 0.02):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if condition():
+            return True
+        time.sleep(interval)
+    raise TimeoutError("Server did not get there in time")
+
+
+def listening(port: int) -> bool:
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+            return True
+    except OSError:
+        return False
+
+
+def ready(port: int) -> bool:
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=5) as response:
+            return response.status == 200
+    except urllib.error.HTTPError as e:
+        body = json.loads(e.read() or b"{}")
+        failed = {name: model["error"] for name, model in body.get("models", {}).items() if model["status"] == "failed"}
+        if failed:
+            raise RuntimeError(f"Model load failed: {failed}")
+        return False
+    except OSError:
+        return False
+
+
+def complete(port: int, model: str, prompt: str, max_tokens: int):
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/v1/completions",
+        data=json.dumps({"model": model, "prompt": prompt, "max_tokens": max_tokens}).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=600) as response:
+        response.read()
+
+
+def run_once(args) -> dict:
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(SRC_PATH), os.environ.get("PYTHONPATH")])),
+        "DEFAULT_GENERATOR": args.model,
+    }
+    if args.chat_model:
+        env["CHAT_GENERATOR"] = args.chat_model
+    command = [
+        sys.executable, "-m", "uvicorn", "mai.api:create_app", "--factory",
+        "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning",
+    ]
+
+    started = time.perf_counter()
+    server = subprocess.Popen(command, env=env)
+    try:
+        wait_until(lambda: listening(args.port), args.timeout)
+        time_to_listen = time.perf_counter() - started
+        wait_until(lambda: ready(args.port), args.timeout, interval=0.05)
+        time_to_ready = time.perf_counter() - started
+        complete(args.port, args.model, args.prompt, args.max_tokens)
+        time_to_first_completion = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {
+        "time to listen (s)": time_to_listen,
+        "time to ready (s)": time_to_ready,
+        "time to first completion (s)": time_to_first_completion,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server startup benchmark")
+    parser.add_argument("--model", required=True, help="Default model to preload")
+    parser.add_argument("--chat-model", help="Chat model to preload")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=34199)
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait for each stage")
+    parser.add_argument("--prompt", default="def fibonacci(n):")
+    parser.add_argument("--max-tokens", type=int, default=16)
+    args = parser.parse_args()
+
+    results = []
+    for run in range(args.runs):
+        result = run_once(args)
+        results.append(result)
+        print(f"run {run + 1}: " + ", ".join(f"{name} {value:.2f}" for name, value in result.items()))
+
+    print(f"\nmedian over {args.runs} run(s):")
+    for name in results[0]:
+        print(f"  {name:<30} {statistics.median(result[name] for result in results):8.2f}")
+
+
+if __name__ == "__main__":
+    main()
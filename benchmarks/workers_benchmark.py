@@ -0,0 +1,112 @@
+"""
+Measure how throughput and memory scale with the number of worker processes. For each worker
+count, starts `main.py --workers N` with a real checkpoint, sends completion requests from
+concurrent clients for a fixed time and reports requests/s, latency and the memory of the
+whole process tree. Proportional set size (PSS) splits shared pages between the processes
+sharing them, so it shows how much of the model stays shared after forking.
+
+    python benchmarks/workers_benchmark.py --model gpt2 --workers 1 2 4 8 --clients 16
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from startup_benchmark import complete, listening, ready, wait_until
+
+MAIN_PATH = Path(__file__).resolve().parent.parent / "main.py"
+
+
+def process_tree(pid: int) -> list:
+    children = Path(f"/proc/{pid}/task/{pid}/children").read_text().split()
+    return [pid] + [descendant for child in children for descendant in process_tree(int(child))]
+
+
+def memory_mb(pid: int) -> dict:
+    """
+    Resident and proportional memory of a process and all of its descendants, in MB.
+    """
+    totals = {"Rss": 0, "Pss": 0}
+    for process in process_tree(pid):
+        for line in Path(f"/proc/{process}/smaps_rollup").read_text().splitlines():
+            name, _, value = line.partition(":")
+            if name in totals:
+                totals[name] += int(value.split()[0])
+    return {"rss (MB)": totals["Rss"] / 1024, "pss (MB)": totals["Pss"] / 1024}
+
+
+def run_load(args) -> dict:
+    """
+    Keep `clients` requests in flight for `duration` seconds.
+    """
+    deadline = time.perf_counter() + args.duration
+    latencies = []
+
+    def client():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            complete(args.port, args.model, args.prompt, args.max_tokens)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.clients) as executor:
+        for future in [executor.submit(client) for _ in range(args.clients)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests/s": len(latencies) / elapsed,
+        "p50 latency (s)": latencies[len(latencies) // 2],
+        "p95 latency (s)": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def run_workers(args, workers: int) -> dict:
+    command = [
+        sys.executable, str(MAIN_PATH), "--model", args.model, "--port", str(args.port),
+        "--workers", str(workers), "--inference-queue-size", str(args.clients),
+    ]
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until(lambda: listening(args.port), args.timeout)
+        wait_until(lambda: ready(args.port), args.timeout, interval=0.1)
+        complete(args.port, args.model, args.prompt, args.max_tokens)
+        result = run_load(args)
+        result.update(memory_mb(server.pid))
+    finally:
+        server.terminate()
+        server.wait()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker scaling benchmark")
+    parser.add_argument("--model", required=True, help="Model to preload and query")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load per worker count")
+    parser.add_argument("--port", type=int, default=34198)
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait for the server to get ready")
+    parser.add_argument("--prompt", default="def fibonacci(n):")
+    parser.add_argument("--max-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} cores")
+    results = {workers: run_workers(args, workers) for workers in args.workers}
+    baseline = results[args.workers[0]]["requests/s"]
+
+    metrics = list(next(iter(results.values())).keys())
+    print(f"{'workers':<9}" + "".join(f"{metric:>18}" for metric in metrics) + f"{'scaling':>10}")
+    for workers, result in results.items():
+        print(
+            f"{workers:<9}" + "".join(f"{result[metric]:>18.2f}" for metric in metrics)
+            + f"{result['requests/s'] / baseline:>9.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
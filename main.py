@@ -16,14 +16,66 @@ parser.add_argument("--model", required=True, help="Default model for code compl
 parser.add_argument("--chat-model", help="Model for chat completions")
 parser.add_argument("--device", default="cpu", help="Device to run models (cpu or cuda)")
 parser.add_argument("--port", type=int, default=34100, help="Port for the API")
+parser.add_argument("--workers", type=int, default=1, help="Worker processes sharing the preloaded models")
+parser.add_argument("--reload", action="store_true", help="Restart the server when the code changes, for development; needs a single worker")
+parser.add_argument("--threads-per-worker", type=int, default=0, help="Torch threads per worker (0 splits the cores evenly)")
+parser.add_argument("--dispatch", action="store_true", help="Run each model in its own worker process behind this front end")
+parser.add_argument("--worker-config", metavar="PATH", help="JSON file with per-model worker cores, threads, concurrency and queue size for --dispatch")
+parser.add_argument("--model-memory-mb", type=float, default=0, help="Memory budget for all loaded models; least recently used ones are unloaded to stay within it (0 disables)")
+parser.add_argument("--precision", default="fp32", choices=["fp32", "bf16", "int8", "int4"], help="Precision models are loaded in on CPU")
+parser.add_argument("--model-precision", action="append", default=[], metavar="NAME=PRECISION", help="Precision for one model, overriding --precision (repeatable)")
+parser.add_argument("--warmup", action="store_true", help="Run a short generation after loading each model")
+parser.add_argument("--inference-workers", type=int, default=1, help="Concurrent inference calls per model")
+parser.add_argument("--inference-queue-size", type=int, default=8, help="Requests allowed to wait per model before rejecting with 503")
+parser.add_argument("--serving-mode", default="direct", choices=["direct", "batched", "continuous"], help="How concurrent requests share a model")
+parser.add_argument("--max-batch-size", type=int, default=8, help="Largest batch in batched and continuous serving modes")
+parser.add_argument("--batch-wait-ms", type=float, default=10, help="How long to wait for more requests before running a batch")
+parser.add_argument("--prefix-cache-mb", type=float, default=0, help="Memory budget for reusing prompt prefix KV caches (0 disables)")
+parser.add_argument("--draft-model", action="append", default=[], metavar="TARGET=DRAFT", help="Decode TARGET speculatively with DRAFT proposing tokens, e.g. starcoder=tinystarcoder (repeatable)")
+parser.add_argument("--draft-tokens", type=int, default=4, help="Tokens the draft model proposes per speculative step")
+parser.add_argument("--response-cache-mb", type=float, default=0, help="Memory budget for caching repeated deterministic completions (0 disables)")
+parser.add_argument("--response-cache-ttl", type=float, default=3600, help="Seconds a cached completion stays valid")
+parser.add_argument("--response-cache-path", help="SQLite file that keeps cached completions across restarts")
+parser.add_argument("--vector-store-dir", help="Directory that persists embedding collections (in memory only when unset)")
+parser.add_argument("--debounce-ms", type=float, default=0, help="Hold completion requests from one session this long and drop superseded ones (0 disables)")
 
 args = parser.parse_args()
+if args.dispatch and args.workers > 1:
+    parser.error("--dispatch runs one front end; it cannot be combined with --workers")
+if args.vector_store_dir and args.workers > 1:
+    parser.error("--vector-store-dir is written by a single process; it cannot be combined with --workers")
+if args.reload and args.workers > 1:
+    parser.error("--reload runs a single worker; it cannot be combined with --workers")
 
 # Set environment variables
 os.environ["DEFAULT_GENERATOR"] = args.model
 if args.chat_model:
     os.environ["CHAT_GENERATOR"] = args.chat_model
 os.environ["DEVICE"] = args.device
+os.environ["MODEL_DISPATCH"] = str(args.dispatch).lower()
+if args.worker_config:
+    os.environ["MODEL_WORKER_CONFIG"] = args.worker_config
+os.environ["MODEL_MEMORY_BUDGET_MB"] = str(args.model_memory_mb)
+os.environ["MODEL_PRECISION"] = args.precision
+if args.model_precision:
+    os.environ["MODEL_PRECISION_OVERRIDES"] = ",".join(args.model_precision)
+os.environ["WARMUP_ON_LOAD"] = str(args.warmup).lower()
+os.environ["INFERENCE_WORKERS"] = str(args.inference_workers)
+os.environ["INFERENCE_QUEUE_SIZE"] = str(args.inference_queue_size)
+os.environ["SERVING_MODE"] = args.serving_mode
+os.environ["BATCH_MAX_SIZE"] = str(args.max_batch_size)
+os.environ["BATCH_MAX_WAIT_MS"] = str(args.batch_wait_ms)
+os.environ["PREFIX_CACHE_MB"] = str(args.prefix_cache_mb)
+if args.draft_model:
+    os.environ["SPECULATIVE_DRAFTS"] = ",".join(args.draft_model)
+os.environ["SPECULATIVE_DRAFT_TOKENS"] = str(args.draft_tokens)
+os.environ["RESPONSE_CACHE_MB"] = str(args.response_cache_mb)
+os.environ["RESPONSE_CACHE_TTL"] = str(args.response_cache_ttl)
+if args.response_cache_path:
+    os.environ["RESPONSE_CACHE_PATH"] = args.response_cache_path
+if args.vector_store_dir:
+    os.environ["VECTOR_STORE_DIR"] = args.vector_store_dir
+os.environ["DEBOUNCE_MS"] = str(args.debounce_ms)
 
 # Import the app after setting environment variables
 from mai.api import create_app
@@ -41,4 +93,8 @@ def setup_debugging():
 
 if __name__ == "__main__":
     setup_debugging()
-    uvicorn.run("mai.api:create_app", host="0.0.0.0", port=args.port, reload=True)
+    if args.workers > 1:
+        from mai.api.prefork import serve_prefork
+        serve_prefork("0.0.0.0", args.port, args.workers, args.threads_per_worker or None)
+    else:
+        uvicorn.run("mai.api:create_app", host="0.0.0.0", port=args.port, reload=args.reload)
@@ -1,5 +1,6 @@
 import os
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import RedirectResponse
 from mai.api.completions import router as completions_router
@@ -7,28 +8,67 @@ from mai.api.chat import router as chat_router
 from mai.api.embeddings import router as embeddings_router
 from mai.api.models import router as models_router
 from mai.api.legacy import router as legacy_router
+from mai.api.stats import router as stats_router
+from mai.api.vectors import router as vectors_router
+from mai.api.health import router as health_router
+from mai.api.metrics import router as metrics_router
+from mai.api.scheduling import schedule_request
 from mai.generators.generator_manager import GeneratorManager
 from mai.crosscutting.logging import get_logger
 from mai.core.constants import COPILOT_API_NAME
 
 logger = get_logger(COPILOT_API_NAME)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Start preloading the default and chat models once the server starts. Loading runs in
+    background threads, so requests are accepted right away; `/ready` reports progress.
+    """
+    default_model = os.getenv("DEFAULT_GENERATOR", "")
+    chat_model = os.getenv("CHAT_GENERATOR", None)
+
+    if default_model:
+        logger.info(f"Preloading default model: {default_model}")
+    if chat_model:
+        logger.info(f"Preloading chat model: {chat_model}")
+
+    GeneratorManager().preload(default_model, chat_model)
+    yield
+
+
+async def lease_generators(request: Request, call_next):
+    """
+    Middleware that keeps the generators a request gets resident until its handler returns.
+    Streamed generations are submitted before that, and their executor then keeps them resident.
+    """
+    with GeneratorManager().leases():
+        return await call_next(request)
+
+
 def create_app() -> FastAPI:
     # Initialize app
     app = FastAPI(
         title="MAI Copilot API",
         description="OpenAI-like API for code completions, chat, and embeddings.",
         version="0.0.2",
+        lifespan=lifespan,
     )
     app.add_middleware(CORSMiddleware)
+    app.middleware("http")(schedule_request)
+    app.middleware("http")(lease_generators)
 
     # Register routes
     app.include_router(completions_router, prefix="/v1")
     app.include_router(chat_router, prefix="/v1")
     app.include_router(embeddings_router, prefix="/v1")
     app.include_router(models_router, prefix="/v1")
+    app.include_router(stats_router, prefix="/v1")
+    app.include_router(vectors_router, prefix="/v1")
     # Even legacy endpoint(s)
     app.include_router(legacy_router)
+    app.include_router(health_router)
+    app.include_router(metrics_router)
 
     # Add redirection to Swagger UI
     @app.get("/", include_in_schema=False, response_class=RedirectResponse)
@@ -40,16 +80,4 @@ def create_app() -> FastAPI:
     generator_manager = GeneratorManager()
     generator_manager.register_all()
 
-    # Preload models based on environment variables
-    default_model = os.getenv("DEFAULT_GENERATOR", "")
-    chat_model = os.getenv("CHAT_GENERATOR", None)
-
-    if default_model:
-        logger.info(f"Preloading default model: {default_model}")
-    if chat_model:
-        logger.info(f"Preloading chat model: {chat_model}")
-
-    generator_manager.load_models(default_model, chat_model)
-    logger.info("All required models preloaded successfully.")
-
     return app
\ No newline at end of file
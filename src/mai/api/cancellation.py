@@ -0,0 +1,96 @@
+import asyncio
+from threading import Lock
+from typing import Callable, Dict, Optional
+from fastapi import Request
+from mai.inference.cancellation import CancellationToken
+from mai.inference.inference_executor import InferenceExecutor
+
+# Header that identifies one editor session across requests
+SESSION_HEADER = "X-Session-Id"
+
+# How often to check whether the client is still connected
+DISCONNECT_POLL_INTERVAL = 0.1
+
+
+class SessionRegistry:
+    """
+    Tracks the in-flight generation of each client session, so that a newer
+    request from the same session can cancel the one it replaces.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._active: Dict[str, CancellationToken] = {}
+
+    def start(self, session_id: Optional[str]) -> CancellationToken:
+        token = CancellationToken()
+        if not session_id:
+            return token
+        with self._lock:
+            previous = self._active.get(session_id)
+            self._active[session_id] = token
+        if previous is not None:
+            previous.cancel("superseded")
+        return token
+
+    def cancel(self, session_id: Optional[str], reason: str = "cancelled"):
+        """
+        Cancel the session's in-flight generation, if any.
+        """
+        if not session_id:
+            return
+        with self._lock:
+            token = self._active.get(session_id)
+        if token is not None:
+            token.cancel(reason)
+
+    def finish(self, session_id: Optional[str], token: CancellationToken):
+        if not session_id:
+            return
+        with self._lock:
+            if self._active.get(session_id) is token:
+                del self._active[session_id]
+
+
+session_registry = SessionRegistry()
+
+
+async def watch_disconnect(request: Request, token: CancellationToken):
+    """
+    Cancel the generation once the client goes away.
+    """
+    while not token.cancelled:
+        if await request.is_disconnected():
+            token.cancel("disconnected")
+            return
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+
+async def run_cancellable(
+        request: Request,
+        executor: InferenceExecutor,
+        fn: Callable,
+        prompt,
+        parameters: Dict,
+        session_id: Optional[str] = None,
+):
+    """
+    Run a generation that stops early when the client disconnects or, when a
+    session ID is given, when a newer request from the same session arrives.
+    Returns the generation result and its cancellation token.
+    """
+    token = session_registry.start(session_id)
+    try:
+        generation = executor.submit(fn, prompt, {**parameters, "cancellation_token": token})
+    except Exception:
+        session_registry.finish(session_id, token)
+        raise
+
+    watcher = asyncio.ensure_future(watch_disconnect(request, token))
+    try:
+        return await generation, token
+    finally:
+        watcher.cancel()
+        if not generation.done():
+            token.cancel("disconnected")
+        session_registry.finish(session_id, token)
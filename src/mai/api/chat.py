@@ -1,8 +1,13 @@
 from typing import Annotated
-from fastapi import APIRouter, Body, HTTPException
+from fastapi import APIRouter, Body, HTTPException, Request
 from mai.models.examples import CHAT_COMPLETION_REQUEST_EXAMPLE
 from mai.models.openai_models import ChatCompletionRequest, CompletionResponse, ChatMessage
 from mai.generators.generator_manager import GeneratorManager
+from mai.inference.inference_executor import InferenceDeadlineExceededError, InferenceQueueFullError
+from mai.inference.usage import TokenUsage
+from mai.api.streaming import stream_generation
+from mai.api.cancellation import run_cancellable
+from mai.api.scheduling import apply_body_schedule
 from mai.crosscutting.logging import get_logger
 import time
 
@@ -17,19 +22,40 @@ async def chat_completion(
         request: Annotated[
             ChatCompletionRequest,
             Body(examples=CHAT_COMPLETION_REQUEST_EXAMPLE),
-        ]):
+        ],
+        http_request: Request):
     """
     Generate chat-style completions.
     """
     try:
-        generator = generator_manager.get(request.model)
+        apply_body_schedule(request.priority, request.deadline_ms)
+        generator = await generator_manager.get_async(request.model)
+        executor = generator_manager.get_executor(request.model)
         prompt = "\n".join([f"{msg.role}: {msg.content}" for msg in request.messages])
-        
-        # Generate text using the chat prompt
-        generated_text = generator.generate(prompt, {
+        parameters = {
             "temperature": request.temperature or 0.7,
             "max_new_tokens": 512,  # Adjust as necessary
-        })
+        }
+
+        if request.stream:
+            created = int(time.time())
+            return stream_generation(executor, generator, prompt, parameters, lambda text, finish_reason: {
+                "id": f"chatcmpl-{created}",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": request.model,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": text} if text else {},
+                    "finish_reason": finish_reason,
+                }],
+            })
+
+        # Generate text using the chat prompt
+        usage = TokenUsage()
+        generated_text, cancellation = await run_cancellable(
+            http_request, executor, generator.generate, prompt, {**parameters, "usage": usage}
+        )
         
         return CompletionResponse(
             id=f"chatcmpl-{int(time.time())}",
@@ -39,14 +65,16 @@ async def chat_completion(
                 "text": generated_text,
                 "index": 0,
                 "logprobs": None,
-                "finish_reason": "stop"
+                "finish_reason": "cancelled" if cancellation.cancelled else "stop"
             }],
-            usage={
-                "prompt_tokens": len(prompt.split()),
-                "completion_tokens": len(generated_text.split()),
-                "total_tokens": len(prompt.split()) + len(generated_text.split())
-            },
+            usage=usage.to_dict(),
         )
+    except InferenceQueueFullError as e:
+        logger.warning(f"Rejecting chat completion: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except InferenceDeadlineExceededError as e:
+        logger.warning(f"Dropping chat completion: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Error generating chat completion: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -1,9 +1,16 @@
 import time
-from typing import Annotated
-from fastapi import APIRouter, Body, HTTPException
+from typing import Annotated, Optional
+from fastapi import APIRouter, Body, Header, HTTPException, Request
 from mai.models.examples import COMPLETION_REQUEST_EXAMPLE
 from mai.models.openai_models import CompletionRequest, CompletionResponse
 from mai.generators.generator_manager import GeneratorManager
+from mai.inference.inference_executor import InferenceDeadlineExceededError, InferenceQueueFullError
+from mai.inference.response_cache import normalize_parameters, response_cache
+from mai.inference.usage import TokenUsage
+from mai.api.streaming import stream_generation, stream_text
+from mai.api.debounce import session_debouncer
+from mai.api.cancellation import SESSION_HEADER, run_cancellable
+from mai.api.scheduling import apply_body_schedule
 from mai.crosscutting.logging import get_logger
 
 router = APIRouter()
@@ -16,24 +23,110 @@ async def generate_completion(
         request: Annotated[
             CompletionRequest,
             Body(examples=COMPLETION_REQUEST_EXAMPLE),
-        ]):
+        ],
+        http_request: Request,
+        session_id: Annotated[Optional[str], Header(alias=SESSION_HEADER)] = None):
     """
     Generate text/code completions.
+    A newer request with the same session header cancels this one while it is still running.
+    With debouncing enabled, requests from one session are also held briefly and dropped when
+    superseded, and a prompt that extends the previous completion reuses the rest of it.
+    Repeated deterministic requests are answered from the response cache when it is enabled.
+    With a `suffix`, models trained for it fill in the code between the prompt and the suffix.
+    Generation ends early at a `stop` string or, with `stop_at`, at the end of the line or block.
     """
     try:
-        generator = generator_manager.get(request.model)
-        generated_text = generator.generate(request.prompt, {
+        apply_body_schedule(request.priority, request.deadline_ms)
+        generator = await generator_manager.get_async(request.model)
+        executor = generator_manager.get_executor(request.model)
+        parameters = normalize_parameters({
             "max_new_tokens": request.max_tokens,
             "temperature": request.temperature,
             "top_p": request.top_p,
         })
-        return CompletionResponse(
-            id="cmpl-unique-id",
-            created=int(time.time()),
-            model=request.model,
-            choices=[{"text": generated_text, "index": 0, "logprobs": None, "finish_reason": "stop"}],
-            usage={"prompt_tokens": len(request.prompt.split()), "completion_tokens": len(generated_text.split())},
+        if request.prompt_lookup:
+            parameters["prompt_lookup"] = True
+        if request.echo and not request.stream:
+            parameters["echo"] = True
+        if request.suffix is not None:
+            if not generator.supports_fim:
+                raise HTTPException(status_code=400, detail=f"Model '{request.model}' does not support a suffix.")
+            parameters["suffix"] = request.suffix
+        if request.stop:
+            parameters["stop"] = [request.stop] if isinstance(request.stop, str) else list(request.stop)
+        if request.stop_at is not None:
+            parameters["stop_at"] = request.stop_at
+
+        created = int(time.time())
+
+        def make_chunk(text: str, finish_reason: Optional[str]) -> dict:
+            return {
+                "id": "cmpl-unique-id",
+                "object": "text_completion",
+                "created": created,
+                "model": request.model,
+                "choices": [{"text": text, "index": 0, "logprobs": None, "finish_reason": finish_reason}],
+            }
+
+        def make_response(text: str, finish_reason: str, usage: Optional[TokenUsage] = None) -> CompletionResponse:
+            # Answers that did not run the model, such as debounced or reused ones, use no tokens
+            return CompletionResponse(
+                id="cmpl-unique-id",
+                created=created,
+                model=request.model,
+                choices=[{"text": text, "index": 0, "logprobs": None, "finish_reason": finish_reason}],
+                usage=(usage or TokenUsage()).to_dict(),
+            )
+
+        cache_key = None
+        if not request.stream:
+            cache_key = response_cache.key(request.model, request.prompt, parameters, request.cache)
+        if cache_key is not None:
+            cached = response_cache.lookup(cache_key)
+            if cached is not None:
+                # The whole prompt was served from the cache
+                usage = TokenUsage.from_dict(cached.usage)
+                if usage is not None:
+                    usage.cached_tokens = usage.prompt_tokens
+                return make_response(cached.value, "stop", usage)
+
+        debounce = session_debouncer.enabled and bool(session_id)
+        if debounce:
+            key = session_debouncer.result_key(request.model, parameters)
+            reused_text = session_debouncer.reuse(session_id, key, request.prompt, streamed=request.stream)
+            if reused_text is not None:
+                return stream_text(reused_text, make_chunk, "stop") if request.stream else make_response(reused_text, "stop")
+            if not await session_debouncer.wait(session_id):
+                return stream_text("", make_chunk, "cancelled") if request.stream else make_response("", "cancelled")
+
+        if request.stream:
+            on_finish = None
+            if debounce:
+                on_finish = lambda text: session_debouncer.remember(session_id, key, request.prompt, text)
+            return stream_generation(
+                executor, generator, request.prompt, parameters, make_chunk, session_id=session_id, on_finish=on_finish
+            )
+
+        started = time.perf_counter()
+        usage = TokenUsage()
+        generated_text, cancellation = await run_cancellable(
+            http_request, executor, generator.generate, request.prompt, {**parameters, "usage": usage}, session_id=session_id
         )
+        if cancellation.cancelled:
+            return make_response(generated_text, "cancelled", usage)
+        if cache_key is not None:
+            response_cache.put(cache_key, generated_text, time.perf_counter() - started, usage.to_dict())
+        if debounce:
+            session_debouncer.remember(session_id, key, request.prompt, generated_text, echoed=bool(parameters.get("echo")))
+        return make_response(generated_text, "stop", usage)
+    except HTTPException:
+        raise
+    except InferenceQueueFullError as e:
+        logger.warning(f"Rejecting completion: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except InferenceDeadlineExceededError as e:
+        logger.warning(f"Dropping completion: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Error generating completion: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -0,0 +1,116 @@
+import asyncio
+import os
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional, Tuple
+from mai.api.cancellation import session_registry
+
+# Sessions whose last completion is kept for reuse
+MAX_REMEMBERED_SESSIONS = 1024
+
+
+class SessionResult:
+    """
+    Finished completion of a session: the prompt, the text it continued with,
+    and whether the response echoed the prompt before it.
+    """
+    __slots__ = ("key", "prompt", "continuation", "echoes_prompt")
+
+    def __init__(self, key: Tuple, prompt: str, continuation: str, echoes_prompt: bool):
+        self.key = key
+        self.prompt = prompt
+        self.continuation = continuation
+        self.echoes_prompt = echoes_prompt
+
+
+class SessionDebouncer:
+    """
+    Debounces completion requests from one client session.
+
+    Editors send a request on nearly every keystroke. A request first waits
+    `window_ms`; if a newer request from the same session arrives in the meantime
+    it is dropped without running the model, and a newer request also cancels the
+    generation it replaces. When the new prompt merely extends the previous prompt
+    with the start of its completion (the user typed what was suggested), the rest
+    of that completion is returned without running the model at all.
+    """
+
+    def __init__(self, window_ms: float = 0, max_sessions: int = MAX_REMEMBERED_SESSIONS):
+        self.window_ms = window_ms
+        self.max_sessions = max_sessions
+        self._lock = Lock()
+        self._latest: Dict[str, int] = {}
+        self._results: "OrderedDict[str, SessionResult]" = OrderedDict()
+        self.dropped = 0
+        self.reused = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_ms > 0
+
+    @staticmethod
+    def result_key(model: str, parameters: Dict) -> Tuple:
+        return (model,) + tuple(sorted((name, repr(value)) for name, value in parameters.items()))
+
+    def reuse(self, session_id: str, key: Tuple, prompt: str, streamed: bool = False) -> Optional[str]:
+        """
+        Return the generated text for `prompt` taken from the session's previous
+        completion, or None when it cannot answer this prompt. Streamed responses
+        never repeat the prompt.
+        """
+        with self._lock:
+            result = self._results.get(session_id)
+            if result is None or result.key != key or not prompt.startswith(result.prompt):
+                return None
+            typed = prompt[len(result.prompt):]
+            if not result.continuation.startswith(typed):
+                return None
+            remainder = result.continuation[len(typed):]
+            if not remainder.strip():
+                return None
+            self.reused += 1
+
+        # A newer request still supersedes anything running for the session
+        session_registry.finish(session_id, session_registry.start(session_id))
+        return prompt + remainder if result.echoes_prompt and not streamed else remainder
+
+    async def wait(self, session_id: str) -> bool:
+        """
+        Wait out the debounce window. Returns False when a newer request from the
+        same session arrived in the meantime, so this one should be dropped.
+        """
+        with self._lock:
+            sequence = self._latest.get(session_id, 0) + 1
+            self._latest[session_id] = sequence
+        session_registry.cancel(session_id, "superseded")
+
+        await asyncio.sleep(self.window_ms / 1000)
+        with self._lock:
+            if self._latest.get(session_id) != sequence:
+                self.dropped += 1
+                return False
+            del self._latest[session_id]
+            return True
+
+    def remember(self, session_id: str, key: Tuple, prompt: str, generated_text: str, echoed: bool = False):
+        """
+        Keep a finished completion, streamed or not, so a follow-up prompt that extends it can reuse it.
+        `echoed` tells that `generated_text` starts with the prompt because the request set `echo`.
+        """
+        continuation = generated_text[len(prompt):] if echoed else generated_text
+        with self._lock:
+            self._results[session_id] = SessionResult(key, prompt, continuation, echoed)
+            self._results.move_to_end(session_id)
+            while len(self._results) > self.max_sessions:
+                self._results.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "window_ms": self.window_ms,
+                "dropped_requests": self.dropped,
+                "reused_completions": self.reused,
+            }
+
+
+session_debouncer = SessionDebouncer(float(os.getenv("DEBOUNCE_MS", "0")))
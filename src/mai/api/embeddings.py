@@ -1,15 +1,35 @@
-from typing import Annotated
+from typing import TYPE_CHECKING, Annotated
+import base64
 from fastapi import APIRouter, Body, HTTPException
 from mai.models.examples import EMBEDDING_REQUEST_EXAMPLE
 from mai.models.openai_models import EmbeddingRequest, EmbeddingResponse
 from mai.generators.generator_manager import GeneratorManager
+from mai.inference.inference_executor import InferenceDeadlineExceededError, InferenceQueueFullError
 from mai.crosscutting.logging import get_logger
 
+if TYPE_CHECKING:
+    import torch
+
 router = APIRouter()
 logger = get_logger("embeddings")
 
 generator_manager = GeneratorManager()
 
+# Little-endian layouts for base64-encoded vectors
+EMBEDDING_DTYPES = {"float32": "<f4", "float16": "<f2"}
+
+
+def encode_embeddings(embeddings: "torch.Tensor", encoding_format: str, dtype: str):
+    """
+    Convert a 1-D or 2-D embedding tensor to float lists or base64-packed vectors.
+    """
+    values = embeddings.numpy().astype(EMBEDDING_DTYPES[dtype])
+    if encoding_format == "float":
+        return values.tolist()
+    if values.ndim == 1:
+        return base64.b64encode(values.tobytes()).decode("ascii")
+    return [base64.b64encode(vector.tobytes()).decode("ascii") for vector in values]
+
 
 @router.post("/embeddings", response_model=EmbeddingResponse)
 async def generate_embeddings(
@@ -18,17 +38,27 @@ async def generate_embeddings(
         Body(examples=EMBEDDING_REQUEST_EXAMPLE),
     ]):
     """
-    Generate embeddings for the provided input text.
+    Generate embeddings for the provided input text, token IDs, or a list of either.
+    Vectors can be returned as float16 and packed as base64 to shrink the response.
     """
     try:
-        generator = generator_manager.get(request.model)
-        embeddings = generator.generate_embeddings(request.input)  # Ensure the generator supports this
-        
+        generator = await generator_manager.get_async(request.model)
+        executor = generator_manager.get_executor(request.model)
+        embeddings = await executor.run(  # Ensure the generator supports this
+            generator.generate_embeddings, request.input, num_layers=request.layers, return_tensors=True
+        )
+
         return EmbeddingResponse(
             model=request.model,
-            embeddings=embeddings,
+            embeddings=encode_embeddings(embeddings, request.encoding_format, request.embedding_dtype),
             input=request.input
         )
+    except InferenceQueueFullError as e:
+        logger.warning(f"Rejecting embeddings: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except InferenceDeadlineExceededError as e:
+        logger.warning(f"Dropping embeddings: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Error generating embeddings: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
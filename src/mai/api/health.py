@@ -0,0 +1,23 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from mai.generators.generator_manager import GeneratorManager
+
+router = APIRouter()
+generator_manager = GeneratorManager()
+
+@router.get("/health")
+async def health():
+    """
+    Liveness check: the server is up and answering requests.
+    """
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+async def ready():
+    """
+    Readiness check: 200 once every preloaded model is loaded, 503 until then.
+    Reports the load status of each preloaded model.
+    """
+    readiness = generator_manager.readiness()
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
@@ -1,8 +1,12 @@
 from typing import Annotated
+import time
 import warnings
-from fastapi import APIRouter, Body, HTTPException
+from fastapi import APIRouter, Body, HTTPException, Request
 from mai.models.generate_request import GenerateRequest
 from mai.generators.generator_manager import GeneratorManager
+from mai.inference.inference_executor import InferenceDeadlineExceededError, InferenceQueueFullError
+from mai.inference.response_cache import normalize_parameters, response_cache
+from mai.api.cancellation import run_cancellable
 from mai.crosscutting.logging import get_logger
 
 router = APIRouter()
@@ -25,25 +29,41 @@ async def generate_code(
             ]
         )
     ],
+    http_request: Request,
 ):
     """
     Endpoint to generate code suggestions based on the input prompt.
+    Set `"cache": true` in the parameters to cache sampled results as well as deterministic ones.
     """
     warnings.warn(
         "This endpoint is deprecated and will be removed in a future release. Please migrate to /v1/completions.",
         DeprecationWarning,
     )
-    default_generator = generator_manager.get_default()
+    default_name = generator_manager.get_default_name()
+    default_generator = await generator_manager.get_async(default_name)
+    executor = generator_manager.get_executor(default_name)
 
     try:
         inputs = request.inputs
-        parameters = request.parameters
+        parameters = normalize_parameters(request.parameters)
+        opt_in = parameters.pop("cache", None)
+        # Only the generated text is returned unless the prompt is asked for, as `return_full_text` or `echo`
+        if parameters.pop("return_full_text", False):
+            parameters["echo"] = True
 
         logger.info(f"Received inputs: {inputs}")
         logger.info(f"Received parameters: {parameters}")
 
-        # Use the default generator
-        generated_text = default_generator.generate(inputs, parameters)
+        cache_key = response_cache.key(default_name, inputs, parameters, opt_in)
+        generated_text = response_cache.get(cache_key) if cache_key is not None else None
+        if generated_text is None:
+            # Use the default generator
+            started = time.perf_counter()
+            generated_text, cancellation = await run_cancellable(
+                http_request, executor, default_generator.generate, inputs, parameters
+            )
+            if cache_key is not None and not cancellation.cancelled:
+                response_cache.put(cache_key, generated_text, time.perf_counter() - started)
 
         logger.info(f"Generated code: {generated_text}")
 
@@ -53,6 +73,12 @@ async def generate_code(
             "status": 200
         }
 
+    except InferenceQueueFullError as e:
+        logger.warning(f"Rejecting generation: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except InferenceDeadlineExceededError as e:
+        logger.warning(f"Dropping generation: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Error during generation: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -0,0 +1,16 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+from mai.crosscutting.metrics import CONTENT_TYPE, metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+def prometheus_metrics():
+    """
+    Serving metrics in the Prometheus text format: latency histograms per model and stage,
+    time to first token, time per output token, throughput, batch sizes, model load times,
+    queue lengths and resident memory.
+    """
+    # A plain function runs in the thread pool, so collecting from model workers does not block the event loop
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
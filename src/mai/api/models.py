@@ -7,10 +7,19 @@ generator_manager = GeneratorManager()
 @router.get("/models")
 async def list_models():
     """
-    List all available models.
+    List all available models with their residency: whether each is loaded, pinned,
+    how much memory it holds, and the memory budget shared by all loaded models and
+    the estimated size of the models being loaded.
     """
     models = [
-        {"id": name, "object": "model"}
-        for name in generator_manager.generators.keys()
+        {"id": name, "object": "model", **residency}
+        for name, residency in generator_manager.residency().items()
     ]
-    return {"data": models}
+    return {
+        "data": models,
+        "memory": {
+            "budget_bytes": generator_manager.memory_budget,
+            "resident_bytes": generator_manager.resident_bytes(),
+            "reserved_bytes": generator_manager.reserved_bytes(),
+        },
+    }
@@ -0,0 +1,116 @@
+import gc
+import os
+import shutil
+import signal
+import socket
+import tempfile
+from typing import Dict, Optional
+
+import torch
+import uvicorn
+
+from mai.api import create_app
+from mai.generators.generator_manager import GeneratorManager
+from mai.crosscutting.logging import get_logger
+from mai.crosscutting.metrics import metrics
+
+logger = get_logger("prefork")
+
+
+def threads_per_worker(workers: int, threads: Optional[int] = None) -> int:
+    """
+    Torch intra-op threads for each worker: an even share of the available cores unless set explicitly.
+    """
+    if threads:
+        return threads
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    return max(1, cores // workers)
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    """
+    Listening socket shared by every worker, so the kernel spreads connections across them.
+    """
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def serve_prefork(host: str, port: int, workers: int, threads: Optional[int] = None):
+    """
+    Serve the API from several worker processes that share one copy of the model weights.
+
+    The parent process builds the app and loads the default and chat models, then forks the
+    workers. Forked workers share the parent's memory copy-on-write, and inference only reads
+    the weights, so each model stays in memory once however many workers serve it. Workers
+    accept connections from one shared socket and split the cores between their torch thread
+    pools. A worker that dies is replaced by a fresh fork of the parent. Workers share their
+    metrics through a temporary directory, so `/metrics` reports all of them whichever one
+    answers the scrape. Persistent embedding collections are refused, since every worker
+    would write the same files.
+    """
+    if os.getenv("VECTOR_STORE_DIR") and workers > 1:
+        raise ValueError("VECTOR_STORE_DIR cannot be used with several workers: each would write the same collection files.")
+    app = create_app()
+    generator_manager = GeneratorManager()
+    generator_manager.load_models(os.getenv("DEFAULT_GENERATOR", ""), os.getenv("CHAT_GENERATOR", None))
+
+    sock = bind_socket(host, port)
+    threads = threads_per_worker(workers, threads)
+    logger.info(f"Serving on {host}:{port} with {workers} workers of {threads} torch threads each.")
+
+    # Keep the garbage collector from writing to the loaded objects, which would copy their pages into every worker
+    gc.collect()
+    gc.freeze()
+
+    # The parent's metrics, such as its model load times, are published once; workers start from zero
+    metrics_directory = tempfile.mkdtemp(prefix="mai-metrics-")
+    metrics.publish(metrics_directory, retired=True)
+
+    children: Dict[int, int] = {}
+    stopping = False
+
+    def spawn(worker_id: int):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            torch.set_num_threads(threads)
+            os.environ["MAI_PROCESS_NAME"] = f"api-{worker_id}"
+            metrics.clear()
+            metrics.share(metrics_directory)
+            config = uvicorn.Config(app, host=host, port=port, log_level="info")
+            try:
+                uvicorn.Server(config).run(sockets=[sock])
+            finally:
+                os._exit(0)
+        children[pid] = worker_id
+        logger.info(f"Started worker {worker_id} (pid {pid}).")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for worker_id in range(workers):
+        spawn(worker_id)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        worker_id = children.pop(pid, None)
+        metrics.retire(metrics_directory, pid)
+        if worker_id is not None and not stopping:
+            logger.warning(f"Worker {worker_id} (pid {pid}) exited with status {status}; starting a replacement.")
+            spawn(worker_id)
+    sock.close()
+    shutil.rmtree(metrics_directory, ignore_errors=True)
@@ -0,0 +1,64 @@
+from typing import Optional
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from mai.inference.scheduling import RequestSchedule, current_schedule, set_schedule
+
+# Headers that set a request's priority class and how many milliseconds after arrival it is still worth running
+PRIORITY_HEADER = "X-Priority"
+DEADLINE_HEADER = "X-Deadline-Ms"
+# Headers that identify the tenant a request's fair share is counted against
+API_KEY_HEADER = "X-API-Key"
+
+# Priority of requests that name none: editors wait on completions, while scripts and indexing jobs can wait
+DEFAULT_PRIORITIES = {
+    "/v1/completions": "interactive",
+    "/v1/chat/completions": "interactive",
+    "/api/generate/": "bulk",
+    "/v1/embeddings": "bulk",
+}
+# Adding vectors to collections is indexing work
+BULK_PATH_PREFIX = "/v1/embeddings/collections/"
+
+
+def default_priority(path: str) -> str:
+    if path in DEFAULT_PRIORITIES:
+        return DEFAULT_PRIORITIES[path]
+    return "bulk" if path.startswith(BULK_PATH_PREFIX) else "normal"
+
+
+def request_tenant(request: Request) -> Optional[str]:
+    """
+    The API key of a request, from `X-API-Key` or an `Authorization: Bearer` header.
+    """
+    api_key = request.headers.get(API_KEY_HEADER)
+    if api_key:
+        return api_key
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer":
+        return None
+    return credentials.strip() or None
+
+
+async def schedule_request(request: Request, call_next):
+    """
+    Middleware that schedules the inference work of each request by its priority and
+    deadline headers and its API key.
+    """
+    try:
+        schedule = RequestSchedule(
+            request.headers.get(PRIORITY_HEADER, default_priority(request.url.path)).lower(),
+            tenant=request_tenant(request),
+        )
+        deadline_ms = request.headers.get(DEADLINE_HEADER)
+        schedule = schedule.with_deadline_ms(float(deadline_ms) if deadline_ms else None)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
+    set_schedule(schedule)
+    return await call_next(request)
+
+
+def apply_body_schedule(priority: Optional[str], deadline_ms: Optional[float]):
+    """
+    Let `priority` and `deadline_ms` fields of a request body override its headers.
+    """
+    set_schedule(current_schedule().with_priority(priority).with_deadline_ms(deadline_ms))
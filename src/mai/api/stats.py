@@ -0,0 +1,22 @@
+from fastapi import APIRouter
+from mai.generators.generator_manager import GeneratorManager
+from mai.inference.cancellation import cancellation_stats
+from mai.inference.response_cache import response_cache
+from mai.api.debounce import session_debouncer
+
+router = APIRouter()
+generator_manager = GeneratorManager()
+
+@router.get("/stats")
+async def serving_stats():
+    """
+    Report serving statistics, such as queue depth and prefix cache usage per model,
+    and the generations cancelled because their client went away or moved on,
+    the session requests dropped or answered by debouncing, and response cache hits.
+    """
+    return {
+        "models": generator_manager.stats(),
+        "cancellation": cancellation_stats.stats(),
+        "debounce": session_debouncer.stats(),
+        "response_cache": response_cache.stats(),
+    }
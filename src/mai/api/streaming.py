@@ -0,0 +1,89 @@
+import asyncio
+import json
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+from fastapi.responses import StreamingResponse
+from mai.inference.inference_executor import InferenceExecutor
+from mai.api.cancellation import session_registry
+from mai.crosscutting.logging import get_logger
+
+if TYPE_CHECKING:
+    from mai.generators.generator_base import GeneratorBase
+
+logger = get_logger("streaming")
+
+
+def sse_event(payload: Dict) -> str:
+    """
+    Format a payload as a server-sent event.
+    """
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+def stream_text(text: str, make_chunk: Callable[[str, Optional[str]], Dict], finish_reason: str) -> StreamingResponse:
+    """
+    Return already known text as a complete server-sent event stream.
+    """
+    async def events():
+        if text:
+            yield sse_event(make_chunk(text, None))
+        yield sse_event(make_chunk("", finish_reason))
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def stream_generation(
+        executor: InferenceExecutor,
+        generator: "GeneratorBase",
+        prompt: str,
+        parameters: Dict,
+        make_chunk: Callable[[str, Optional[str]], Dict],
+        session_id: Optional[str] = None,
+        on_finish: Optional[Callable[[str], None]] = None,
+) -> StreamingResponse:
+    """
+    Start a streamed generation and return it as OpenAI-style server-sent events.
+
+    `make_chunk(text, finish_reason)` builds the payload for each event. The request
+    is submitted before the response starts, so a full queue still fails fast.
+    Generation is cancelled when the client stops reading the stream, or when a
+    newer request arrives for the same session. `on_finish` is called with the whole
+    streamed text once a generation finishes without being cancelled.
+    """
+    # Imported here so that importing the API does not pull in transformers
+    from mai.inference.streaming import AsyncTextStreamer
+
+    streamer = AsyncTextStreamer(generator.tokenizer, asyncio.get_running_loop())
+    token = session_registry.start(session_id)
+    try:
+        generation = executor.submit(generator.generate, prompt, {
+            **parameters, "streamer": streamer, "cancellation_token": token,
+        })
+    except Exception:
+        session_registry.finish(session_id, token)
+        raise
+    # Unblock the stream even if generation fails before the streamer is ended
+    generation.add_done_callback(lambda _: streamer.close())
+
+    async def events():
+        try:
+            chunks = []
+            async for text in streamer:
+                chunks.append(text)
+                yield sse_event(make_chunk(text, None))
+            try:
+                await generation
+                finish_reason = "cancelled" if token.cancelled else "stop"
+            except Exception as e:
+                logger.error(f"Error during streamed generation: {e}")
+                finish_reason = "error"
+            if finish_reason == "stop" and on_finish is not None:
+                on_finish("".join(chunks))
+            yield sse_event(make_chunk("", finish_reason))
+            yield "data: [DONE]\n\n"
+        finally:
+            if not generation.done():
+                token.cancel("disconnected")
+            session_registry.finish(session_id, token)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -0,0 +1,147 @@
+import asyncio
+from typing import Optional
+import numpy as np
+from fastapi import APIRouter, HTTPException
+from mai.models.vector_models import (
+    CollectionDeleteRequest,
+    CollectionIndexRequest,
+    CollectionUpsertRequest,
+    EmbeddingSearchRequest,
+    EmbeddingSearchResponse,
+)
+from mai.generators.generator_manager import GeneratorManager
+from mai.inference.inference_executor import InferenceDeadlineExceededError, InferenceQueueFullError
+from mai.inference.vector_store import vector_store
+from mai.crosscutting.logging import get_logger
+
+router = APIRouter()
+logger = get_logger("vectors")
+
+generator_manager = GeneratorManager()
+
+
+async def embed(model: str, inputs, layers: Optional[int]) -> np.ndarray:
+    """
+    Embed a list of inputs on the model's executor and return a 2-D array.
+    """
+    generator = await generator_manager.get_async(model)
+    executor = generator_manager.get_executor(model)
+    embeddings = await executor.run(generator.generate_embeddings, inputs, num_layers=layers, return_tensors=True)
+    return embeddings.numpy().reshape(-1, embeddings.shape[-1])
+
+
+def handle_error(e: Exception, action: str):
+    if isinstance(e, HTTPException):
+        raise e
+    if isinstance(e, KeyError):
+        raise HTTPException(status_code=404, detail=e.args[0])
+    if isinstance(e, ValueError):
+        raise HTTPException(status_code=400, detail=str(e))
+    if isinstance(e, InferenceQueueFullError):
+        logger.warning(f"Rejecting {action}: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    if isinstance(e, InferenceDeadlineExceededError):
+        logger.warning(f"Dropping {action}: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
+    logger.error(f"Error during {action}: {e}")
+    raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+@router.get("/embeddings/collections")
+async def list_collections():
+    """
+    List vector collections.
+    """
+    return {"data": [collection.describe() for collection in vector_store.collections.values()]}
+
+
+@router.get("/embeddings/collections/{name}")
+async def describe_collection(name: str):
+    try:
+        return vector_store.get(name).describe()
+    except Exception as e:
+        handle_error(e, "collection lookup")
+
+
+@router.post("/embeddings/collections/{name}")
+async def upsert_vectors(name: str, request: CollectionUpsertRequest):
+    """
+    Embed `input` with `model`, or take precomputed `embeddings`, and upsert them by ID.
+    The collection is created on first use and remembers the model for text queries.
+    """
+    try:
+        if (request.input is None) == (request.embeddings is None):
+            raise ValueError("Provide exactly one of 'input' or 'embeddings'")
+        if request.input is not None:
+            if request.model is None:
+                raise ValueError("'model' is required to embed 'input'")
+            vectors = await embed(request.model, request.input, request.layers)
+        else:
+            vectors = np.asarray(request.embeddings, dtype=np.float32)
+        if len(vectors) != len(request.ids):
+            raise ValueError(f"Got {len(request.ids)} IDs for {len(vectors)} vectors")
+
+        collection = vector_store.get_or_create(name, vectors.shape[-1], model=request.model, layers=request.layers)
+        await asyncio.to_thread(collection.upsert, request.ids, vectors, request.metadata)
+        return collection.describe()
+    except Exception as e:
+        handle_error(e, "vector upsert")
+
+
+@router.post("/embeddings/collections/{name}/delete")
+async def delete_vectors(name: str, request: CollectionDeleteRequest):
+    try:
+        collection = vector_store.get(name)
+        deleted = await asyncio.to_thread(collection.delete, request.ids)
+        return {"deleted": deleted, **collection.describe()}
+    except Exception as e:
+        handle_error(e, "vector delete")
+
+
+@router.post("/embeddings/collections/{name}/index")
+async def index_collection(name: str, request: CollectionIndexRequest):
+    """
+    Build an IVF index for approximate search, or drop it with `n_lists` 0.
+    """
+    try:
+        collection = vector_store.get(name)
+        if request.n_lists > 0:
+            await asyncio.to_thread(collection.build_index, request.n_lists, request.n_probe)
+        else:
+            await asyncio.to_thread(collection.drop_index)
+        return collection.describe()
+    except Exception as e:
+        handle_error(e, "index build")
+
+
+@router.delete("/embeddings/collections/{name}")
+async def drop_collection(name: str):
+    try:
+        vector_store.drop(name)
+        return {"name": name, "deleted": True}
+    except Exception as e:
+        handle_error(e, "collection drop")
+
+
+@router.post("/embeddings/search", response_model=EmbeddingSearchResponse)
+async def search(request: EmbeddingSearchRequest):
+    """
+    Cosine top-k search of a collection for one or more queries.
+    """
+    try:
+        collection = vector_store.get(request.collection)
+        if (request.input is None) == (request.embeddings is None):
+            raise ValueError("Provide exactly one of 'input' or 'embeddings'")
+        if request.input is not None:
+            if collection.model is None:
+                raise ValueError(f"Collection '{collection.name}' has no model to embed text queries; pass 'embeddings'")
+            queries = await embed(collection.model, request.input, collection.layers)
+        else:
+            queries = np.asarray(request.embeddings, dtype=np.float32)
+
+        results = await asyncio.to_thread(
+            collection.search, queries, request.top_k, exact=request.exact, n_probe=request.n_probe
+        )
+        return EmbeddingSearchResponse(collection=collection.name, results=results)
+    except Exception as e:
+        handle_error(e, "vector search")
@@ -0,0 +1,394 @@
+import bisect
+import os
+import pickle
+import time
+from contextlib import contextmanager
+from threading import Lock, Thread
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Histogram bucket upper bounds, from a fast tokenizer call to a slow model load
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.04, 0.08, 0.16, 0.32, 0.64, 1.28, 2.56)
+THROUGHPUT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+# Media type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# How often processes sharing their metrics publish them for the others to merge
+SHARE_INTERVAL_SECONDS = 1.0
+# State files of processes that exited, which keep their counters and histograms but not their gauges
+RETIRED_PREFIX = "retired-"
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """
+    A named family of samples, one per combination of label values. Thread-safe.
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def state(self) -> Dict[Tuple[str, ...], object]:
+        with self._lock:
+            return {key: self._copy(value) for key, value in self._values.items()}
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def merge(self, state: Dict[Tuple[str, ...], object], into: Dict[Tuple[str, ...], object]):
+        into.update(state)
+
+    def lines(self, state: Dict[Tuple[str, ...], object]) -> List[str]:
+        return [f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}" for key, value in state.items()]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def merge(self, state, into):
+        for key, value in state.items():
+            into[key] = into.get(key, 0.0) + value
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down, usually set by a collector right before each scrape.
+    `aggregate` combines the values other processes report for the same labels: "sum",
+    "max", or "last" to keep the last one merged.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), aggregate: str = "last"):
+        super().__init__(name, documentation, labelnames)
+        if aggregate not in ("sum", "max", "last"):
+            raise ValueError(f"Unknown gauge aggregation '{aggregate}'.")
+        self.aggregate = aggregate
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def merge(self, state, into):
+        for key, value in state.items():
+            if key in into and self.aggregate == "sum":
+                into[key] += value
+            elif key in into and self.aggregate == "max":
+                into[key] = max(into[key], value)
+            else:
+                into[key] = value
+
+
+class Histogram(Metric):
+    """
+    Counts observations into cumulative buckets and keeps their sum and count.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket plus the +Inf bucket, then the sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    @staticmethod
+    def _copy(value):
+        return list(value)
+
+    def merge(self, state, into):
+        for key, counts in state.items():
+            if key in into:
+                into[key] = [a + b for a, b in zip(into[key], counts)]
+            else:
+                into[key] = list(counts)
+
+    def lines(self, state) -> List[str]:
+        lines = []
+        for key, counts in state.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Process-wide metrics rendered in the Prometheus text format.
+
+    Collectors run right before each scrape to set gauges from current state, and
+    sources return snapshots from other processes, such as model worker processes,
+    that are merged into the output. Processes serving the same port can also share
+    their metrics through a directory, so that any one of them reports them all.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._sources: List[Callable[[], Iterable[Dict]]] = []
+        self._lock = Lock()
+        self._shared_directory: Optional[str] = None
+
+    def _add(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), aggregate: str = "last") -> Gauge:
+        return self._add(Gauge(name, documentation, labelnames, aggregate))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], None]):
+        self._collectors.append(collector)
+
+    def add_source(self, source: Callable[[], Iterable[Dict]]):
+        self._sources.append(source)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """
+        Current state of every metric after running the collectors, as plain picklable data.
+        """
+        with self._lock:
+            for collector in self._collectors:
+                collector()
+            return {name: metric.state() for name, metric in self._metrics.items()}
+
+    def clear(self):
+        """
+        Drop every sample, such as those a forked process inherited from its parent.
+        """
+        for metric in self._metrics.values():
+            metric.clear()
+
+    def share(self, directory: str):
+        """
+        Publish this process's metrics to `directory` every `SHARE_INTERVAL_SECONDS` and merge
+        those the other processes published there into every render.
+        """
+        self._shared_directory = directory
+
+        def publish_periodically():
+            while True:
+                try:
+                    self.publish(directory)
+                except OSError:
+                    # The directory is removed once the server stops
+                    return
+                time.sleep(SHARE_INTERVAL_SECONDS)
+
+        Thread(target=publish_periodically, name="metrics-publisher", daemon=True).start()
+
+    def publish(self, directory: str, retired: bool = False, states: Optional[Dict[str, Dict]] = None):
+        """
+        Write this process's metrics to `directory`, replacing those it published before.
+        A retired process's gauges are left out of the merge.
+        """
+        states = self.snapshot() if states is None else states
+        path = os.path.join(directory, f"{RETIRED_PREFIX if retired else ''}{os.getpid()}.pkl")
+        with open(path + ".tmp", "wb") as file:
+            pickle.dump(states, file)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def retire(directory: str, pid: int):
+        """
+        Keep the counters and histograms of a process that exited, but not its gauges.
+        """
+        path = os.path.join(directory, f"{pid}.pkl")
+        if os.path.exists(path):
+            os.replace(path, os.path.join(directory, f"{RETIRED_PREFIX}{pid}.pkl"))
+
+    def _shared_snapshots(self) -> List[Dict[str, Dict]]:
+        snapshots = []
+        for entry in os.scandir(self._shared_directory):
+            if not entry.name.endswith(".pkl") or entry.name == f"{os.getpid()}.pkl":
+                continue
+            try:
+                with open(entry.path, "rb") as file:
+                    snapshot = pickle.load(file)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                continue
+            if entry.name.startswith(RETIRED_PREFIX):
+                snapshot = {name: state for name, state in snapshot.items() if not isinstance(self._metrics.get(name), Gauge)}
+            snapshots.append(snapshot)
+        return snapshots
+
+    def select(self, snapshot: Dict[str, Dict], label: str, value: str) -> Dict[str, Dict]:
+        """
+        The samples of a snapshot whose `label` is `value`, plus those of metrics without that label.
+        """
+        selected = {}
+        for name, state in snapshot.items():
+            metric = self._metrics.get(name)
+            if metric is None or label not in metric.labelnames:
+                selected[name] = state
+                continue
+            position = metric.labelnames.index(label)
+            selected[name] = {key: sample for key, sample in state.items() if key[position] == value}
+        return selected
+
+    def render(self) -> str:
+        """
+        All metrics, including those of other processes, in the Prometheus text format.
+        """
+        states = self.snapshot()
+        snapshots = [snapshot for source in self._sources for snapshot in source()]
+        if self._shared_directory is not None:
+            self.publish(self._shared_directory, states=states)
+            snapshots.extend(self._shared_snapshots())
+        for snapshot in snapshots:
+            for name, state in snapshot.items():
+                if name in self._metrics:
+                    self._metrics[name].merge(state, states[name])
+
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.lines(states[name]))
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+QUEUE_WAIT_SECONDS = metrics.histogram(
+    "mai_queue_wait_seconds", "Time requests waited in a model's inference queue.", ["model", "priority"]
+)
+STAGE_SECONDS = metrics.histogram(
+    "mai_stage_seconds",
+    "Time spent per request in each stage: get (looking up and possibly loading the generator), "
+    "tokenize, prefill (up to the first token), decode (after the first token) and detokenize.",
+    ["model", "stage"],
+)
+TIME_TO_FIRST_TOKEN_SECONDS = metrics.histogram(
+    "mai_time_to_first_token_seconds", "Time from the start of generation to the first new token.", ["model"]
+)
+TIME_PER_OUTPUT_TOKEN_SECONDS = metrics.histogram(
+    "mai_time_per_output_token_seconds", "Mean time per new token after the first.", ["model"], TOKEN_LATENCY_BUCKETS
+)
+TOKENS_PER_SECOND = metrics.histogram(
+    "mai_generation_tokens_per_second", "New tokens per second of each generation.", ["model"], THROUGHPUT_BUCKETS
+)
+BATCH_SIZE = metrics.histogram(
+    "mai_batch_size", "Sequences per batched generate call or continuous batching decode step.", ["model", "mode"], BATCH_SIZE_BUCKETS
+)
+MODEL_LOAD_SECONDS = metrics.histogram("mai_model_load_seconds", "Time to load a model.", ["model"])
+GENERATIONS = metrics.counter("mai_generations_total", "Completed generations.", ["model"])
+GENERATED_TOKENS = metrics.counter("mai_generated_tokens_total", "New tokens generated.", ["model"])
+# Models preloaded before forking are shared by the API workers, so their size is not summed
+MODEL_LOADED = metrics.gauge("mai_model_loaded", "Whether a model is loaded.", ["model"], aggregate="max")
+MODEL_RESIDENT_BYTES = metrics.gauge("mai_model_resident_bytes", "Bytes held by a loaded model's weights.", ["model"], aggregate="max")
+QUEUE_LENGTH = metrics.gauge("mai_queue_length", "Requests waiting in a model's inference queue.", ["model", "priority"], aggregate="sum")
+REQUESTS_RUNNING = metrics.gauge("mai_requests_running", "Requests running on a model.", ["model", "priority"], aggregate="sum")
+PROCESS_RESIDENT_BYTES = metrics.gauge("mai_process_resident_memory_bytes", "Resident memory of a server process.", ["process"])
+
+def collect_process_memory():
+    # Model worker and API worker processes name themselves through MAI_PROCESS_NAME
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return
+    PROCESS_RESIDENT_BYTES.set(resident_pages * os.sysconf("SC_PAGE_SIZE"), process=os.getenv("MAI_PROCESS_NAME", "api"))
+
+
+metrics.add_collector(collect_process_memory)
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels):
+    """
+    Observe how long the block takes.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started, **labels)
+
+
+class GenerationTiming:
+    """
+    When one generation started and produced its first new token.
+    """
+    __slots__ = ("started", "first_token_at")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+
+    def first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+
+def record_generation(model: str, timing: GenerationTiming, new_tokens: int):
+    """
+    Record the latency breakdown and throughput of a finished generation.
+    """
+    finished = time.perf_counter()
+    if new_tokens <= 0 or timing.first_token_at is None:
+        return
+    time_to_first_token = timing.first_token_at - timing.started
+    decode_seconds = finished - timing.first_token_at
+    TIME_TO_FIRST_TOKEN_SECONDS.observe(time_to_first_token, model=model)
+    STAGE_SECONDS.observe(time_to_first_token, model=model, stage="prefill")
+    STAGE_SECONDS.observe(decode_seconds, model=model, stage="decode")
+    if new_tokens > 1:
+        TIME_PER_OUTPUT_TOKEN_SECONDS.observe(decode_seconds / (new_tokens - 1), model=model)
+    if finished > timing.started:
+        TOKENS_PER_SECOND.observe(new_tokens / (finished - timing.started), model=model)
+    GENERATIONS.inc(model=model)
+    GENERATED_TOKENS.inc(new_tokens, model=model)
@@ -1,3 +1,5 @@
+from typing import List, Optional, Union
+import copy
 import torch
 from mai.generators.generator_base import GeneratorBase
 from transformers import AutoModelForCausalLM, AutoTokenizer
@@ -5,12 +7,21 @@ from mai.crosscutting.logging import get_logger
 
 logger = get_logger()
 
+# A string, a list of token IDs, or a list of either
+EmbeddingInput = Union[str, List[int], List[str], List[List[int]]]
+
+# Inputs embedded together in one forward pass
+EMBEDDING_BATCH_SIZE = 16
+
 class DeepSeekCoderGenerator(GeneratorBase):
+    fim_tokens = ("<｜fim▁begin｜>", "<｜fim▁hole｜>", "<｜fim▁end｜>")
+
     def __init__(self, pretrained: str = "deepseek-ai/DeepSeek-Coder-V2-Base", device: str = "cpu"):
         """
         Generator for DeepSeek-Coder.
         """
         super().__init__(pretrained=pretrained, device=device)
+        self._truncated_encoders = {}
 
     @property
     def unsupported_parameters(self) -> set:
@@ -25,8 +36,11 @@ class DeepSeekCoderGenerator(GeneratorBase):
         """
         try:
             self.tokenizer = AutoTokenizer.from_pretrained(self.pretrained, trust_remote_code=True)
-            self.model = AutoModelForCausalLM.from_pretrained(self.pretrained, trust_remote_code=True)
+            self.model = AutoModelForCausalLM.from_pretrained(
+                self.pretrained, trust_remote_code=True, torch_dtype=self.load_dtype()
+            )
             self.model.to(self.device)
+            self._truncated_encoders = {}
 
             # Ensure a pad token is set
             self.default_parameters["pad_token_id"] = self.tokenizer.pad_token_id or self.tokenizer.eos_token_id
@@ -42,20 +56,92 @@ class DeepSeekCoderGenerator(GeneratorBase):
             logger.error(f"Failed to load DeepSeek-Coder Generator: {e}")
             raise RuntimeError("Failed to initialize DeepSeek-Coder Generator.")
 
-    def generate_embeddings(self, inputs: str) -> list:
+    def unload(self):
         """
-        Generate embeddings for the given input using the model.
+        Release the model, including the truncated encoders that share its weights.
+        """
+        self._truncated_encoders = {}
+        super().unload()
+
+    def generate_embeddings(
+            self,
+            inputs: EmbeddingInput,
+            batch_size: int = EMBEDDING_BATCH_SIZE,
+            num_layers: Optional[int] = None,
+            return_tensors: bool = False,
+    ):
+        """
+        Generate embeddings for one input or a list of inputs. Each input is a string or a
+        list of token IDs. A single input returns one vector, a list returns one vector per item,
+        as Python lists or, with `return_tensors`, as a 1-D or 2-D float tensor.
+
+        Only the base transformer runs, without the LM head. Inputs are sorted by length and run
+        in padded micro-batches of `batch_size`, and the last hidden state is mean-pooled over
+        each input's real tokens. `num_layers` stops after the first N transformer layers.
         """
         try:
-            # Tokenize the input
-            input_ids = self.tokenizer(inputs, return_tensors="pt").to(self.device)
+            single = isinstance(inputs, str) or (bool(inputs) and isinstance(inputs[0], int))
+            items = [inputs] if single else list(inputs)
+            sequences = self._embedding_token_ids(items)
+            encoder = self._embedding_encoder(num_layers)
 
-            # Get the model's embeddings
-            with torch.no_grad():
-                outputs = self.model(**input_ids, output_hidden_states=True)
+            embeddings = torch.empty((len(sequences), encoder.config.hidden_size), dtype=torch.float32)
+            order = sorted(range(len(sequences)), key=lambda i: len(sequences[i]))
+            for start in range(0, len(order), batch_size):
+                indices = order[start:start + batch_size]
+                embeddings[indices] = self._embed_batch(encoder, [sequences[i] for i in indices]).float().cpu()
 
-            # Extract embeddings from the last hidden state or a specific layer
-            embeddings = outputs.hidden_states[-1].mean(dim=1).squeeze().tolist()
-            return embeddings
+            if single:
+                embeddings = embeddings[0]
+            return embeddings if return_tensors else embeddings.tolist()
         except Exception as e:
-            raise RuntimeError(f"Failed to generate embeddings: {e}")
\ No newline at end of file
+            raise RuntimeError(f"Failed to generate embeddings: {e}")
+
+    def _embedding_token_ids(self, items: List) -> List[List[int]]:
+        texts = [item for item in items if isinstance(item, str)]
+        encoded = iter(self.tokenizer(texts)["input_ids"] if texts else [])
+        return [next(encoded) if isinstance(item, str) else list(item) for item in items]
+
+    def _embedding_encoder(self, num_layers: Optional[int]) -> torch.nn.Module:
+        """
+        The base transformer without the LM head, cut to its first `num_layers` layers.
+        Truncated copies share their weights with the full model and are kept for reuse.
+        """
+        base_model = self.model.base_model
+        total_layers = base_model.config.num_hidden_layers
+        if not num_layers or num_layers >= total_layers:
+            return base_model
+        if num_layers < 0:
+            raise ValueError(f"num_layers must be positive, got {num_layers}")
+
+        if num_layers not in self._truncated_encoders:
+            name, layers = next(
+                (name, module) for name, module in base_model.named_children()
+                if isinstance(module, torch.nn.ModuleList) and len(module) == total_layers
+            )
+            truncated = copy.copy(base_model)
+            # Give the copy its own module and config so the full model is left untouched
+            truncated._modules = dict(base_model._modules)
+            truncated._modules[name] = layers[:num_layers]
+            truncated.config = copy.copy(base_model.config)
+            truncated.config.num_hidden_layers = num_layers
+            self._truncated_encoders[num_layers] = truncated
+        return self._truncated_encoders[num_layers]
+
+    def _embed_batch(self, encoder: torch.nn.Module, sequences: List[List[int]]) -> torch.Tensor:
+        """
+        Mean-pooled last hidden state for a micro-batch of token ID lists, padded on the right.
+        """
+        pad_token_id = self.default_parameters.get("pad_token_id") or 0
+        length = max(1, max(len(ids) for ids in sequences))
+        input_ids = torch.full((len(sequences), length), pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(sequences), length), dtype=torch.long)
+        for row, ids in enumerate(sequences):
+            input_ids[row, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+            attention_mask[row, :len(ids)] = 1
+        input_ids, attention_mask = input_ids.to(self.device), attention_mask.to(self.device)
+
+        with torch.inference_mode():
+            hidden = encoder(input_ids=input_ids, attention_mask=attention_mask, use_cache=False).last_hidden_state
+            mask = attention_mask.unsqueeze(-1).to(hidden.dtype)
+            return (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
@@ -1,18 +1,45 @@
-from transformers import AutoTokenizer, AutoModelForCausalLM, PreTrainedTokenizer, PreTrainedModel
-from typing import Dict, Optional
+import gc
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM, PreTrainedTokenizer, PreTrainedModel, StoppingCriteriaList
+from typing import Dict, List, Optional, Tuple
 
 from mai.crosscutting.logging import get_logger
+from mai.crosscutting.metrics import BATCH_SIZE, STAGE_SECONDS, GenerationTiming, record_generation, timed
+from mai.inference.batching_scheduler import BatchingScheduler, left_pad
+from mai.inference.stopping import CancellationCriteria, CompletionStop, CompletionStopCriteria, TimingCriteria
+from mai.inference.continuous_batching import ContinuousBatchingEngine
+from mai.inference.prefix_cache import PrefixCache
+from mai.inference.speculative import SpeculativeDecoder
+from mai.inference.quantization import load_dtype, model_nbytes, quantize_model, validate_precision
+from mai.inference.streaming import IncrementalTextStreamer, decode_new_tokens
+from mai.inference.usage import TokenUsage
 
 logger = get_logger()
 
+# Per-request objects and switches passed through to generation untouched by generator-specific parameter handling
+PASSTHROUGH_PARAMETERS = {"streamer", "cancellation_token", "prompt_lookup", "usage", "echo", "suffix", "stop", "stop_at"}
+
+# Prompt used to warm up a freshly loaded model
+WARM_UP_PROMPT = "def hello_world():"
+
 class GeneratorBase:
+    # Sentinel tokens of fill-in-the-middle prompts, placed before the prefix, the suffix and the middle.
+    # None for models that were not trained to fill in the middle.
+    fim_tokens: Optional[Tuple[str, str, str]] = None
+    # Tokens other than the sentinels and EOS that end the middle
+    fim_stop_tokens: Tuple[str, ...] = ()
+
     def __init__(self, pretrained: str, device: str = "cpu", trust_remote_code: bool = False):
         """
         Base class for text generators.
         """
         self.pretrained = pretrained
         self.device = device
+        # Name in logs and metrics; the generator manager sets it to the registered name
+        self.name = self.__class__.__name__
         self.trust_remote_code = trust_remote_code
+        # Numeric precision the model is loaded in, one of `mai.inference.quantization.PRECISIONS`
+        self.precision = "fp32"
         self.tokenizer: Optional[PreTrainedTokenizer] = None
         self.model: Optional[PreTrainedModel] = None
         self.default_parameters: Dict = {
@@ -21,6 +48,10 @@ class GeneratorBase:
             "top_p": 0.9,
             "do_sample": True,
         }
+        self.batching_scheduler: Optional[BatchingScheduler] = None
+        self.continuous_engine: Optional[ContinuousBatchingEngine] = None
+        self.prefix_cache: Optional[PrefixCache] = None
+        self.speculative_decoder: Optional[SpeculativeDecoder] = None
 
     @property
     def unsupported_parameters(self) -> set:
@@ -36,13 +67,22 @@ class GeneratorBase:
         """
         return {k: v for k, v in parameters.items() if k not in self.unsupported_parameters}
 
+    @staticmethod
+    def passthrough_parameters(parameters: Dict) -> Dict:
+        """
+        Pick the per-request objects, such as a token streamer or cancellation token, out of the parameters.
+        """
+        return {k: v for k, v in (parameters or {}).items() if k in PASSTHROUGH_PARAMETERS}
+
 
     def load(self):
         """
         Load the tokenizer and model.
         """
         self.tokenizer = AutoTokenizer.from_pretrained(self.pretrained, trust_remote_code=self.trust_remote_code)
-        self.model = AutoModelForCausalLM.from_pretrained(self.pretrained, trust_remote_code=self.trust_remote_code)
+        self.model = AutoModelForCausalLM.from_pretrained(
+            self.pretrained, trust_remote_code=self.trust_remote_code, torch_dtype=self.load_dtype(None)
+        )
         self.model.to(device=self.device)
 
         # Set pad token if not defined
@@ -57,28 +97,401 @@ class GeneratorBase:
             f"  - Tokenizer PAD Token ID: {self.default_parameters['pad_token_id']}\n"
         )
 
+    def load_dtype(self, default: Optional[torch.dtype] = torch.float32) -> Optional[torch.dtype]:
+        """
+        Dtype to load the model weights in for the configured precision.
+        A `default` of None keeps the checkpoint's own dtype.
+        """
+        return load_dtype(self.precision, default)
+
+    def set_precision(self, precision: str):
+        """
+        Select the precision used by the next `load`.
+        """
+        self.precision = validate_precision(precision)
+
+    def apply_precision(self):
+        """
+        Quantize the loaded model when an int8 or int4 precision is configured.
+        """
+        if self.precision in ("int8", "int4"):
+            quantize_model(self.model, self.precision)
+            logger.info(f"Generator '{self.__class__.__name__}' quantized to {self.precision}.")
+
+    def unload(self):
+        """
+        Release the model, tokenizer and serving state so their memory can be reclaimed.
+        The generator can be loaded again afterwards.
+        """
+        if self.batching_scheduler is not None:
+            self.batching_scheduler.shutdown()
+        if self.continuous_engine is not None:
+            self.continuous_engine.shutdown()
+        self.batching_scheduler = None
+        self.continuous_engine = None
+        self.prefix_cache = None
+        self.speculative_decoder = None
+        self.model = None
+        self.tokenizer = None
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def warm_up(self):
+        """
+        Run a tiny generation so one-time initialisation, such as kernel selection and
+        allocator growth, happens before the first real request.
+        """
+        self.generate(WARM_UP_PROMPT, {"max_new_tokens": 2, "do_sample": False})
+
+    def memory_footprint(self) -> int:
+        """
+        Bytes held by the loaded model's parameters and buffers.
+        """
+        if self.model is None:
+            return 0
+        if self.precision == "int8":
+            # Dynamically quantized layers keep their packed weights outside the parameters
+            return model_nbytes(self.model)
+        return self.model.get_memory_footprint()
+
+    def enable_batching(self, max_batch_size: int, max_wait_ms: float):
+        """
+        Route generation through a batching scheduler shared by concurrent callers.
+        """
+        self.batching_scheduler = BatchingScheduler(
+            self.name, self.generate_batch, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms
+        )
+
+    def enable_continuous_batching(self, max_batch_size: int):
+        """
+        Route generation through a continuous batching engine with its own decode loop.
+        """
+        self.continuous_engine = ContinuousBatchingEngine(
+            self.name, self.model, self._eos_token_ids(), max_batch_size=max_batch_size
+        )
+
+    def enable_prefix_cache(self, max_bytes: int):
+        """
+        Reuse prompt KV caches across requests that share a token prefix.
+        """
+        self.prefix_cache = PrefixCache(max_bytes)
+
+    def enable_speculative_decoding(self, draft: "GeneratorBase", num_draft_tokens: int):
+        """
+        Let a smaller loaded generator draft tokens for this one to verify. Both must share a tokenizer.
+        """
+        if draft.tokenizer.get_vocab() != self.tokenizer.get_vocab():
+            raise ValueError(
+                f"Draft generator '{draft.__class__.__name__}' does not share a tokenizer with '{self.__class__.__name__}'."
+            )
+        self.speculative_decoder = SpeculativeDecoder(
+            self.name, self.model, self._eos_token_ids(), draft.model, num_draft_tokens=num_draft_tokens
+        )
+
+    def tokenize(self, query: str, parameters: Dict) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Tokenize the query and return its input IDs and attention mask.
+        """
+        inputs = self.tokenizer(query, return_tensors="pt")
+        return inputs["input_ids"].to(self.device), inputs["attention_mask"].to(self.device)
+
+    @property
+    def supports_fim(self) -> bool:
+        return self.fim_tokens is not None
+
+    def tokenize_prompt(self, query: str, parameters: Dict) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Tokenize the query, as the prefix of a fill-in-the-middle prompt when the request has a `suffix`.
+        """
+        if parameters.get("suffix") is None:
+            return self.tokenize(query, parameters)
+        return self.tokenize_fim(query, parameters["suffix"])
+
+    def tokenize_fim(self, prefix: str, suffix: str) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Build a prefix-suffix-middle prompt from the model's sentinel tokens. The prefix and
+        suffix are tokenized on their own so that neither merges with a sentinel.
+        """
+        prefix_token, suffix_token, middle_token = self._fim_token_ids()
+        bos_token_id = self.tokenizer.bos_token_id
+        # Keep the BOS token of tokenizers that start every sequence with one
+        start = [bos_token_id] if bos_token_id is not None and self.tokenizer("")["input_ids"][:1] == [bos_token_id] else []
+        encode = lambda text: self.tokenizer(text, add_special_tokens=False)["input_ids"]
+        ids = start + [prefix_token, *encode(prefix), suffix_token, *encode(suffix), middle_token]
+        input_ids = torch.tensor([ids], device=self.device)
+        return input_ids, torch.ones_like(input_ids)
+
+    def fim_eos_token_ids(self) -> List[int]:
+        """
+        Tokens that end a fill-in-the-middle generation: EOS, the sentinels and the model's other end-of-middle tokens.
+        """
+        ids = set(self._eos_token_ids()) | set(self._fim_token_ids())
+        for token in self.fim_stop_tokens:
+            token_id = self._special_token_id(token)
+            if token_id is not None:
+                ids.add(token_id)
+        return sorted(ids)
+
+    def _fim_token_ids(self) -> Tuple[int, int, int]:
+        if self.fim_tokens is None:
+            raise ValueError(f"Generator '{self.name}' does not support fill-in-the-middle.")
+        ids = tuple(self._special_token_id(token) for token in self.fim_tokens)
+        if None in ids:
+            raise ValueError(f"The tokenizer of '{self.name}' lacks the fill-in-the-middle tokens {', '.join(self.fim_tokens)}.")
+        return ids
+
+    def _special_token_id(self, token: str) -> Optional[int]:
+        token_id = self.tokenizer.convert_tokens_to_ids(token)
+        if token_id is None or (token_id == self.tokenizer.unk_token_id and token != self.tokenizer.unk_token):
+            return None
+        return token_id
+
     def generate(self, query: str, parameters: Dict = None) -> str:
         """
-        Generate text based on the query and parameters.
+        Generate text based on the query and parameters. With a `suffix`, the query is the
+        prefix of a fill-in-the-middle prompt and generation stops at the end of the middle.
+        Generation also stops early at the request's `stop` strings and `stop_at` boundary.
         """
         logger.debug(f"Generating text for query: {query}")
         if self.tokenizer is None or self.model is None:
             raise ValueError("Model and tokenizer must be loaded before generation.")
 
         # Tokenize input
-        input_ids = self.tokenizer.encode(query, return_tensors="pt").to(self.device)
+        with timed(STAGE_SECONDS, model=self.name, stage="tokenize"):
+            input_ids, attention_mask = self.tokenize_prompt(query, parameters or {})
 
         # Merge default parameters with provided ones
         params = {**self.default_parameters, **(parameters or {})}
 
         # Filter unsupported parameters
         params = self.filter_parameters(params)
+        if params.get("suffix") is not None:
+            params["eos_token_id"] = self.fim_eos_token_ids()
+        prompt_ids = input_ids[0][attention_mask[0].bool()]
+        params = self.with_completion_stop(query, prompt_ids, params)
 
         # Generate text
-        output_ids = self.model.generate(input_ids, **params)
+        output_ids = self.generate_ids(input_ids, attention_mask, params)
 
         # Decode and return the generated text
-        return self.tokenizer.decode(output_ids[0], skip_special_tokens=True, clean_up_tokenization_spaces=False)
+        with timed(STAGE_SECONDS, model=self.name, stage="detokenize"):
+            return self.decode_completion(query, prompt_ids, output_ids, params)
+
+    def with_completion_stop(self, query: str, prompt_ids: torch.Tensor, params: Dict) -> Dict:
+        """
+        Add a `completion_stop` that ends generation at the request's `stop` strings and `stop_at`
+        boundary, checked on the new tokens at every decode step. A token streamer of the request
+        then streams the completion only up to where it ends.
+        """
+        stop = params.get("stop") or []
+        if isinstance(stop, str):
+            stop = [stop]
+        if not stop and params.get("stop_at") is None:
+            return params
+
+        completion_stop = CompletionStop(self.tokenizer, prompt_ids.tolist(), stop, params.get("stop_at"), prefix=query)
+        streamer = params.get("streamer")
+        if isinstance(streamer, IncrementalTextStreamer):
+            streamer.stop = completion_stop
+        return {**params, "completion_stop": completion_stop}
+
+    def decode_completion(self, query: str, prompt_ids: torch.Tensor, output_ids: torch.Tensor, params: Dict) -> str:
+        """
+        Decode the tokens generated after the prompt, preceded by the query when the request sets `echo`.
+        A streamed generation's text was already decoded token by token and is reused, as is that of
+        a `completion_stop`, which also cuts the text where the completion ends.
+        """
+        new_ids = output_ids[prompt_ids.shape[-1]:].tolist()
+        streamer = params.get("streamer")
+        decoder = streamer.decoder if isinstance(streamer, IncrementalTextStreamer) else None
+        stop = params.get("completion_stop")
+        if stop is not None:
+            if not stop.stopped and stop.generated_ids != new_ids:
+                # Such as a batch row that was fed padding after it finished
+                stop = stop.restart()
+                stop.feed(new_ids)
+            stop.flush()
+            text = stop.text
+        elif decoder is not None and decoder.generated_ids == new_ids:
+            decoder.flush()
+            text = decoder.text
+        else:
+            text = decode_new_tokens(self.tokenizer, prompt_ids.tolist(), new_ids)
+        return query + text if params.get("echo") else text
+
+    def generate_ids(self, input_ids: torch.Tensor, attention_mask: torch.Tensor, params: Dict) -> torch.Tensor:
+        """
+        Generate from a single tokenized prompt and return the prompt and new token IDs as a 1-D tensor,
+        recording time to first token, time per output token and throughput. Token counts are
+        written to the request's `usage`, if it has one.
+        """
+        timing = GenerationTiming()
+        output_ids = self._generate_ids(input_ids, attention_mask, {**params, "generation_timing": timing})
+        prompt_tokens = int(attention_mask[0].sum())
+        record_generation(self.name, timing, output_ids.shape[-1] - prompt_tokens)
+        usage = params.get("usage")
+        if usage is not None:
+            usage.prompt_tokens = prompt_tokens
+            usage.completion_tokens = output_ids.shape[-1] - prompt_tokens
+        return output_ids
+
+    def _generate_ids(self, input_ids: torch.Tensor, attention_mask: torch.Tensor, params: Dict) -> torch.Tensor:
+        """
+        Run the generation for `generate_ids`. Goes through the continuous batching engine or the batching scheduler when either is enabled,
+        otherwise through speculative decoding when a draft model is paired with this generator or
+        the request sets `prompt_lookup`. Streamed requests skip the batching scheduler, since a
+        streamer follows a single sequence.
+        """
+        prompt_lookup = bool(params.get("prompt_lookup"))
+        usage = params.get("usage")
+        params = {
+            k: v for k, v in params.items() if k not in ("prompt_lookup", "usage", "echo", "suffix", "stop", "stop_at")
+        }
+        if self.continuous_engine is not None:
+            return self.continuous_engine.submit(input_ids[0][attention_mask[0].bool()], params).result()
+        if self.batching_scheduler is not None and "streamer" not in params:
+            return self.batching_scheduler.submit(input_ids[0][attention_mask[0].bool()], params).result()
+
+        token = params.get("cancellation_token")
+        if token is not None and token.cancelled:
+            # Superseded while queued: skip the model call entirely
+            token.record(self._max_new_tokens(params))
+            return input_ids[0]
+
+        paired = self.speculative_decoder is not None and self.speculative_decoder.draft_model is not None
+        if (paired or prompt_lookup) and SpeculativeDecoder.supports(params):
+            if self.speculative_decoder is None:
+                self.speculative_decoder = SpeculativeDecoder(self.name, self.model, self._eos_token_ids())
+            return self.speculative_decoder.generate(
+                input_ids[0][attention_mask[0].bool()], params, prompt_lookup=prompt_lookup
+            )
+
+        params = self._with_cancellation(params, [token], input_ids.shape[-1])
+        params = self._with_completion_stop(params, [params.get("completion_stop")], input_ids.shape[-1])
+        params = self._with_timing(params, [params.get("generation_timing")])
+        if self.prefix_cache is not None:
+            return self._generate_with_prefix_cache(input_ids, attention_mask, params, usage)
+
+        output_ids = self.model.generate(input_ids, attention_mask=attention_mask, **params)
+        return output_ids[0]
+
+    def _generate_with_prefix_cache(self, input_ids: torch.Tensor, attention_mask: torch.Tensor, params: Dict,
+                                    usage: Optional[TokenUsage] = None) -> torch.Tensor:
+        """
+        Generate starting from the longest cached prefix of the prompt, then cache this prompt.
+        """
+        prompt_ids = input_ids[0].tolist()
+        cached_length, past_key_values = self.prefix_cache.lookup(prompt_ids)
+        if past_key_values is not None:
+            logger.debug(f"Reusing cached KV for {cached_length} of {len(prompt_ids)} prompt tokens")
+            params = {**params, "past_key_values": past_key_values}
+            if usage is not None:
+                usage.cached_tokens = cached_length
+
+        outputs = self.model.generate(
+            input_ids, attention_mask=attention_mask, return_dict_in_generate=True, **params
+        )
+        if outputs.past_key_values is not None:
+            self.prefix_cache.insert(prompt_ids, outputs.past_key_values)
+        return outputs.sequences[0]
+
+    def generate_batch(self, sequences: List[torch.Tensor], params: Dict) -> List[torch.Tensor]:
+        """
+        Generate from several 1-D prompts in one left-padded `generate` call.
+        Each output holds its prompt followed by the tokens generated for it.
+        """
+        pad_token_id = params.get("pad_token_id", self.default_parameters.get("pad_token_id"))
+        if pad_token_id is None and params.get("generation_config") is not None:
+            pad_token_id = params["generation_config"].pad_token_id
+        input_ids, attention_mask = left_pad(sequences, pad_token_id)
+        cancellation_tokens = params.pop("cancellation_tokens", [None] * len(sequences))
+        completion_stops = params.pop("completion_stops", [None] * len(sequences))
+        params = self._with_cancellation(params, cancellation_tokens, input_ids.shape[-1])
+        params = self._with_completion_stop(params, completion_stops, input_ids.shape[-1])
+        params = self._with_timing(params, params.pop("generation_timings", []))
+        BATCH_SIZE.observe(len(sequences), model=self.name, mode="batched")
+        output_ids = self.model.generate(input_ids, attention_mask=attention_mask, **params)
+
+        eos_token_ids = self._eos_token_ids(params)
+        outputs = []
+        for sequence, row, token, stop in zip(sequences, output_ids, cancellation_tokens, completion_stops):
+            new_ids = row[input_ids.shape[-1]:]
+            # Drop the padding generate adds after a row finishes early
+            if stop is not None and stop.stopped:
+                new_ids = new_ids[:stop.consumed]
+            for position, token_id in enumerate(new_ids.tolist()):
+                if token_id in eos_token_ids:
+                    new_ids = new_ids[:position + 1]
+                    break
+            if token is not None and token.cancelled:
+                while new_ids.shape[-1] and new_ids[-1] == pad_token_id:
+                    new_ids = new_ids[:-1]
+            outputs.append(torch.cat([sequence, new_ids]))
+        return outputs
+
+    def _with_cancellation(self, params: Dict, tokens: List, prompt_length: int) -> Dict:
+        """
+        Replace cancellation tokens in the parameters with a stopping criterion checked every decode step.
+        """
+        params = {k: v for k, v in params.items() if k != "cancellation_token"}
+        if all(token is None for token in tokens):
+            return params
+
+        criteria = StoppingCriteriaList(params.pop("stopping_criteria", None) or [])
+        criteria.append(CancellationCriteria(tokens, prompt_length, self._max_new_tokens(params)))
+        params["stopping_criteria"] = criteria
+        return params
+
+    def _with_completion_stop(self, params: Dict, stops: List[Optional[CompletionStop]], prompt_length: int) -> Dict:
+        """
+        Replace completion stops in the parameters with a stopping criterion that feeds them the new tokens every decode step.
+        """
+        params = {k: v for k, v in params.items() if k != "completion_stop"}
+        if all(stop is None for stop in stops):
+            return params
+
+        criteria = StoppingCriteriaList(params.pop("stopping_criteria", None) or [])
+        criteria.append(CompletionStopCriteria(stops, prompt_length))
+        params["stopping_criteria"] = criteria
+        return params
+
+    def _with_timing(self, params: Dict, timings: List[Optional[GenerationTiming]]) -> Dict:
+        """
+        Replace generation timings in the parameters with a stopping criterion that marks the first new token.
+        """
+        params = {k: v for k, v in params.items() if k != "generation_timing"}
+        timings = [timing for timing in timings if timing is not None]
+        if not timings:
+            return params
+
+        criteria = StoppingCriteriaList(params.pop("stopping_criteria", None) or [])
+        criteria.append(TimingCriteria(timings))
+        params["stopping_criteria"] = criteria
+        return params
+
+    def _max_new_tokens(self, params: Dict) -> int:
+        if params.get("max_new_tokens") is not None:
+            return params["max_new_tokens"]
+        generation_config = params.get("generation_config") or self.model.generation_config
+        return generation_config.max_new_tokens or 0
+
+    def _eos_token_ids(self, params: Optional[Dict] = None) -> set:
+        """
+        EOS token IDs of the model, or those a request sets directly or in its generation config.
+        """
+        params = params or {}
+        generation_config = params.get("generation_config")
+        eos_token_id = params.get("eos_token_id")
+        if eos_token_id is None and generation_config is not None:
+            eos_token_id = generation_config.eos_token_id
+        if eos_token_id is None:
+            eos_token_id = self.model.generation_config.eos_token_id
+        if eos_token_id is None and self.tokenizer is not None:
+            eos_token_id = self.tokenizer.eos_token_id
+        if isinstance(eos_token_id, int):
+            return {eos_token_id}
+        return set(eos_token_id or [])
 
     def generate_embeddings(self, inputs: str) -> list:
         """
@@ -1,16 +1,68 @@
+import asyncio
+import importlib
 import os
-from threading import Lock
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from threading import Lock, RLock, Thread
+from typing import TYPE_CHECKING, Optional, Union
 from mai.crosscutting.logging import get_logger
-from mai.generators.code_llama_generator import CodeLlamaGenerator
-from mai.generators.deepseek_coder_generator import DeepSeekCoderGenerator
-from mai.generators.generator_base import GeneratorBase
-from mai.generators.gpt2_generator import GPT2Generator
-from mai.generators.qwen2_5_coder_generator import Qwen2_5CoderGenerator
-from mai.generators.star_coder_generator import StarCoderGenerator
-from mai.generators.tiny_star_coder_generator import TinyStarCoderGenerator
+from mai.crosscutting.metrics import (
+    MODEL_LOAD_SECONDS,
+    MODEL_LOADED,
+    MODEL_RESIDENT_BYTES,
+    QUEUE_LENGTH,
+    REQUESTS_RUNNING,
+    STAGE_SECONDS,
+    metrics,
+)
+from mai.generators.remote_generator import RemoteGenerator, load_worker_configs
+from mai.inference.inference_executor import InferenceExecutor
+from mai.inference.quantization import estimate_load_nbytes, parse_precision_overrides, validate_precision
+
+if TYPE_CHECKING:
+    from mai.generators.generator_base import GeneratorBase
 
 logger = get_logger()
 
+# Supported generators: import path of the generator class and its constructor arguments.
+# Classes are imported on first load, so torch and transformers are only imported once a model is needed.
+# An optional "precision" argument sets the precision the model is loaded in unless overridden by configuration.
+GENERATOR_REGISTRY = {
+    "codellama": ("mai.generators.code_llama_generator.CodeLlamaGenerator", {"pretrained": "TheBloke/CodeLlama-7B-Python-AWQ"}),
+    "gpt2": ("mai.generators.gpt2_generator.GPT2Generator", {"pretrained": "gpt2"}),
+    "tinystarcoder": ("mai.generators.tiny_star_coder_generator.TinyStarCoderGenerator", {}),
+    "starcoder": ("mai.generators.star_coder_generator.StarCoderGenerator", {"pretrained": "bigcode/starcoder"}),
+    "qwen": ("mai.generators.qwen2_5_coder_generator.Qwen2_5CoderGenerator", {}),
+    "deepseekcoder": ("mai.generators.deepseek_coder_generator.DeepSeekCoderGenerator", {"pretrained": "deepseek-ai/deepseek-coder-6.7b-base"}),
+}
+
+# Names of the generators the current request got, which stay resident until it finishes
+_request_leases: ContextVar[Optional[list]] = ContextVar("request_leases", default=None)
+
+
+def import_generator(import_path: str, arguments: dict) -> "GeneratorBase":
+    """
+    Import a generator class from its dotted path and instantiate it.
+    """
+    module_name, class_name = import_path.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), class_name)(**arguments)
+
+def parse_draft_models(value: str) -> dict:
+    """
+    Parse speculative decoding pairs written as `target=draft,target=draft`.
+    """
+    pairs = {}
+    for item in filter(None, (part.strip() for part in (value or "").split(","))):
+        target, separator, draft = (part.strip() for part in item.partition("="))
+        if not separator or not target or not draft:
+            raise ValueError(f"Invalid draft model pairing '{item}', expected TARGET=DRAFT.")
+        if target == draft:
+            raise ValueError(f"Generator '{target}' cannot draft for itself.")
+        pairs[target] = draft
+    return pairs
+
 class GeneratorManager:
     """
     Singleton Manager for handling and dynamically selecting generators.
@@ -28,62 +80,480 @@ class GeneratorManager:
     def __init__(self):
         if not self._initialized:
             self.generators = {}
+            # Bytes all loaded models together may hold; 0 means no limit
+            self.memory_budget = int(float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0")) * 1024 * 1024)
+            # In-progress loads by name, shared by every caller waiting for the same model
+            self._loading = {}
+            self._loading_lock = Lock()
+            # Guards which models are loaded while loads and evictions run on different threads
+            self._residency_lock = RLock()
+            # Bytes of the models being loaded, counted against the budget until they are marked loaded
+            self._reserved = {}
+            # With a budget, models are read in one at a time so that each load makes room for itself
+            self._budget_lock = Lock()
+            metrics.add_collector(self.collect_metrics)
+            metrics.add_source(self.worker_metrics)
             self._initialized = True
 
-    def register(self, name: str, generator: GeneratorBase):
+    def register(self, name: str, generator: Union["GeneratorBase", str], **arguments):
         """
-        Register a new generator with a lazy-loaded flag.
+        Register a new generator with a lazy-loaded flag and its own inference executor.
+        `generator` is an instance, or the import path of a generator class that is
+        instantiated with `arguments` when the generator is first loaded. A `precision`
+        argument is kept by the manager rather than passed to the generator, and so is a
+        `checkpoint` argument naming the checkpoint an instance loads.
         """
-        self.generators[name] = {"generator": generator, "loaded": False}
+        precision = arguments.pop("precision", None)
+        # Checkpoint whose files estimate the model's size before its first load
+        checkpoint = arguments.pop("checkpoint", None) or arguments.get("pretrained")
+        if precision is not None:
+            validate_precision(precision)
+        previous = self.generators.get(name)
+        if previous:
+            previous["executor"].shutdown()
+
+        max_workers = int(os.getenv("INFERENCE_WORKERS", "1"))
+        max_queue_size = int(os.getenv("INFERENCE_QUEUE_SIZE", "8"))
+        if isinstance(generator, RemoteGenerator):
+            # Calls only wait on the worker process, whose own executor limits and queues them
+            max_workers, max_queue_size = generator.max_concurrency + generator.max_queue_size, 0
+            generator.on_exit = lambda reason: self.worker_exited(name, generator, reason)
+        elif os.getenv("SERVING_MODE", "direct") in ("batched", "continuous"):
+            # Callers block on the batch they joined, so allow a full batch of them at once
+            max_workers = max(max_workers, int(os.getenv("BATCH_MAX_SIZE", "8")))
+
+        executor = InferenceExecutor(
+            name,
+            max_workers=max_workers,
+            max_queue_size=max_queue_size,
+            # Remote generators report the wait in their worker's queue instead
+            record_queue_wait=not isinstance(generator, RemoteGenerator),
+        )
+        self.generators[name] = {
+            "generator": generator if not isinstance(generator, str) else None,
+            "factory": (generator, arguments) if isinstance(generator, str) else None,
+            "loaded": False,
+            "status": "registered",
+            "load_seconds": None,
+            "error": None,
+            "precision": precision,
+            "executor": executor,
+            "pinned": previous["pinned"] if previous else False,
+            "checkpoint": checkpoint,
+            "memory_bytes": 0,
+            "last_used": 0.0,
+            "leases": previous["leases"] if previous else 0,
+            # Draft this generator decodes speculatively with, and how many loaded targets use this one as theirs
+            "draft": None,
+            "draft_pins": previous["draft_pins"] if previous else 0,
+        }
 
     def register_all(self):
         """
-        Register all supported generators.
+        Register all supported generators. With MODEL_DISPATCH enabled, each one runs in its
+        own worker process configured by the JSON file in MODEL_WORKER_CONFIG.
         """
-        self.register("codellama", CodeLlamaGenerator(pretrained="TheBloke/CodeLlama-7B-Python-AWQ"))
-        self.register("gpt2", GPT2Generator(pretrained="gpt2"))
-        self.register("tinystarcoder", TinyStarCoderGenerator())
-        self.register("starcoder", StarCoderGenerator(pretrained="bigcode/starcoder"))
-        self.register("qwen", Qwen2_5CoderGenerator())
-        self.register("deepseekcoder", DeepSeekCoderGenerator(pretrained="deepseek-ai/deepseek-coder-6.7b-base"))
+        dispatch = os.getenv("MODEL_DISPATCH", "false").lower() == "true"
+        worker_configs = load_worker_configs(os.getenv("MODEL_WORKER_CONFIG")) if dispatch else {}
+        for name, (import_path, arguments) in GENERATOR_REGISTRY.items():
+            if dispatch:
+                self.register(
+                    name,
+                    RemoteGenerator(name, worker_configs.get(name)),
+                    precision=arguments.get("precision"),
+                    checkpoint=arguments.get("pretrained"),
+                )
+            else:
+                self.register(name, import_path, **arguments)
         logger.info(f"Registered generators: {', '.join(self.generators.keys())}")
 
     def load(self, name: str):
         """
-        Load a generator by name if it hasn't been loaded yet.
+        Load a generator by name if it hasn't been loaded yet. Blocks until it is loaded.
+        """
+        self.start_loading(name).result()
+
+    def start_loading(self, name: str) -> Future:
+        """
+        Start loading a generator in a background thread and return a future for its completion.
+        Concurrent callers share one load: only the first starts it, the others get the same future.
+        """
+        if name not in self.generators:
+            raise ValueError(f"Generator '{name}' is not registered.")
+
+        with self._loading_lock:
+            future = self._loading.get(name)
+            if future is None:
+                future = Future()
+                if self.generators[name]["loaded"]:
+                    future.set_result(None)
+                    return future
+                self._loading[name] = future
+                Thread(target=self._load, args=(name, future), name=f"load-{name}", daemon=True).start()
+            return future
+
+    def _load(self, name: str, future: Future):
+        generator_entry = self.generators[name]
+        started = time.perf_counter()
+        generator_entry.update(status="loading", error=None)
+        try:
+            if generator_entry["generator"] is None:
+                generator_entry["generator"] = import_generator(*generator_entry["factory"])
+            generator = generator_entry["generator"]
+            generator.name = name
+            generator.set_precision(self.precision_for(name))
+            # Make room and reserve it before loading, so that no other load claims the same room.
+            # The size measured once loaded replaces the estimate
+            incoming_bytes = self.estimate_memory_bytes(name)
+            with self._budget_lock if self.memory_budget > 0 else nullcontext():
+                with self._residency_lock:
+                    self.enforce_memory_budget(keep=name, incoming_bytes=incoming_bytes)
+                    self._reserved[name] = incoming_bytes
+                logger.info(f"Loading generator '{name}'...")
+                generator.load()
+                generator.apply_precision()
+                with self._residency_lock:
+                    self._reserved[name] = generator.memory_footprint()
+            if not isinstance(generator, RemoteGenerator):
+                # Worker processes configure serving and warm up their generator themselves
+                self.configure_serving(name, generator)
+                if os.getenv("WARMUP_ON_LOAD", "false").lower() == "true":
+                    warm_up_started = time.perf_counter()
+                    generator.warm_up()
+                    logger.info(f"Generator '{name}' warmed up in {time.perf_counter() - warm_up_started:.2f}s.")
+            with self._residency_lock:
+                self._reserved.pop(name, None)
+                generator_entry["memory_bytes"] = generator.memory_footprint()
+                generator_entry["loaded"] = True
+                generator_entry.update(status="loaded", load_seconds=round(time.perf_counter() - started, 3))
+                MODEL_LOAD_SECONDS.observe(time.perf_counter() - started, model=name)
+                logger.info(f"Generator '{name}' loaded successfully ({generator_entry['memory_bytes'] / 1024 ** 2:.0f} MB).")
+                self.enforce_memory_budget(keep=name)
+            future.set_result(None)
+        except Exception as e:
+            logger.error(f"Failed to load generator '{name}': {e}")
+            with self._residency_lock:
+                self._reserved.pop(name, None)
+                self._release_draft(name)
+            generator_entry.update(status="failed", error=str(e))
+            future.set_exception(e)
+        finally:
+            with self._loading_lock:
+                self._loading.pop(name, None)
+
+    def unload(self, name: str):
+        """
+        Unload a generator, releasing its memory. It is loaded again on its next use.
         """
         if name not in self.generators:
             raise ValueError(f"Generator '{name}' is not registered.")
 
         generator_entry = self.generators[name]
-        if not generator_entry["loaded"]:
-            logger.info(f"Loading generator '{name}'...")
-            generator_entry["generator"].load()
-            generator_entry["loaded"] = True
-            logger.info(f"Generator '{name}' loaded successfully.")
+        with self._residency_lock:
+            if not generator_entry["loaded"]:
+                return
+            generator_entry["generator"].unload()
+            generator_entry["loaded"] = False
+            generator_entry["status"] = "unloaded"
+            self._release_draft(name)
+            logger.info(f"Generator '{name}' unloaded, releasing {generator_entry['memory_bytes'] / 1024 ** 2:.0f} MB.")
+
+    def worker_exited(self, name: str, generator: RemoteGenerator, reason: str):
+        """
+        Mark a remote generator whose worker process died as failed, so that its next use starts a new worker.
+        """
+        generator_entry = self.generators.get(name)
+        with self._residency_lock:
+            if generator_entry is None or generator_entry["generator"] is not generator or not generator_entry["loaded"]:
+                return
+            generator.unload()
+            generator_entry["loaded"] = False
+            generator_entry.update(status="failed", error=reason)
+
+    def pin(self, name: str):
+        """
+        Keep a generator resident: it is never evicted to make room for other models.
+        """
+        if name not in self.generators:
+            raise ValueError(f"Generator '{name}' is not registered.")
+        self.generators[name]["pinned"] = True
+
+    def estimate_memory_bytes(self, name: str) -> int:
+        """
+        Bytes a generator is expected to take once loaded: what it measured the last time it was
+        loaded, else an estimate from the size of its checkpoint files. 0 when neither is known.
+        """
+        entry = self.generators[name]
+        if entry["memory_bytes"]:
+            return entry["memory_bytes"]
+        if not self.memory_budget:
+            return 0
+        checkpoint = entry["checkpoint"] or getattr(entry["generator"], "pretrained", None)
+        memory_bytes = estimate_load_nbytes(checkpoint, self.precision_for(name)) if checkpoint else 0
+        if not memory_bytes:
+            logger.warning(f"Could not estimate the size of generator '{name}' before loading it.")
+        return memory_bytes
+
+    def _release_draft(self, name: str):
+        """
+        Drop a target's hold on its draft, which can be evicted again once no loaded target uses it.
+        """
+        with self._residency_lock:
+            draft_name = self.generators[name]["draft"]
+            if draft_name is not None:
+                self.generators[name]["draft"] = None
+                self.generators[draft_name]["draft_pins"] -= 1
+
+    def resident_bytes(self) -> int:
+        return sum(entry["memory_bytes"] for entry in self.generators.values() if entry["loaded"])
+
+    def reserved_bytes(self) -> int:
+        """
+        Bytes of the models being loaded: estimated while they are read in, then measured.
+        """
+        with self._residency_lock:
+            return sum(self._reserved.values())
+
+    def enforce_memory_budget(self, keep: str = None, incoming_bytes: int = 0):
+        """
+        Unload least recently used generators until the loaded models, the models other loads
+        reserved room for and `incoming_bytes` about to be loaded fit in the memory budget. Pinned generators, drafts of loaded
+        targets, generators leased by a request or with calls in flight, and `keep` are never evicted.
+        """
+        if self.memory_budget <= 0:
+            return
+        with self._residency_lock:
+            while self.resident_bytes() + self.reserved_bytes() + incoming_bytes > self.memory_budget:
+                candidates = [
+                    name for name, entry in self.generators.items()
+                    if entry["loaded"] and not entry["pinned"] and entry["draft_pins"] == 0 and name != keep
+                    and entry["leases"] == 0 and entry["executor"].pending == 0
+                ]
+                if not candidates:
+                    logger.warning(
+                        f"Loaded models use {self.resident_bytes() / 1024 ** 2:.0f} MB and "
+                        f"{(self.reserved_bytes() + incoming_bytes) / 1024 ** 2:.0f} MB more are being loaded, over the "
+                        f"{self.memory_budget / 1024 ** 2:.0f} MB budget, and none can be evicted."
+                    )
+                    return
+                self.unload(min(candidates, key=lambda name: self.generators[name]["last_used"]))
+
+    def precision_for(self, name: str) -> str:
+        """
+        Precision to load a generator in: a per-model override from MODEL_PRECISION_OVERRIDES,
+        else the precision in its registry entry, else MODEL_PRECISION, else the generator's own.
+        """
+        overrides = parse_precision_overrides(os.getenv("MODEL_PRECISION_OVERRIDES"))
+        entry = self.generators[name]
+        precision = overrides.get(name) or entry["precision"] or os.getenv("MODEL_PRECISION")
+        if precision is None and entry["generator"] is not None:
+            precision = entry["generator"].precision
+        return validate_precision(precision or "fp32")
+
+    def configure_serving(self, name: str, generator: "GeneratorBase"):
+        """
+        Apply the serving mode selected through environment variables to a loaded generator.
+        """
+        serving_mode = os.getenv("SERVING_MODE", "direct")
+        if serving_mode == "batched":
+            max_batch_size = int(os.getenv("BATCH_MAX_SIZE", "8"))
+            max_wait_ms = float(os.getenv("BATCH_MAX_WAIT_MS", "10"))
+            generator.enable_batching(max_batch_size, max_wait_ms)
+            logger.info(f"Generator '{name}' batches up to {max_batch_size} requests within {max_wait_ms} ms.")
+        elif serving_mode == "continuous":
+            max_batch_size = int(os.getenv("BATCH_MAX_SIZE", "8"))
+            generator.enable_continuous_batching(max_batch_size)
+            logger.info(f"Generator '{name}' decodes up to {max_batch_size} sequences with continuous batching.")
+        elif serving_mode != "direct":
+            raise ValueError(f"Unknown serving mode '{serving_mode}'.")
+
+        prefix_cache_mb = float(os.getenv("PREFIX_CACHE_MB", "0"))
+        if prefix_cache_mb > 0:
+            generator.enable_prefix_cache(int(prefix_cache_mb * 1024 * 1024))
+            logger.info(f"Generator '{name}' reuses prompt prefixes with a {prefix_cache_mb} MB KV cache.")
+
+        draft_name = parse_draft_models(os.getenv("SPECULATIVE_DRAFTS")).get(name)
+        if draft_name and serving_mode != "direct":
+            logger.warning(f"Speculative decoding for '{name}' needs the direct serving mode; ignoring draft '{draft_name}'.")
+        elif draft_name and draft_name not in self.generators:
+            logger.warning(f"Generator '{name}' serves without speculative decoding, its draft '{draft_name}' is not registered.")
+        elif draft_name:
+            # The draft serves every request of its target, so it stays resident until the target is unloaded
+            with self._residency_lock:
+                self._release_draft(name)
+                self.generators[draft_name]["draft_pins"] += 1
+                self.generators[name]["draft"] = draft_name
+            num_draft_tokens = int(os.getenv("SPECULATIVE_DRAFT_TOKENS", "4"))
+            try:
+                generator.enable_speculative_decoding(self.get(draft_name), num_draft_tokens)
+            except Exception as e:
+                self._release_draft(name)
+                logger.warning(f"Generator '{name}' serves without speculative decoding, its draft '{draft_name}' failed: {e}")
+                return
+            logger.info(f"Generator '{name}' decodes speculatively with '{draft_name}' drafting {num_draft_tokens} tokens.")
 
     def load_models(self, default_model: str, chat_model: str = None):
         """
-        Load the default and optional chat model specified by environment variables.
+        Load and pin the default and optional chat model specified by environment variables.
+        """
+        for future in self.preload(default_model, chat_model):
+            future.result()
+
+    def preload(self, default_model: str, chat_model: str = None) -> list:
+        """
+        Pin the default and optional chat model and start loading them in the background.
+        Returns the futures of the loads.
         """
-        self.load(default_model)
-        if chat_model:
-            self.load(chat_model)
+        futures = []
+        for name in filter(None, (default_model, chat_model)):
+            self.pin(name)
+            futures.append(self.start_loading(name))
+        return futures
 
-    def get(self, name: str) -> GeneratorBase:
+    def readiness(self) -> dict:
+        """
+        Load progress of every pinned generator. Ready once all of them are loaded.
         """
-        Get a generator by name. Ensures the generator is loaded.
+        models = {
+            name: {"status": entry["status"], "load_seconds": entry["load_seconds"], "error": entry["error"]}
+            for name, entry in self.generators.items() if entry["pinned"]
+        }
+        return {"ready": all(model["status"] == "loaded" for model in models.values()), "models": models}
+
+    @contextmanager
+    def leases(self):
+        """
+        Keep the generators got through `get` or `get_async` within the block resident until it
+        exits, so a request's model cannot be evicted before its inference call is submitted.
+        """
+        leases = []
+        token = _request_leases.set(leases)
+        try:
+            yield
+        finally:
+            _request_leases.reset(token)
+            with self._residency_lock:
+                for name in leases:
+                    self.generators[name]["leases"] -= 1
+
+    def _lease(self, name: str):
+        leases = _request_leases.get()
+        if leases is not None:
+            with self._residency_lock:
+                self.generators[name]["leases"] += 1
+                leases.append(name)
+
+    def get(self, name: str) -> "GeneratorBase":
+        """
+        Get a generator by name. Ensures the generator is loaded, and leases it to the
+        current request within `leases()`.
         """
         if name not in self.generators:
             raise ValueError(f"Generator '{name}' is not registered.")
+        started = time.perf_counter()
+        self.generators[name]["last_used"] = time.monotonic()
+        self._lease(name)
         self.load(name)  # Ensure the generator is loaded before returning
+        STAGE_SECONDS.observe(time.perf_counter() - started, model=name, stage="get")
         return self.generators[name]["generator"]
 
-    def get_default(self) -> GeneratorBase:
+    async def get_async(self, name: str) -> "GeneratorBase":
         """
-        Get the default generator based on an environment variable.
+        Get a generator by name, awaiting its load without blocking the event loop.
+        Leases it to the current request within `leases()`.
+        """
+        if name not in self.generators:
+            raise ValueError(f"Generator '{name}' is not registered.")
+        started = time.perf_counter()
+        self.generators[name]["last_used"] = time.monotonic()
+        self._lease(name)
+        await asyncio.wrap_future(self.start_loading(name))
+        STAGE_SECONDS.observe(time.perf_counter() - started, model=name, stage="get")
+        return self.generators[name]["generator"]
+
+    def residency(self) -> dict:
+        """
+        Which generators are loaded, their memory use and whether they can be evicted.
+        """
+        now = time.monotonic()
+        return {
+            name: {
+                "loaded": entry["loaded"],
+                "status": entry["status"],
+                "pinned": entry["pinned"] or entry["draft_pins"] > 0,
+                "precision": entry["generator"].precision if entry["loaded"] else None,
+                "memory_bytes": entry["memory_bytes"] if entry["loaded"] else 0,
+                "pending_requests": entry["executor"].pending,
+                "leases": entry["leases"],
+                "idle_seconds": round(now - entry["last_used"], 1) if entry["last_used"] else None,
+            }
+            for name, entry in self.generators.items()
+        }
+
+    def stats(self) -> dict:
+        """
+        Serving statistics for every registered generator.
+        """
+        stats = {}
+        for name, entry in self.generators.items():
+            generator = entry["generator"]
+            stats[name] = {
+                "loaded": entry["loaded"],
+                "pending_requests": entry["executor"].pending,
+                "queue": entry["executor"].stats(),
+                "prefix_cache": generator.prefix_cache.stats() if generator and generator.prefix_cache else None,
+                "speculative": generator.speculative_decoder.stats() if generator and generator.speculative_decoder else None,
+            }
+            if isinstance(generator, RemoteGenerator):
+                stats[name]["worker"] = generator.worker_info()
+        return stats
+
+    def collect_metrics(self):
+        """
+        Set the residency and queue gauges of every registered generator for a metrics scrape.
+        """
+        for gauge in (MODEL_LOADED, MODEL_RESIDENT_BYTES, QUEUE_LENGTH, REQUESTS_RUNNING):
+            gauge.clear()
+        for name, entry in list(self.generators.items()):
+            MODEL_LOADED.set(int(entry["loaded"]), model=name)
+            MODEL_RESIDENT_BYTES.set(entry["memory_bytes"] if entry["loaded"] else 0, model=name)
+            for priority, queue in entry["executor"].stats().items():
+                QUEUE_LENGTH.set(queue["queued"], model=name, priority=priority)
+                REQUESTS_RUNNING.set(queue["running"], model=name, priority=priority)
+
+    def worker_metrics(self) -> list:
+        """
+        Metrics snapshots of the worker processes of loaded remote generators.
+        """
+        snapshots = []
+        for name, entry in list(self.generators.items()):
+            generator = entry["generator"]
+            if isinstance(generator, RemoteGenerator) and entry["loaded"]:
+                try:
+                    snapshots.append(generator.metrics_snapshot())
+                except Exception as e:
+                    logger.warning(f"Failed to collect metrics from the worker for '{name}': {e}")
+        return snapshots
+
+    def get_executor(self, name: str) -> InferenceExecutor:
+        """
+        Get the inference executor that runs the named generator's blocking calls.
+        """
+        if name not in self.generators:
+            raise ValueError(f"Generator '{name}' is not registered.")
+        return self.generators[name]["executor"]
+
+    def get_default_name(self) -> str:
+        """
+        Get the name of the default generator based on an environment variable.
         """
         generator_name = os.getenv("DEFAULT_GENERATOR", "")
         if generator_name not in self.generators:
             raise ValueError(f"Default generator '{generator_name}' is not registered.")
-        return self.get(generator_name)
+        return generator_name
+
+    def get_default(self) -> "GeneratorBase":
+        """
+        Get the default generator based on an environment variable.
+        """
+        return self.get(self.get_default_name())
@@ -2,10 +2,14 @@ import torch
 from transformers import AutoModelForCausalLM, AutoTokenizer
 from mai.generators.generator_base import GeneratorBase
 from mai.crosscutting.logging import get_logger
+from mai.crosscutting.metrics import STAGE_SECONDS, timed
 
 logger = get_logger()
 
 class Qwen2_5CoderGenerator(GeneratorBase):
+    fim_tokens = ("<|fim_prefix|>", "<|fim_suffix|>", "<|fim_middle|>")
+    fim_stop_tokens = ("<|endoftext|>", "<|fim_pad|>", "<|repo_name|>", "<|file_sep|>")
+
     def __init__(self, pretrained: str = "Qwen/Qwen2.5-Coder-3B-Instruct", device: str = "cpu"):
         """
         Generator for Qwen2.5-Coder-3B-Instruct.
@@ -27,7 +31,7 @@ class Qwen2_5CoderGenerator(GeneratorBase):
             self.tokenizer = AutoTokenizer.from_pretrained(self.pretrained, trust_remote_code=True)
             self.model = AutoModelForCausalLM.from_pretrained(
                 self.pretrained,
-                torch_dtype=torch.float16 if self.device != "cpu" else torch.float32,
+                torch_dtype=self.load_dtype(torch.float16 if self.device != "cpu" else torch.float32),
                 device_map="auto" if self.device != "cpu" else None,
             )
             self.model.to(self.device)
@@ -48,46 +52,54 @@ class Qwen2_5CoderGenerator(GeneratorBase):
 
     def generate(self, query: str, parameters: dict = None) -> str:
         """
-        Generate text using Qwen2.5-Coder.
+        Generate text using Qwen2.5-Coder. With a `suffix`, the query is the prefix of a
+        fill-in-the-middle prompt, which is sent without the chat template.
         """
         if self.tokenizer is None or self.model is None:
             raise RuntimeError("Model and tokenizer must be loaded before generation.")
 
         try:
-            # Prepare the input message for the Qwen chat template
-            messages = [
-                {"role": "system", "content": "You are Qwen, created by Alibaba Cloud. You are a helpful assistant."},
-                {"role": "user", "content": query},
-            ]
+            # Merge default and provided parameters
+            params = {**self.default_parameters, **(parameters or {})}
+            fim = params.get("suffix") is not None
 
-            # Apply the chat template and tokenize
-            text = self.tokenizer.apply_chat_template(
-                messages,
-                tokenize=False,
-                add_generation_prompt=True
-            )
+            with timed(STAGE_SECONDS, model=self.name, stage="tokenize"):
+                if fim:
+                    input_ids, attention_mask = self.tokenize_fim(query, params["suffix"])
+                else:
+                    # Prepare the input message for the Qwen chat template
+                    messages = [
+                        {"role": "system", "content": "You are Qwen, created by Alibaba Cloud. You are a helpful assistant."},
+                        {"role": "user", "content": query},
+                    ]
 
-            model_inputs = self.tokenizer([text], return_tensors="pt").to(self.device)
+                    # Apply the chat template and tokenize
+                    text = self.tokenizer.apply_chat_template(
+                        messages,
+                        tokenize=False,
+                        add_generation_prompt=True
+                    )
 
-            # Merge default and provided parameters
-            params = {**self.default_parameters, **(parameters or {})}
+                    model_inputs = self.tokenizer([text], return_tensors="pt").to(self.device)
+                    input_ids, attention_mask = model_inputs.input_ids, model_inputs.attention_mask
 
             # Generate text
-            output_ids = self.model.generate(
-                **model_inputs,
-                max_new_tokens=params.get("max_new_tokens", 512),
-                temperature=params.get("temperature", 0.8),
-                top_p=params.get("top_p", 0.9),
-                do_sample=params.get("do_sample", True),
-            )
-
-            # Extract and decode the generated output
-            generated_ids = [
-                output_ids[len(input_ids):] for input_ids, output_ids in zip(model_inputs.input_ids, output_ids)
-            ]
-            output_text = self.tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
+            generation_params = {
+                "max_new_tokens": params.get("max_new_tokens", 512),
+                "temperature": params.get("temperature", 0.8),
+                "top_p": params.get("top_p", 0.9),
+                "do_sample": params.get("do_sample", True),
+                "pad_token_id": params.get("pad_token_id"),
+                **self.passthrough_parameters(params),
+            }
+            if fim:
+                generation_params["eos_token_id"] = self.fim_eos_token_ids()
+            generation_params = self.with_completion_stop(query, input_ids[0], generation_params)
+            output_ids = self.generate_ids(input_ids, attention_mask, generation_params)
 
-            return output_text
+            # Decode the generated output
+            with timed(STAGE_SECONDS, model=self.name, stage="detokenize"):
+                return self.decode_completion(query, input_ids[0], output_ids, generation_params)
         except Exception as e:
             logger.error(f"Error during text generation: {e}")
             raise RuntimeError("Text generation failed.")
@@ -0,0 +1,389 @@
+import asyncio
+import atexit
+import itertools
+import json
+import multiprocessing
+import os
+import pickle
+from concurrent.futures import Future
+from threading import Lock, Thread
+from typing import Callable, Dict, Optional, Set
+
+from mai.crosscutting.logging import get_logger
+from mai.inference.cancellation import CancellationToken
+from mai.inference.scheduling import RequestSchedule, current_schedule, set_schedule
+from mai.inference.usage import TokenUsage
+
+logger = get_logger()
+
+# How often a caller waiting on a worker checks whether its request was cancelled
+CANCEL_POLL_SECONDS = 0.05
+
+# Seconds a worker gets to stop after being asked to before it is terminated
+WORKER_STOP_TIMEOUT = 10
+
+# Set when the interpreter exits, before multiprocessing terminates the daemon worker processes
+_exiting = False
+
+
+def _mark_exiting():
+    global _exiting
+    _exiting = True
+
+
+def parse_cores(cores) -> Optional[Set[int]]:
+    """
+    Parse a CPU list such as "0-7,16-23" or [0, 1, 2] into a set of core IDs.
+    """
+    if cores is None or cores == "":
+        return None
+    if isinstance(cores, (list, tuple)):
+        return {int(core) for core in cores}
+    parsed = set()
+    for part in str(cores).split(","):
+        first, _, last = part.strip().partition("-")
+        parsed.update(range(int(first), int(last or first) + 1))
+    return parsed
+
+
+def load_worker_configs(path: Optional[str]) -> Dict[str, Dict]:
+    """
+    Read per-model worker settings from a JSON file mapping generator names to objects with
+    optional "cores", "threads", "concurrency" and "queue_size" keys.
+    """
+    if not path:
+        return {}
+    with open(path) as f:
+        configs = json.load(f)
+    allowed = {"cores", "threads", "concurrency", "queue_size"}
+    for name, config in configs.items():
+        unknown = set(config) - allowed
+        if unknown:
+            raise ValueError(f"Unknown worker settings for '{name}': {', '.join(sorted(unknown))}.")
+    return configs
+
+
+class RelayedCancellationToken(CancellationToken):
+    """
+    Cancellation token of a request running in a worker. The skipped tokens are reported
+    back with the result and recorded by the front end's token instead of in the worker.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.tokens_saved: Optional[int] = None
+
+    def record(self, tokens_saved: int):
+        if self.tokens_saved is None:
+            self.tokens_saved = tokens_saved
+
+
+class RemoteCall:
+    __slots__ = ("future", "streamer", "tokens_saved", "usage")
+
+    def __init__(self, streamer=None):
+        self.future = Future()
+        self.streamer = streamer
+        self.tokens_saved: Optional[int] = None
+        self.usage: Optional[TokenUsage] = None
+
+
+class RemoteGenerator:
+    """
+    Front-end proxy for a generator running in its own worker process.
+
+    The worker loads the generator with the usual precision, serving mode and warm-up
+    settings, pins itself to `cores` with `threads` torch threads, and runs requests on
+    its own inference executor limited to `concurrency` running and `queue_size` waiting
+    requests. Requests and results travel over a pipe. Streamed text is relayed as it is
+    decoded, token usage is copied back with the result, and cancelling a request's token
+    cancels its generation in the worker.
+    """
+
+    def __init__(self, name: str, config: Optional[Dict] = None):
+        config = config or {}
+        self.name = name
+        self.cores = parse_cores(config.get("cores"))
+        self.threads = config.get("threads") or (len(self.cores) if self.cores else None)
+        self.max_concurrency = config.get("concurrency") or int(os.getenv("INFERENCE_WORKERS", "1"))
+        self.max_queue_size = config.get("queue_size", int(os.getenv("INFERENCE_QUEUE_SIZE", "8")))
+        self.precision = "fp32"
+        # Streamers only need a tokenizer to decode tokens, and the worker decodes them
+        self.tokenizer = None
+        self.prefix_cache = None
+        self.speculative_decoder = None
+        # Reported by the worker once the generator is loaded
+        self.supports_fim = False
+        self._memory_bytes = 0
+        self._process = None
+        self._connection = None
+        self._send_lock = Lock()
+        self._calls: Dict[int, RemoteCall] = {}
+        self._ids = itertools.count()
+        self._stopping = False
+        # Called with the reason when the worker process exits without being asked to
+        self.on_exit: Optional[Callable[[str], None]] = None
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def set_precision(self, precision: str):
+        self.precision = precision
+
+    def load(self):
+        """
+        Start the worker process and wait until it has loaded the generator.
+        """
+        context = multiprocessing.get_context("spawn")
+        connection, worker_connection = context.Pipe()
+        settings = {
+            "cores": sorted(self.cores) if self.cores else None,
+            "threads": self.threads,
+            "concurrency": self.max_concurrency,
+            "queue_size": self.max_queue_size,
+            "precision": self.precision,
+        }
+        self._process = context.Process(
+            target=run_worker, args=(self.name, settings, worker_connection), name=f"worker-{self.name}", daemon=True
+        )
+        self._process.start()
+        worker_connection.close()
+        # Registered after multiprocessing's own exit handler, so it runs first
+        atexit.unregister(_mark_exiting)
+        atexit.register(_mark_exiting)
+
+        try:
+            message = connection.recv()
+        except EOFError:
+            message = ("failed", f"Worker for '{self.name}' exited while loading.")
+        if message[0] == "failed":
+            self._process.join()
+            self._process = None
+            raise RuntimeError(message[1])
+
+        _, self._memory_bytes, self.supports_fim = message
+        self._connection = connection
+        self._stopping = False
+        Thread(target=self._receive, name=f"worker-{self.name}-receiver", daemon=True).start()
+        logger.info(f"Generator '{self.name}' runs in worker process {self._process.pid}.")
+
+    def unload(self):
+        """
+        Stop the worker process, releasing all of its memory.
+        """
+        if self._process is None:
+            return
+        self._stopping = True
+        try:
+            self._send(None)
+        except OSError:
+            pass
+        self._process.join(WORKER_STOP_TIMEOUT)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+        self._process = None
+
+    def apply_precision(self):
+        """
+        The worker applies the precision itself.
+        """
+
+    def memory_footprint(self) -> int:
+        return self._memory_bytes if self.alive else 0
+
+    def worker_info(self) -> Dict:
+        return {
+            "pid": self._process.pid if self.alive else None,
+            "cores": sorted(self.cores) if self.cores else None,
+            "threads": self.threads,
+            "concurrency": self.max_concurrency,
+            "queue_size": self.max_queue_size,
+        }
+
+    def generate(self, query: str, parameters: Dict = None) -> str:
+        parameters = dict(parameters or {})
+        streamer = parameters.pop("streamer", None)
+        token = parameters.pop("cancellation_token", None)
+        # The worker fills in its own copy of the usage, which is copied back into this one
+        usage = parameters.get("usage")
+        return self._call("generate", (query, parameters), {}, streamer=streamer, token=token, usage=usage)
+
+    def generate_embeddings(self, *args, **kwargs):
+        return self._call("generate_embeddings", args, kwargs)
+
+    def metrics_snapshot(self) -> dict:
+        """
+        The worker's metrics for this generator, answered right away rather than queued behind its generations.
+        """
+        from mai.crosscutting.metrics import metrics
+
+        return metrics.select(self._call("metrics_snapshot", (), {}), "model", self.name)
+
+    def _call(self, method: str, args: tuple, kwargs: Dict, streamer=None, token: Optional[CancellationToken] = None,
+              usage: Optional[TokenUsage] = None):
+        if not self.alive:
+            raise RuntimeError(f"Worker for '{self.name}' is not running.")
+
+        request_id = next(self._ids)
+        call = RemoteCall(streamer)
+        self._calls[request_id] = call
+        try:
+            # The worker's executor queues the call with the priority, deadline and tenant of the request
+            self._send(("call", request_id, method, args, kwargs, streamer is not None, current_schedule()))
+            cancel_sent = False
+            while True:
+                try:
+                    result = call.future.result(timeout=CANCEL_POLL_SECONDS)
+                    break
+                except TimeoutError:
+                    if token is not None and token.cancelled and not cancel_sent:
+                        self._send(("cancel", request_id, token.reason))
+                        cancel_sent = True
+        finally:
+            self._calls.pop(request_id, None)
+
+        if token is not None and token.cancelled:
+            token.record(call.tokens_saved or 0)
+        if usage is not None and call.usage is not None:
+            usage.update(call.usage)
+        return result
+
+    def _send(self, message):
+        with self._send_lock:
+            self._connection.send(message)
+
+    def _receive(self):
+        """
+        Hand results and streamed text from the worker to the waiting callers.
+        """
+        connection = self._connection
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                break
+            kind, request_id = message[0], message[1]
+            call = self._calls.get(request_id)
+            if call is None:
+                continue
+            if kind == "text":
+                if call.streamer is not None:
+                    call.streamer.on_finalized_text(message[2], stream_end=message[3])
+            elif kind == "result":
+                call.tokens_saved, call.usage = message[3], message[4]
+                call.future.set_result(message[2])
+            elif kind == "error":
+                call.future.set_exception(message[2])
+
+        for call in list(self._calls.values()):
+            if not call.future.done():
+                call.future.set_exception(RuntimeError(f"Worker for '{self.name}' exited."))
+        if self._stopping or _exiting:
+            logger.info(f"Worker for '{self.name}' stopped.")
+            return
+        process = self._process
+        if process is not None:
+            process.join(WORKER_STOP_TIMEOUT)
+        reason = f"Worker for '{self.name}' exited unexpectedly (exit code {process.exitcode if process else None})."
+        logger.error(reason)
+        if self.on_exit is not None:
+            self.on_exit(reason)
+
+
+def run_worker(name: str, settings: Dict, connection):
+    """
+    Entry point of a worker process: load one generator and serve requests from the pipe.
+    """
+    # The worker hosts the generator itself rather than another layer of workers
+    os.environ["MODEL_DISPATCH"] = "false"
+    os.environ["MAI_PROCESS_NAME"] = f"worker-{name}"
+    os.environ["INFERENCE_WORKERS"] = str(settings["concurrency"])
+    os.environ["INFERENCE_QUEUE_SIZE"] = str(settings["queue_size"])
+    overrides = f"{name}={settings['precision']}"
+    os.environ["MODEL_PRECISION_OVERRIDES"] = ",".join(filter(None, [os.getenv("MODEL_PRECISION_OVERRIDES"), overrides]))
+    if settings["cores"]:
+        os.sched_setaffinity(0, settings["cores"])
+
+    import torch
+    from mai.generators.generator_manager import GeneratorManager
+
+    if settings["threads"]:
+        torch.set_num_threads(settings["threads"])
+
+    send_lock = Lock()
+
+    def send(message):
+        try:
+            payload = pickle.dumps(message)
+        except Exception:
+            # Errors that cannot be pickled are sent as their message
+            payload = pickle.dumps(message[:2] + (RuntimeError(str(message[2])),))
+        with send_lock:
+            connection.send_bytes(payload)
+
+    manager = GeneratorManager()
+    manager.register_all()
+    try:
+        manager.load(name)
+    except Exception as e:
+        connection.send(("failed", f"Failed to load generator '{name}' in its worker: {e}"))
+        return
+    generator = manager.generators[name]["generator"]
+    connection.send(("ready", generator.memory_footprint(), generator.supports_fim))
+
+    asyncio.run(serve_worker(generator, manager.get_executor(name), connection, send))
+
+
+async def serve_worker(generator, executor, connection, send: Callable):
+    """
+    Receive calls until the front end closes the pipe, running each on the worker's executor.
+    """
+    from mai.crosscutting.metrics import metrics
+    from mai.inference.streaming import RelayTextStreamer
+
+    loop = asyncio.get_running_loop()
+    tokens: Dict[int, RelayedCancellationToken] = {}
+    running = set()
+
+    async def handle(request_id: int, method: str, args: tuple, kwargs: Dict, stream: bool, schedule: RequestSchedule):
+        set_schedule(schedule)
+        try:
+            if method == "generate":
+                query, parameters = args
+                token = tokens[request_id] = RelayedCancellationToken()
+                parameters = {**parameters, "cancellation_token": token}
+                if stream:
+                    parameters["streamer"] = RelayTextStreamer(
+                        generator.tokenizer, lambda text, end: send(("text", request_id, text, end))
+                    )
+                value = await executor.run(generator.generate, query, parameters)
+                send(("result", request_id, value, token.tokens_saved, parameters.get("usage")))
+            elif method == "generate_embeddings":
+                value = await executor.run(generator.generate_embeddings, *args, **kwargs)
+                send(("result", request_id, value, None, None))
+            elif method == "metrics_snapshot":
+                send(("result", request_id, metrics.snapshot(), None, None))
+            else:
+                raise ValueError(f"Unknown worker method '{method}'.")
+        except Exception as e:
+            send(("error", request_id, e))
+        finally:
+            tokens.pop(request_id, None)
+
+    while True:
+        try:
+            message = await loop.run_in_executor(None, connection.recv)
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+        if message[0] == "call":
+            task = asyncio.ensure_future(handle(*message[1:]))
+            running.add(task)
+            task.add_done_callback(running.discard)
+        elif message[0] == "cancel" and message[1] in tokens:
+            tokens[message[1]].cancel(message[2])
+
+    executor.shutdown()
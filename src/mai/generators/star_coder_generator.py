@@ -2,10 +2,14 @@ import torch
 from transformers import pipeline, GenerationConfig
 from mai.generators.generator_base import GeneratorBase
 from mai.crosscutting.logging import get_logger
+from mai.crosscutting.metrics import STAGE_SECONDS, timed
 
 logger = get_logger()
 
 class StarCoderGenerator(GeneratorBase):
+    fim_tokens = ("<fim_prefix>", "<fim_suffix>", "<fim_middle>")
+    fim_stop_tokens = ("<fim_pad>", "<file_sep>")
+
     def __init__(self, pretrained: str = "bigcode/starcoder", device: str = "cpu", device_map: str = None):
         """
         Generator for StarCoder.
@@ -24,11 +28,15 @@ class StarCoderGenerator(GeneratorBase):
             self.pipe = pipeline(
                 "text-generation",
                 model=self.pretrained,
-                torch_dtype=torch.bfloat16 if self.device != "cpu" else torch.float32,
+                torch_dtype=self.load_dtype(torch.bfloat16 if self.device != "cpu" else torch.float32),
                 device=self.device if self.device != "cpu" else -1,  # Adjust for CPUs
                 device_map=self.device_map,
             )
 
+            # Generation runs through the shared path on the pipeline's model and tokenizer
+            self.tokenizer = self.pipe.tokenizer
+            self.model = self.pipe.model
+
             # Load generation configuration
             self.generation_config = GenerationConfig.from_pretrained(self.pretrained)
             self.generation_config.pad_token_id = self.pipe.tokenizer.pad_token_id or self.pipe.tokenizer.eos_token_id
@@ -44,17 +52,28 @@ class StarCoderGenerator(GeneratorBase):
             logger.error(f"Failed to load StarCoderGenerator: {e}")
             raise RuntimeError("Failed to initialize StarCoderGenerator.")
 
+    def unload(self):
+        """
+        Release the pipeline along with its model and tokenizer.
+        """
+        self.pipe = None
+        super().unload()
+
     def generate(self, query: str, parameters: dict = None) -> str:
         """
-        Generate text using the StarCoder pipeline.
+        Generate text using the StarCoder pipeline's model and generation configuration.
         """
         if not self.pipe or not self.generation_config:
             raise RuntimeError("Model and configuration must be loaded before generating text.")
 
         try:
-            # Merge default and provided parameters
-            config_dict = {**self.generation_config.to_dict(), **(parameters or {})}
+            # Merge default and provided parameters, keeping per-request objects out of the config
+            passthrough = self.passthrough_parameters(parameters)
+            parameters = {k: v for k, v in (parameters or {}).items() if k not in passthrough}
+            config_dict = {**self.generation_config.to_dict(), **parameters}
             config_dict = self.filter_parameters(config_dict)
+            if passthrough.get("suffix") is not None:
+                config_dict["eos_token_id"] = self.fim_eos_token_ids()
 
             # Validate `do_sample` and dependent parameters
             if not config_dict.get("do_sample", True):
@@ -67,10 +86,14 @@ class StarCoderGenerator(GeneratorBase):
             config = GenerationConfig.from_dict(config_dict)
 
             # Generate text
-            json_response = self.pipe(query, generation_config=config)[0]
-            generated_text = json_response["generated_text"]
+            with timed(STAGE_SECONDS, model=self.name, stage="tokenize"):
+                input_ids, attention_mask = self.tokenize_prompt(query, {**parameters, **passthrough})
+            prompt_ids = input_ids[0][attention_mask[0].bool()]
+            passthrough = self.with_completion_stop(query, prompt_ids, passthrough)
+            output_ids = self.generate_ids(input_ids, attention_mask, {"generation_config": config, **passthrough})
 
-            return generated_text
+            with timed(STAGE_SECONDS, model=self.name, stage="detokenize"):
+                return self.decode_completion(query, prompt_ids, output_ids, passthrough)
         except Exception as e:
             logger.error(f"Error during text generation: {e}")
             raise RuntimeError("Text generation failed.")
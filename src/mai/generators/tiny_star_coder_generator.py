@@ -1,6 +1,6 @@
 import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM
-from typing import Dict
+from typing import Dict, Tuple
 
 from mai.generators.generator_base import GeneratorBase
 from mai.crosscutting.logging import get_logger
@@ -8,6 +8,9 @@ from mai.crosscutting.logging import get_logger
 logger = get_logger()
 
 class TinyStarCoderGenerator(GeneratorBase):
+    fim_tokens = ("<fim_prefix>", "<fim_suffix>", "<fim_middle>")
+    fim_stop_tokens = ("<fim_pad>", "<file_sep>")
+
     def __init__(self, pretrained: str = "bigcode/tiny_starcoder_py", device: str = "cpu"):
         """
         TinyStarCoderGenerator: Specific generator for TinyStarCoder.
@@ -26,7 +29,7 @@ class TinyStarCoderGenerator(GeneratorBase):
         Load the tokenizer and model with specific configurations for TinyStarCoder.
         """
         self.tokenizer = AutoTokenizer.from_pretrained(self.pretrained, trust_remote_code=True)
-        self.model = AutoModelForCausalLM.from_pretrained(self.pretrained, low_cpu_mem_usage=True, torch_dtype=torch.float32)
+        self.model = AutoModelForCausalLM.from_pretrained(self.pretrained, low_cpu_mem_usage=True, torch_dtype=self.load_dtype())
         self.model.to(device=self.device)
 
         # Set pad token if not defined
@@ -44,14 +47,10 @@ class TinyStarCoderGenerator(GeneratorBase):
             f"  - Tokenizer PAD Token ID: {self.default_parameters['pad_token_id']}\n"
         )
     
-    def generate(self, query: str, parameters: Dict = None) -> str:
+    def tokenize(self, query: str, parameters: Dict) -> Tuple[torch.Tensor, torch.Tensor]:
         """
-        Generate text using the base implementation, ensuring attention_mask is passed.
+        Tokenize the query, truncating it to the model's supported prompt length.
         """
-        if self.tokenizer is None or self.model is None:
-            raise ValueError("Model and tokenizer must be loaded before generation.")
-
-        # Tokenize input and create attention mask 
         tokenized_inputs = self.tokenizer(
             query,
             return_tensors="pt",
@@ -61,11 +60,4 @@ class TinyStarCoderGenerator(GeneratorBase):
         )
         input_ids = tokenized_inputs["input_ids"].to(self.device)
         attention_mask = tokenized_inputs["attention_mask"].to(self.device)
-
-        # Merge attention_mask into parameters
-        parameters = parameters or {}
-        parameters["attention_mask"] = attention_mask 
-
-        # Call the base class generate method
-        return super().generate(query=query, parameters=parameters) 
-
+        return input_ids, attention_mask
@@ -0,0 +1,175 @@
+import queue
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from threading import Lock, Thread
+from typing import Callable, Dict, List, Tuple
+
+import torch
+
+from mai.crosscutting.logging import get_logger
+
+logger = get_logger()
+
+# Parameters that may differ between requests sharing one batched `generate` call.
+BATCH_COMPATIBLE_PARAMETERS = {"max_new_tokens", "cancellation_token", "completion_stop", "generation_timing"}
+
+
+def batch_key(parameters: Dict) -> Tuple:
+    """
+    Key that groups requests whose generation parameters can share a batch.
+    """
+    return tuple(sorted(
+        (name, repr(value)) for name, value in parameters.items() if name not in BATCH_COMPATIBLE_PARAMETERS
+    ))
+
+
+def left_pad(sequences: List[torch.Tensor], pad_token_id: int) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Left-pad 1-D token ID tensors into a batch and build the matching attention mask.
+    """
+    max_length = max(sequence.shape[-1] for sequence in sequences)
+    input_ids = sequences[0].new_full((len(sequences), max_length), pad_token_id)
+    attention_mask = sequences[0].new_zeros((len(sequences), max_length))
+    for row, sequence in enumerate(sequences):
+        input_ids[row, max_length - sequence.shape[-1]:] = sequence
+        attention_mask[row, max_length - sequence.shape[-1]:] = 1
+    return input_ids, attention_mask
+
+
+class BatchRequest:
+    """
+    One tokenized prompt waiting to be batched.
+    """
+
+    def __init__(self, input_ids: torch.Tensor, parameters: Dict):
+        self.input_ids = input_ids
+        self.parameters = parameters
+        self.key = batch_key(parameters)
+        self.future = Future()
+
+
+class BatchingScheduler:
+    """
+    Collects generation requests that arrive within a short window and runs them
+    as a single batched call.
+
+    Requests are grouped by their generation parameters, so only compatible
+    requests share a batch. `run_batch` receives the prompts of one group and the
+    shared parameters, and must return each prompt followed by its generated IDs.
+    Outputs are cut back to each request's own `max_new_tokens`. Per-request
+    cancellation tokens and generation timings are passed as `cancellation_tokens`
+    and `generation_timings` lists, one per prompt.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        run_batch: Callable[[List[torch.Tensor], Dict], List[torch.Tensor]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10,
+    ):
+        self.name = name
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = Lock()
+        self._stopping = False
+
+    def submit(self, input_ids: torch.Tensor, parameters: Dict) -> Future:
+        """
+        Queue a 1-D tensor of prompt token IDs and return a future for its output IDs.
+        """
+        self._ensure_started()
+        request = BatchRequest(input_ids, parameters)
+        self._queue.put(request)
+        return request.future
+
+    def shutdown(self):
+        """
+        Stop the worker thread after the requests already queued have run.
+        """
+        self._queue.put(None)
+
+    def _ensure_started(self):
+        # The worker thread starts on first use so a scheduler can be created
+        # before the process forks.
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._loop, name=f"batching-{self.name}", daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> List[BatchRequest]:
+        """
+        Block for the first request, then gather more until the window closes or the batch is full.
+        """
+        request = self._queue.get()
+        if request is None:
+            self._stopping = True
+            return []
+        requests = [request]
+        deadline = time.monotonic() + self.max_wait
+        while len(requests) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                self._stopping = True
+                break
+            requests.append(request)
+        return requests
+
+    def _loop(self):
+        while not self._stopping:
+            groups = defaultdict(list)
+            for request in self._collect():
+                groups[request.key].append(request)
+            for group in groups.values():
+                self._run(group)
+
+    def _run(self, group: List[BatchRequest]):
+        requests = []
+        for request in group:
+            if not request.future.set_running_or_notify_cancel():
+                continue
+            token = request.parameters.get("cancellation_token")
+            if token is not None and token.cancelled:
+                # Cancelled while queued: answer with the bare prompt without spending compute on it
+                token.record(request.parameters.get("max_new_tokens") or 0)
+                request.future.set_result(request.input_ids)
+                continue
+            requests.append(request)
+        if not requests:
+            return
+
+        parameters = {
+            k: v for k, v in requests[0].parameters.items()
+            if k not in ("cancellation_token", "completion_stop", "generation_timing")
+        }
+        max_new_tokens = [request.parameters.get("max_new_tokens") for request in requests]
+        if all(value is not None for value in max_new_tokens):
+            parameters["max_new_tokens"] = max(max_new_tokens)
+        parameters["cancellation_tokens"] = [request.parameters.get("cancellation_token") for request in requests]
+        parameters["completion_stops"] = [request.parameters.get("completion_stop") for request in requests]
+        parameters["generation_timings"] = [request.parameters.get("generation_timing") for request in requests]
+
+        logger.debug(f"Running batch of {len(requests)} request(s) on '{self.name}'")
+        try:
+            outputs = self.run_batch([request.input_ids for request in requests], parameters)
+        except Exception as e:
+            logger.error(f"Batched generation failed on '{self.name}': {e}")
+            for request in requests:
+                request.future.set_exception(e)
+            return
+
+        for request, output in zip(requests, outputs):
+            limit = request.parameters.get("max_new_tokens")
+            if limit is not None:
+                output = output[:request.input_ids.shape[-1] + limit]
+            request.future.set_result(output)
@@ -0,0 +1,60 @@
+from threading import Event, Lock
+from typing import Dict, Optional
+
+
+class CancellationToken:
+    """
+    Flag shared between a request handler and the generation running for it.
+    """
+
+    def __init__(self):
+        self._event = Event()
+        self._recorded = False
+        self.reason: Optional[str] = None
+
+    def cancel(self, reason: str = "cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def record(self, tokens_saved: int):
+        """
+        Count this cancellation once in the process-wide statistics.
+        """
+        if not self._recorded:
+            self._recorded = True
+            cancellation_stats.record(self.reason, tokens_saved)
+
+
+class CancellationStats:
+    """
+    Process-wide counters of cancelled generations and the decode steps they skipped.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.cancelled_requests = 0
+        self.tokens_saved = 0
+        self.by_reason: Dict[str, int] = {}
+
+    def record(self, reason: Optional[str], tokens_saved: int):
+        with self._lock:
+            self.cancelled_requests += 1
+            self.tokens_saved += max(0, tokens_saved)
+            reason = reason or "cancelled"
+            self.by_reason[reason] = self.by_reason.get(reason, 0) + 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "cancelled_requests": self.cancelled_requests,
+                "tokens_saved": self.tokens_saved,
+                "by_reason": dict(self.by_reason),
+            }
+
+
+cancellation_stats = CancellationStats()
@@ -0,0 +1,290 @@
+import queue
+from concurrent.futures import Future
+from threading import Lock, Thread
+from typing import Dict, List, Optional
+
+import torch
+from transformers import PreTrainedModel
+
+from mai.crosscutting.logging import get_logger
+from mai.crosscutting.metrics import BATCH_SIZE
+from mai.inference.kv_cache import (
+    build_cache,
+    cache_layers,
+    concat_caches,
+    is_legacy_cache,
+    pad_cache_left,
+    select_cache_rows,
+    trim_cache_left,
+)
+
+logger = get_logger()
+
+
+def sample_next_token(logits: torch.Tensor, do_sample: bool, temperature: float, top_p: float) -> int:
+    """
+    Pick the next token from one row of logits using greedy or nucleus sampling.
+    """
+    if not do_sample or temperature <= 0:
+        return int(logits.argmax())
+
+    probs = torch.softmax(logits.float() / temperature, dim=-1)
+    if top_p < 1.0:
+        sorted_probs, sorted_ids = probs.sort(descending=True)
+        # Keep the smallest set of tokens whose cumulative probability reaches top_p
+        sorted_probs[(sorted_probs.cumsum(dim=-1) - sorted_probs) > top_p] = 0
+        return int(sorted_ids[torch.multinomial(sorted_probs, 1)])
+    return int(torch.multinomial(probs, 1))
+
+
+class DecodeSequence:
+    """
+    One request inside the continuous batching engine, with its own sampling settings.
+    """
+
+    def __init__(self, input_ids: torch.Tensor, parameters: Dict, eos_token_ids: set):
+        config = parameters.get("generation_config")
+        settings = {**(config.to_dict() if config is not None else {}), **parameters}
+
+        self.input_ids = input_ids
+        self.max_new_tokens = settings.get("max_new_tokens") or 20
+        self.do_sample = settings.get("do_sample", False)
+        self.temperature = settings["temperature"] if settings.get("temperature") is not None else 1.0
+        self.top_p = settings["top_p"] if settings.get("top_p") is not None else 1.0
+        eos_token_id = settings.get("eos_token_id")
+        if eos_token_id is None:
+            self.eos_token_ids = eos_token_ids
+        else:
+            self.eos_token_ids = {eos_token_id} if isinstance(eos_token_id, int) else set(eos_token_id)
+        self.streamer = parameters.get("streamer")
+        self.cancellation_token = parameters.get("cancellation_token")
+        self.stop = parameters.get("completion_stop")
+        self.timing = parameters.get("generation_timing")
+        self.generated: List[int] = []
+        self.future = Future()
+
+    def append(self, token_id: int):
+        if self.timing is not None and not self.generated:
+            self.timing.first_token()
+        if self.streamer is not None:
+            if not self.generated:
+                self.streamer.put(self.input_ids.cpu())
+            self.streamer.put(self.input_ids.new_tensor([token_id]).cpu())
+        self.generated.append(token_id)
+        if self.stop is not None:
+            self.stop.feed(self.generated[self.stop.consumed:])
+
+    def finish(self):
+        if self.cancelled:
+            self.cancellation_token.record(self.max_new_tokens - len(self.generated))
+        if self.streamer is not None:
+            self.streamer.end()
+        self.future.set_result(self.output_ids())
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancellation_token is not None and self.cancellation_token.cancelled
+
+    @property
+    def finished(self) -> bool:
+        return (
+            self.cancelled
+            or len(self.generated) >= self.max_new_tokens
+            or (bool(self.generated) and self.generated[-1] in self.eos_token_ids)
+            or (self.stop is not None and self.stop.stopped)
+        )
+
+    def output_ids(self) -> torch.Tensor:
+        return torch.cat([self.input_ids, self.input_ids.new_tensor(self.generated)])
+
+
+class ContinuousBatchingEngine:
+    """
+    Iteration-level batching: a single decode loop advances every active sequence
+    by one token per step.
+
+    New sequences are prefilled and merged into the running batch between decode
+    steps, and finished sequences are evicted right away, so a short completion
+    never waits for a long one. Each sequence owns a row of the batched KV cache
+    and keeps its own `max_new_tokens`, `temperature`, `top_p`, `do_sample`,
+    optional token `streamer`, optional `cancellation_token`, which evicts the
+    sequence at the next step, and optional `completion_stop`, which evicts it once
+    its completion reaches a stop string or the end of its line or block.
+    """
+
+    def __init__(self, name: str, model: PreTrainedModel, eos_token_ids: set, max_batch_size: int = 8):
+        self.name = name
+        self.model = model
+        self.eos_token_ids = eos_token_ids
+        self.max_batch_size = max(1, max_batch_size)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = Lock()
+        self._stopping = False
+
+        # Batched decode state, one row per active sequence
+        self._active: List[DecodeSequence] = []
+        self._cache = None
+        self._legacy_cache = False
+        self._attention_mask: Optional[torch.Tensor] = None
+        self._next_tokens: Optional[torch.Tensor] = None
+
+    @property
+    def device(self) -> torch.device:
+        return self.model.device
+
+    def submit(self, input_ids: torch.Tensor, parameters: Dict) -> Future:
+        """
+        Queue a 1-D tensor of prompt token IDs and return a future for the prompt plus new IDs.
+        """
+        self._ensure_started()
+        sequence = DecodeSequence(input_ids, parameters, self.eos_token_ids)
+        self._queue.put(sequence)
+        return sequence.future
+
+    def shutdown(self):
+        """
+        Stop the decode loop once it is idle, releasing its reference to the model.
+        """
+        self._queue.put(None)
+
+    def _ensure_started(self):
+        # The decode loop starts on first use so an engine can be created before the process forks.
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._loop, name=f"continuous-{self.name}", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            self._admit(block=not self._active)
+            if self._stopping and not self._active:
+                self._reset()
+                return
+            if not self._active:
+                continue
+            try:
+                with torch.inference_mode():
+                    self._step()
+            except Exception as e:
+                logger.error(f"Decode step failed on '{self.name}': {e}")
+                for sequence in self._active:
+                    sequence.future.set_exception(e)
+                self._reset()
+
+    def _admit(self, block: bool):
+        """
+        Prefill waiting sequences and merge them into the running batch.
+        """
+        while len(self._active) < self.max_batch_size:
+            try:
+                sequence = self._queue.get(block=block)
+            except queue.Empty:
+                return
+            if sequence is None:
+                self._stopping = True
+                return
+            block = False
+            if not sequence.future.set_running_or_notify_cancel():
+                continue
+            if sequence.cancelled:
+                sequence.finish()
+                continue
+            try:
+                with torch.inference_mode():
+                    self._prefill(sequence)
+            except Exception as e:
+                logger.error(f"Prefill failed on '{self.name}': {e}")
+                sequence.future.set_exception(e)
+
+    def _prefill(self, sequence: DecodeSequence):
+        input_ids = sequence.input_ids.to(self.device)[None, :]
+        outputs = self.model(input_ids, use_cache=True)
+        sequence.append(self._sample(outputs.logits[0, -1], sequence))
+        if sequence.finished:
+            sequence.finish()
+            return
+
+        self._legacy_cache = is_legacy_cache(outputs.past_key_values)
+        layers = cache_layers(outputs.past_key_values)
+        attention_mask = torch.ones_like(input_ids)
+        next_token = input_ids.new_tensor([sequence.generated[-1]])
+
+        if not self._active:
+            self._cache, self._attention_mask, self._next_tokens = layers, attention_mask, next_token
+        else:
+            length = max(self._attention_mask.shape[-1], attention_mask.shape[-1])
+            self._cache = concat_caches([pad_cache_left(self._cache, length), pad_cache_left(layers, length)])
+            self._attention_mask = torch.cat([
+                self._pad_mask(self._attention_mask, length), self._pad_mask(attention_mask, length)
+            ])
+            self._next_tokens = torch.cat([self._next_tokens, next_token])
+        self._active.append(sequence)
+
+    def _step(self):
+        """
+        Advance every active sequence by one token and evict the finished ones.
+        """
+        BATCH_SIZE.observe(len(self._active), model=self.name, mode="continuous")
+        attention_mask = torch.cat([self._attention_mask, self._attention_mask.new_ones((len(self._active), 1))], dim=-1)
+        position_ids = (attention_mask.sum(dim=-1, keepdim=True) - 1)
+        outputs = self.model(
+            self._next_tokens[:, None],
+            past_key_values=build_cache(self._cache, legacy=self._legacy_cache),
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            use_cache=True,
+        )
+        self._cache = cache_layers(outputs.past_key_values)
+        self._attention_mask = attention_mask
+
+        next_tokens = []
+        for row, sequence in enumerate(self._active):
+            token_id = self._sample(outputs.logits[row, -1], sequence)
+            sequence.append(token_id)
+            next_tokens.append(token_id)
+        self._next_tokens = self._next_tokens.new_tensor(next_tokens)
+        self._evict_finished()
+
+    def _evict_finished(self):
+        keep = []
+        for row, sequence in enumerate(self._active):
+            if sequence.finished:
+                sequence.finish()
+            else:
+                keep.append(row)
+
+        if len(keep) == len(self._active):
+            return
+        if not keep:
+            self._reset()
+            return
+
+        rows = torch.tensor(keep, device=self._attention_mask.device)
+        self._active = [self._active[row] for row in keep]
+        self._cache = select_cache_rows(self._cache, rows)
+        self._attention_mask = self._attention_mask.index_select(0, rows)
+        self._next_tokens = self._next_tokens.index_select(0, rows)
+
+        # Drop leading columns that are padding for every remaining row
+        leading_padding = int((self._attention_mask.sum(dim=0) == 0).int().cumprod(dim=0).sum())
+        if leading_padding:
+            self._cache = trim_cache_left(self._cache, leading_padding)
+            self._attention_mask = self._attention_mask[:, leading_padding:]
+
+    def _reset(self):
+        self._active = []
+        self._cache = None
+        self._attention_mask = None
+        self._next_tokens = None
+
+    @staticmethod
+    def _sample(logits: torch.Tensor, sequence: DecodeSequence) -> int:
+        return sample_next_token(logits, sequence.do_sample, sequence.temperature, sequence.top_p)
+
+    @staticmethod
+    def _pad_mask(attention_mask: torch.Tensor, length: int) -> torch.Tensor:
+        missing = length - attention_mask.shape[-1]
+        if missing <= 0:
+            return attention_mask
+        return torch.cat([attention_mask.new_zeros((attention_mask.shape[0], missing)), attention_mask], dim=-1)
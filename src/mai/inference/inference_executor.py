@@ -0,0 +1,301 @@
+import asyncio
+import contextvars
+import functools
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from threading import Condition, Thread
+from typing import Callable, Deque, Dict, List, Optional
+
+from mai.crosscutting.logging import get_logger
+from mai.crosscutting.metrics import QUEUE_WAIT_SECONDS
+from mai.inference.scheduling import PRIORITIES, RequestSchedule, current_schedule
+
+logger = get_logger()
+
+
+class InferenceQueueFullError(RuntimeError):
+    """
+    Raised when an inference executor cannot accept more work.
+    """
+
+
+class InferenceDeadlineExceededError(RuntimeError):
+    """
+    Raised for a request whose deadline passed before a worker could start it.
+    """
+
+
+class ScheduledCall:
+    __slots__ = ("fn", "schedule", "future", "enqueued")
+
+    def __init__(self, fn: Callable, schedule: RequestSchedule):
+        # Run in a copy of the submitting context, so the call still sees the request's schedule
+        self.fn = functools.partial(contextvars.copy_context().run, fn)
+        self.schedule = schedule
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+    def fail(self, error: Exception):
+        """
+        Fail the call without running it, unless its caller already cancelled it.
+        """
+        if self.future.set_running_or_notify_cancel():
+            self.future.set_exception(error)
+
+
+class PriorityStats:
+    """
+    Queue counters of one priority class. Updated under the executor's lock.
+    """
+
+    def __init__(self):
+        self.queued = 0
+        self.running = 0
+        self.started = 0
+        self.expired = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def stats(self, oldest_enqueued: Optional[float]) -> Dict:
+        return {
+            "queued": self.queued,
+            "running": self.running,
+            "started": self.started,
+            "expired": self.expired,
+            "rejected": self.rejected,
+            "mean_wait_ms": round(self.wait_seconds / self.started * 1000, 1) if self.started else 0.0,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 1),
+            "oldest_waiting_ms": round((time.monotonic() - oldest_enqueued) * 1000, 1) if oldest_enqueued else None,
+        }
+
+
+class InferenceExecutor:
+    """
+    Bounded, prioritised thread pool that runs blocking inference calls off the event loop.
+
+    At most `max_workers` calls run at the same time and at most `max_queue_size`
+    more wait for a free worker. Anything beyond that is rejected immediately with
+    `InferenceQueueFullError` instead of piling up behind the running requests,
+    unless queued calls past their deadline free a slot, or a queued call of a less
+    urgent priority class can be rejected instead, or, within the same class, the newest
+    call of a tenant holding more of the queue than the submitting one.
+
+    Each call is scheduled by the `RequestSchedule` of the context submitting it. Free
+    workers take calls of the most urgent priority class first and, within a class,
+    take turns between tenants so that one tenant's burst cannot hold up the others.
+    Calls whose deadline passes while they wait fail with `InferenceDeadlineExceededError`
+    without running.
+    """
+
+    def __init__(self, name: str, max_workers: int = 1, max_queue_size: int = 8, record_queue_wait: bool = True):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue_size = max(0, max_queue_size)
+        self.record_queue_wait = record_queue_wait
+        self._condition = Condition()
+        # Waiting calls per priority class, in FIFO queues per tenant. Tenants rotate to the end once served.
+        self._queues: Dict[str, "OrderedDict[Optional[str], Deque[ScheduledCall]]"] = {
+            priority: OrderedDict() for priority in PRIORITIES
+        }
+        self._stats = {priority: PriorityStats() for priority in PRIORITIES}
+        self._threads: List[Thread] = []
+        self._pending = 0
+        self._shutdown = False
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of calls either running or waiting for a worker.
+        """
+        return self._pending
+
+    def submit(self, fn: Callable, *args, **kwargs) -> asyncio.Future:
+        """
+        Schedule `fn(*args, **kwargs)` on the pool and return an awaitable future.
+        Raises `InferenceQueueFullError` right away when the queue is full.
+        """
+        call = ScheduledCall(functools.partial(fn, *args, **kwargs), current_schedule())
+        priority = call.schedule.priority
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError(f"Inference executor for '{self.name}' is shut down.")
+            if call.schedule.expired():
+                self._stats[priority].expired += 1
+                raise InferenceDeadlineExceededError(f"Request for '{self.name}' reached its deadline before it was queued.")
+            if self._pending >= self.max_workers + self.max_queue_size:
+                self._purge_expired()
+            if self._pending >= self.max_workers + self.max_queue_size:
+                displaced = self._displace(priority, call.schedule.tenant)
+                if displaced is None:
+                    self._stats[priority].rejected += 1
+                    raise InferenceQueueFullError(
+                        f"Inference queue for '{self.name}' is full ({self._pending} requests pending)."
+                    )
+                reason = "a more urgent one" if displaced.schedule.priority != priority else "another tenant's"
+                displaced.fail(InferenceQueueFullError(
+                    f"Inference queue for '{self.name}' is full; request displaced by {reason}."
+                ))
+            self._queues[priority].setdefault(call.schedule.tenant, deque()).append(call)
+            self._stats[priority].queued += 1
+            self._pending += 1
+            self._start_workers()
+            self._condition.notify()
+        return asyncio.wrap_future(call.future)
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """
+        Run `fn(*args, **kwargs)` on the pool and await its result.
+        """
+        return await self.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = False):
+        """
+        Stop accepting work, cancel queued calls and release the worker threads.
+        """
+        with self._condition:
+            self._shutdown = True
+            for priority, tenants in self._queues.items():
+                for queue in tenants.values():
+                    for call in queue:
+                        call.future.cancel()
+                        self._stats[priority].queued -= 1
+                        self._pending -= 1
+                tenants.clear()
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def stats(self) -> Dict:
+        """
+        Queue length, running calls and queue wait times per priority class.
+        """
+        with self._condition:
+            return {
+                priority: self._stats[priority].stats(
+                    min((queue[0].enqueued for queue in self._queues[priority].values()), default=None)
+                )
+                for priority in PRIORITIES
+            }
+
+    def _start_workers(self):
+        # Threads start with the first call rather than in the constructor, so executors can be created before forking
+        while len(self._threads) < self.max_workers:
+            thread = Thread(target=self._work, name=f"inference-{self.name}-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _purge_expired(self):
+        """
+        Fail the queued calls whose deadline has passed, freeing their slots.
+        """
+        now = time.monotonic()
+        for priority, tenants in self._queues.items():
+            for tenant in list(tenants):
+                queue = tenants[tenant]
+                expired = [call for call in queue if call.schedule.expired(now)]
+                for call in expired:
+                    queue.remove(call)
+                    call.fail(InferenceDeadlineExceededError(
+                        f"Request for '{self.name}' reached its deadline after waiting {now - call.enqueued:.2f}s in the queue."
+                    ))
+                if not queue:
+                    del tenants[tenant]
+                self._stats[priority].queued -= len(expired)
+                self._stats[priority].expired += len(expired)
+                self._pending -= len(expired)
+
+    def _displace(self, priority: str, tenant: Optional[str]) -> Optional[ScheduledCall]:
+        """
+        Remove and return the newest queued call of the least urgent class less urgent than `priority`,
+        else of the tenant with the most calls queued in `priority` if it has at least two more than `tenant`.
+        """
+        for lower in reversed(PRIORITIES[PRIORITIES.index(priority) + 1:]):
+            tenants = self._queues[lower]
+            if tenants:
+                # The tenant with the most queued calls gives one up
+                return self._pop_newest(lower, max(tenants, key=lambda key: len(tenants[key])))
+        tenants = self._queues[priority]
+        if tenants:
+            largest = max(tenants, key=lambda key: len(tenants[key]))
+            if len(tenants[largest]) > len(tenants.get(tenant, ())) + 1:
+                return self._pop_newest(priority, largest)
+        return None
+
+    def _pop_newest(self, priority: str, tenant: Optional[str]) -> ScheduledCall:
+        tenants = self._queues[priority]
+        call = tenants[tenant].pop()
+        if not tenants[tenant]:
+            del tenants[tenant]
+        self._stats[priority].queued -= 1
+        self._stats[priority].rejected += 1
+        self._pending -= 1
+        return call
+
+    def _next_call(self) -> Optional[ScheduledCall]:
+        for priority in PRIORITIES:
+            tenants = self._queues[priority]
+            if tenants:
+                tenant, queue = tenants.popitem(last=False)
+                call = queue.popleft()
+                if queue:
+                    tenants[tenant] = queue
+                self._stats[priority].queued -= 1
+                return call
+        return None
+
+    def _work(self):
+        while True:
+            with self._condition:
+                call = self._next_call()
+                while call is None:
+                    if self._shutdown:
+                        return
+                    self._condition.wait()
+                    call = self._next_call()
+            try:
+                self._run(call)
+            except Exception as e:
+                # A worker that died would never be replaced, leaving later calls waiting forever
+                logger.error(f"Inference worker for '{self.name}' failed to handle a call: {e}")
+
+    def _run(self, call: ScheduledCall):
+        stats = self._stats[call.schedule.priority]
+        with self._condition:
+            now = time.monotonic()
+            expired = call.schedule.expired(now)
+            if expired:
+                stats.expired += 1
+                self._pending -= 1
+            else:
+                waited = now - call.enqueued
+                stats.started += 1
+                stats.running += 1
+                stats.wait_seconds += waited
+                stats.max_wait_seconds = max(stats.max_wait_seconds, waited)
+
+        if expired:
+            logger.info(f"Dropping a {call.schedule.priority} request for '{self.name}' that reached its deadline in the queue.")
+            call.fail(InferenceDeadlineExceededError(
+                f"Request for '{self.name}' reached its deadline after waiting {now - call.enqueued:.2f}s in the queue."
+            ))
+            return
+
+        try:
+            if self.record_queue_wait:
+                QUEUE_WAIT_SECONDS.observe(waited, model=self.name, priority=call.schedule.priority)
+            if call.future.set_running_or_notify_cancel():
+                try:
+                    result = call.fn()
+                except BaseException as e:
+                    call.future.set_exception(e)
+                else:
+                    call.future.set_result(result)
+        finally:
+            # Release the slot when the work itself finishes, not when the caller stops
+            # waiting for it: a disconnected client does not stop a running generation.
+            with self._condition:
+                stats.running -= 1
+                self._pending -= 1
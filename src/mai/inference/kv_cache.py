@@ -0,0 +1,102 @@
+from typing import List, Sequence, Tuple
+
+import torch
+from transformers import DynamicCache
+
+# A model's KV cache as one tuple of tensors per layer. Every tensor has the batch
+# on dimension 0 and the sequence on dimension -2, which holds for the standard
+# (batch, heads, seq, head_dim) layout and for GPTBigCode's fused multi-query layout.
+CacheLayers = List[Tuple[torch.Tensor, ...]]
+
+
+def cache_layers(past_key_values) -> CacheLayers:
+    """
+    Extract per-layer tensors from a `Cache` object or a legacy tuple cache.
+    """
+    if hasattr(past_key_values, "layers"):
+        return [(layer.keys, layer.values) for layer in past_key_values.layers]
+    if hasattr(past_key_values, "key_cache"):
+        return list(zip(past_key_values.key_cache, past_key_values.value_cache))
+    return [tuple(layer) if isinstance(layer, (tuple, list)) else (layer,) for layer in past_key_values]
+
+
+def build_cache(layers: CacheLayers, legacy: bool = False):
+    """
+    Rebuild a cache the model accepts from per-layer tensors.
+    """
+    if legacy:
+        return tuple(layer if len(layer) > 1 else layer[0] for layer in layers)
+    cache = DynamicCache()
+    for layer_idx, (keys, values) in enumerate(layers):
+        cache.update(keys, values, layer_idx)
+    return cache
+
+
+def is_legacy_cache(past_key_values) -> bool:
+    """
+    Whether the model returned a tuple cache rather than a `Cache` object.
+    """
+    return isinstance(past_key_values, (tuple, list))
+
+
+def cache_length(layers: CacheLayers) -> int:
+    """
+    Number of positions held in the cache.
+    """
+    return layers[0][0].shape[-2] if layers else 0
+
+
+def cache_nbytes(layers: CacheLayers) -> int:
+    """
+    Memory held by the cache tensors.
+    """
+    return sum(tensor.numel() * tensor.element_size() for layer in layers for tensor in layer)
+
+
+def crop_cache(layers: CacheLayers, length: int) -> CacheLayers:
+    """
+    Keep the first `length` positions of the cache.
+    """
+    return [tuple(tensor[..., :length, :] for tensor in layer) for layer in layers]
+
+
+def trim_cache_left(layers: CacheLayers, count: int) -> CacheLayers:
+    """
+    Drop the first `count` positions of the cache.
+    """
+    return [tuple(tensor[..., count:, :] for tensor in layer) for layer in layers]
+
+
+def pad_cache_left(layers: CacheLayers, length: int) -> CacheLayers:
+    """
+    Left-pad the cache with zeros up to `length` positions.
+    """
+    missing = length - cache_length(layers)
+    if missing <= 0:
+        return layers
+    padded = []
+    for layer in layers:
+        padded_layer = []
+        for tensor in layer:
+            shape = list(tensor.shape)
+            shape[-2] = missing
+            padded_layer.append(torch.cat([tensor.new_zeros(shape), tensor], dim=-2))
+        padded.append(tuple(padded_layer))
+    return padded
+
+
+def concat_caches(caches: Sequence[CacheLayers]) -> CacheLayers:
+    """
+    Stack caches of equal length along the batch dimension.
+    """
+    return [
+        tuple(torch.cat(tensors, dim=0) for tensors in zip(*layer_group))
+        for layer_group in zip(*caches)
+    ]
+
+
+def select_cache_rows(layers: CacheLayers, rows: torch.Tensor) -> CacheLayers:
+    """
+    Keep only the given batch rows of the cache.
+    """
+    return [tuple(tensor.index_select(0, rows) for tensor in layer) for layer in layers]
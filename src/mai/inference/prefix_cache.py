@@ -0,0 +1,209 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from mai.inference.kv_cache import (
+    CacheLayers,
+    build_cache,
+    cache_layers,
+    cache_nbytes,
+    crop_cache,
+    is_legacy_cache,
+)
+
+
+def _common_prefix_length(a: Sequence[int], b: Sequence[int]) -> int:
+    length = min(len(a), len(b))
+    for i in range(length):
+        if a[i] != b[i]:
+            return i
+    return length
+
+
+class PrefixCacheNode:
+    """
+    Radix tree node. `tokens` labels the edge from the parent to this node.
+    """
+    __slots__ = ("tokens", "parent", "children", "entry")
+
+    def __init__(self, tokens: Tuple[int, ...], parent: Optional["PrefixCacheNode"]):
+        self.tokens = tokens
+        self.parent = parent
+        self.children: Dict[int, PrefixCacheNode] = {}
+        self.entry: Optional[PrefixCacheEntry] = None
+
+
+class PrefixCacheEntry:
+    """
+    KV cache for the token prefix spelled by the path from the root to `node`.
+    """
+    __slots__ = ("node", "layers", "legacy", "length", "nbytes", "last_used")
+
+    def __init__(self, node: PrefixCacheNode, layers: CacheLayers, legacy: bool, length: int):
+        self.node = node
+        self.layers = layers
+        self.legacy = legacy
+        self.length = length
+        self.nbytes = cache_nbytes(layers)
+        self.last_used = 0
+
+
+class PrefixCache:
+    """
+    Reuses prompt KV caches across requests that share a token prefix.
+
+    Caches are stored in a radix tree keyed by prompt token IDs and evicted in LRU
+    order once they exceed `max_bytes`. A lookup returns the longest cached prefix
+    of the new prompt, even when it only partly matches a stored prompt, so a
+    request that extends or slightly edits a previous prompt only prefills the
+    tokens the cache does not cover.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.root = PrefixCacheNode((), None)
+        self._entries: "OrderedDict[PrefixCacheNode, PrefixCacheEntry]" = OrderedDict()
+        self._lock = Lock()
+        self._clock = 0
+        self.bytes_held = 0
+        self.hits = 0
+        self.misses = 0
+        self.tokens_reused = 0
+
+    def lookup(self, token_ids: List[int]):
+        """
+        Return `(length, past_key_values)` for the longest cached prefix of `token_ids`,
+        or `(0, None)` on a miss. At least one token is always left for the model to process.
+        """
+        with self._lock:
+            node, matched = self._walk(token_ids)
+            usable = min(matched, len(token_ids) - 1)
+            entry = self._find_entry(node) if usable > 0 else None
+            if entry is None:
+                self.misses += 1
+                return 0, None
+
+            self._touch(entry)
+            self.hits += 1
+            self.tokens_reused += usable
+            layers = crop_cache(entry.layers, usable)
+            legacy = entry.legacy
+
+        # Build a fresh cache object so generation never mutates the stored tensors
+        return usable, build_cache(layers, legacy=legacy)
+
+    def insert(self, token_ids: List[int], past_key_values):
+        """
+        Store the KV cache of a prompt. `past_key_values` may cover more positions
+        than the prompt; it is cropped to the prompt length.
+        """
+        if not token_ids:
+            return
+        layers = crop_cache(cache_layers(past_key_values), len(token_ids))
+        # Copy so the entry does not keep the full generation cache alive
+        layers = [tuple(tensor.clone() for tensor in layer) for layer in layers]
+
+        with self._lock:
+            node = self._insert_path(token_ids)
+            if node.entry is not None:
+                self._remove(node.entry, prune=False)
+            entry = PrefixCacheEntry(node, layers, is_legacy_cache(past_key_values), len(token_ids))
+            if entry.nbytes > self.max_bytes:
+                self._prune(node)
+                return
+            node.entry = entry
+            self._entries[node] = entry
+            self._touch(entry)
+            self.bytes_held += entry.nbytes
+
+            while self.bytes_held > self.max_bytes:
+                oldest = next(iter(self._entries.values()))
+                self._remove(oldest)
+
+    def stats(self) -> Dict:
+        """
+        Hit and miss counts, reused tokens and memory held.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "tokens_reused": self.tokens_reused,
+                "bytes_held": self.bytes_held,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _walk(self, token_ids: List[int]) -> Tuple[PrefixCacheNode, int]:
+        """
+        Follow `token_ids` down the tree. Returns the deepest node reached and how
+        many tokens matched; every entry below that node shares those tokens.
+        """
+        node, matched = self.root, 0
+        while matched < len(token_ids):
+            child = node.children.get(token_ids[matched])
+            if child is None:
+                break
+            common = _common_prefix_length(child.tokens, token_ids[matched:matched + len(child.tokens)])
+            matched += common
+            node = child
+            if common < len(child.tokens):
+                break
+        return node, matched
+
+    def _find_entry(self, node: PrefixCacheNode) -> Optional[PrefixCacheEntry]:
+        """
+        Most recently used entry at or below `node`.
+        """
+        best = None
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current.entry is not None and (best is None or current.entry.last_used > best.last_used):
+                best = current.entry
+            stack.extend(current.children.values())
+        return best
+
+    def _touch(self, entry: PrefixCacheEntry):
+        self._clock += 1
+        entry.last_used = self._clock
+        self._entries.move_to_end(entry.node)
+
+    def _insert_path(self, token_ids: List[int]) -> PrefixCacheNode:
+        node, position = self.root, 0
+        while position < len(token_ids):
+            child = node.children.get(token_ids[position])
+            if child is None:
+                child = PrefixCacheNode(tuple(token_ids[position:]), node)
+                node.children[token_ids[position]] = child
+                return child
+
+            common = _common_prefix_length(child.tokens, token_ids[position:])
+            if common < len(child.tokens):
+                # Split the edge so the shared part gets its own node
+                middle = PrefixCacheNode(child.tokens[:common], node)
+                node.children[token_ids[position]] = middle
+                child.tokens = child.tokens[common:]
+                child.parent = middle
+                middle.children[child.tokens[0]] = child
+                child = middle
+            node, position = child, position + common
+        return node
+
+    def _remove(self, entry: PrefixCacheEntry, prune: bool = True):
+        del self._entries[entry.node]
+        entry.node.entry = None
+        self.bytes_held -= entry.nbytes
+        if prune:
+            self._prune(entry.node)
+
+    def _prune(self, node: PrefixCacheNode):
+        """
+        Remove empty leaves left behind by eviction.
+        """
+        while node.parent is not None and node.entry is None and not node.children:
+            parent = node.parent
+            del parent.children[node.tokens[0]]
+            node = parent
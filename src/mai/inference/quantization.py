@@ -0,0 +1,138 @@
+import json
+import os
+import warnings
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    import torch
+
+# Precisions a generator can be loaded in: full float32, bfloat16 weights and activations,
+# dynamic int8 quantization of the Linear layers, or weight-only int4 (needs torchao)
+PRECISIONS = ("fp32", "bf16", "int8", "int4")
+# Bytes per weight of the dtypes checkpoints are stored in
+DTYPE_BYTES = {"float32": 4, "float16": 2, "bfloat16": 2}
+# Bytes per weight `from_pretrained` loads each precision in, before quantizing; fp32 keeps the checkpoint's dtype
+LOAD_BYTES = {"bf16": 2, "int8": 4, "int4": 2}
+
+
+def validate_precision(precision: str) -> str:
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of: {', '.join(PRECISIONS)}.")
+    return precision
+
+
+def parse_precision_overrides(value: Optional[str]) -> Dict[str, str]:
+    """
+    Parse per-model precisions written as `name=precision,name=precision`.
+    """
+    overrides = {}
+    for item in filter(None, (part.strip() for part in (value or "").split(","))):
+        name, separator, precision = item.partition("=")
+        if not separator or not name.strip():
+            raise ValueError(f"Invalid model precision '{item}', expected NAME=PRECISION.")
+        overrides[name.strip()] = validate_precision(precision.strip())
+    return overrides
+
+
+def load_dtype(precision: str, default: Optional["torch.dtype"]) -> Optional["torch.dtype"]:
+    """
+    Dtype to load weights in: dynamic int8 quantization starts from float32 weights and
+    int4 weight-only quantization from bfloat16 ones. fp32 keeps `default`.
+    """
+    import torch
+
+    if precision in ("bf16", "int4"):
+        return torch.bfloat16
+    if precision == "int8":
+        return torch.float32
+    return default
+
+
+def quantize_model(model: "torch.nn.Module", precision: str) -> "torch.nn.Module":
+    """
+    Quantize a loaded model in place for CPU inference. fp32 and bf16 are applied at load time
+    and leave the model untouched here.
+    """
+    import torch
+
+    validate_precision(precision)
+    if precision == "int8":
+        # Weights are stored in int8 and activations quantized on the fly in every Linear layer.
+        # torch flags its quantized tensor APIs as deprecated; they still work, so keep the log quiet
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", message=".*deprecated")
+            torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    elif precision == "int4":
+        try:
+            from torchao.quantization import Int4WeightOnlyConfig, quantize_
+        except ImportError as e:
+            raise RuntimeError("int4 precision requires the optional 'torchao' package.") from e
+        quantize_(model, Int4WeightOnlyConfig())
+    return model
+
+
+def model_nbytes(model: "torch.nn.Module") -> int:
+    """
+    Bytes held by a model's weights and buffers, including the packed weights of quantized
+    layers, which are not parameters. Tensors shared between modules are counted once.
+    """
+    import torch
+
+    seen = set()
+    total = 0
+    pending = list(model.state_dict(keep_vars=True).values())
+    while pending:
+        value = pending.pop()
+        if isinstance(value, (tuple, list)):
+            pending.extend(value)
+        elif isinstance(value, torch.Tensor) and value.data_ptr() not in seen:
+            seen.add(value.data_ptr())
+            total += value.numel() * value.element_size()
+    return total
+
+
+def checkpoint_metadata(pretrained: str) -> Tuple[Dict[str, int], dict]:
+    """
+    Sizes of the top-level files of a checkpoint and its config, without loading it: from a
+    local directory, its snapshot in the Hugging Face cache, or else the Hub's file listing.
+    Returns no files when none of them can be reached.
+    """
+    directory = pretrained if os.path.isdir(pretrained) else None
+    if directory is None:
+        try:
+            from huggingface_hub import snapshot_download
+
+            directory = snapshot_download(pretrained, local_files_only=True)
+        except Exception:
+            directory = None
+    if directory is not None:
+        files = {entry.name: entry.stat().st_size for entry in os.scandir(directory) if entry.is_file()}
+        if any(name.endswith((".safetensors", ".bin")) for name in files):
+            config_path = os.path.join(directory, "config.json")
+            if not os.path.exists(config_path):
+                return files, {}
+            with open(config_path) as file:
+                return files, json.load(file)
+    try:
+        from huggingface_hub import HfApi, hf_hub_download
+
+        info = HfApi().model_info(pretrained, files_metadata=True)
+        files = {sibling.rfilename: sibling.size or 0 for sibling in info.siblings if "/" not in sibling.rfilename}
+        with open(hf_hub_download(pretrained, "config.json")) as file:
+            return files, json.load(file)
+    except Exception:
+        return {}, {}
+
+
+def estimate_load_nbytes(pretrained: str, precision: str) -> int:
+    """
+    Estimate the bytes loading a checkpoint in `precision` takes, before loading it: the size of
+    its weight files scaled from the dtype they are stored in to the one they are loaded in.
+    Returns 0 when the checkpoint's files cannot be found.
+    """
+    files, config = checkpoint_metadata(pretrained)
+    weights = [size for name, size in files.items() if name.endswith(".safetensors")]
+    if not weights:
+        weights = [size for name, size in files.items() if name.endswith(".bin")]
+    stored_bytes = DTYPE_BYTES.get(str(config.get("torch_dtype") or config.get("dtype")), 4)
+    return sum(weights) * LOAD_BYTES.get(validate_precision(precision), stored_bytes) // stored_bytes
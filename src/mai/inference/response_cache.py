@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+from mai.crosscutting.logging import get_logger
+
+logger = get_logger()
+
+# Parameters that never change the generated text (prompt lookup only changes how fast it is produced)
+NON_OUTPUT_PARAMETERS = {"streamer", "cancellation_token", "cache", "prompt_lookup", "usage"}
+
+
+def normalize_parameters(parameters: Dict) -> Dict:
+    """
+    Express greedy decoding the same way however it was requested:
+    `temperature` 0 means `do_sample=False`, and sampling-only settings are dropped.
+    """
+    params = dict(parameters or {})
+    if params.get("temperature") == 0:
+        params["do_sample"] = False
+    if params.get("do_sample") is False:
+        for name in ("temperature", "top_p", "top_k"):
+            params.pop(name, None)
+    return params
+
+
+def is_deterministic(parameters: Dict) -> bool:
+    return parameters.get("do_sample") is False
+
+
+class SqliteResponseStore:
+    """
+    On-disk copy of the response cache, so cached completions survive restarts.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, value TEXT, created REAL, compute_seconds REAL, usage TEXT)"
+            )
+            # Files written before token usage was stored lack its column
+            columns = {row[1] for row in self.connection.execute("PRAGMA table_info(responses)")}
+            if "usage" not in columns:
+                self.connection.execute("ALTER TABLE responses ADD COLUMN usage TEXT")
+
+    def get(self, key: str) -> Optional[Tuple[str, float, float, Optional[Dict]]]:
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT value, created, compute_seconds, usage FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], row[2], json.loads(row[3]) if row[3] else None
+
+    def put(self, key: str, value: str, created: float, compute_seconds: float, usage: Optional[Dict] = None):
+        with self._lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, compute_seconds, usage) VALUES (?, ?, ?, ?, ?)",
+                (key, value, created, compute_seconds, json.dumps(usage) if usage else None),
+            )
+
+    def delete_older_than(self, created: float):
+        with self._lock, self.connection:
+            self.connection.execute("DELETE FROM responses WHERE created < ?", (created,))
+
+    def reconnect(self):
+        """
+        Open a fresh connection. A forked process must not use the connection it inherited.
+        """
+        self._lock = Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+
+
+class ResponseCacheEntry:
+    __slots__ = ("value", "created", "compute_seconds", "usage", "nbytes")
+
+    def __init__(self, key: str, value: str, created: float, compute_seconds: float, usage: Optional[Dict] = None):
+        self.value = value
+        self.created = created
+        self.compute_seconds = compute_seconds
+        # Token usage of the generation that produced the value
+        self.usage = usage
+        self.nbytes = len(key) + len(value.encode("utf-8"))
+
+
+class ResponseCache:
+    """
+    Exact-match cache of generated text, keyed on the model, prompt and generation parameters.
+
+    Only deterministic requests are cached unless the caller opts in. Entries expire
+    after `ttl_seconds` and are evicted in LRU order once they hold more than `max_bytes`.
+    With `path`, entries are also written to a SQLite file and found there after a restart.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float = 3600, path: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.store = SqliteResponseStore(path) if path and max_bytes > 0 else None
+        self._entries: "OrderedDict[str, ResponseCacheEntry]" = OrderedDict()
+        self._lock = Lock()
+        self.bytes_held = 0
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        if self.store is not None:
+            self.store.delete_older_than(time.time() - ttl_seconds)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def key(self, model: str, prompt: str, parameters: Dict, opt_in: Optional[bool] = None) -> Optional[str]:
+        """
+        Cache key for a request, or None when it should not be cached. `opt_in` True caches
+        sampled requests too, False bypasses the cache, and None caches only deterministic ones.
+        """
+        if not self.enabled or opt_in is False:
+            return None
+        if not opt_in and not is_deterministic(parameters):
+            return None
+        params = {k: v for k, v in parameters.items() if k not in NON_OUTPUT_PARAMETERS}
+        payload = json.dumps({"model": model, "prompt": prompt, "parameters": params}, sort_keys=True, default=repr)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.lookup(key)
+        return entry.value if entry is not None else None
+
+    def lookup(self, key: str) -> Optional[ResponseCacheEntry]:
+        """
+        The unexpired entry for `key`, counting the lookup as a hit or a miss.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.created > self.ttl_seconds:
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is None and self.store is not None:
+            row = self.store.get(key)
+            if row is not None and now - row[1] <= self.ttl_seconds:
+                entry = ResponseCacheEntry(key, *row)
+                with self._lock:
+                    self._add(key, entry)
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.seconds_saved += entry.compute_seconds
+            return entry
+
+    def put(self, key: str, value: str, compute_seconds: float, usage: Optional[Dict] = None):
+        """
+        Store generated text along with how long it took to generate and its token usage.
+        """
+        entry = ResponseCacheEntry(key, value, time.time(), compute_seconds, usage)
+        if entry.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            self._add(key, entry)
+        if self.store is not None:
+            try:
+                self.store.put(key, value, entry.created, compute_seconds, usage)
+            except sqlite3.Error as e:
+                logger.warning(f"Could not write response cache entry to disk: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "seconds_saved": round(self.seconds_saved, 3),
+                "bytes_held": self.bytes_held,
+                "max_bytes": self.max_bytes,
+                "persistent": self.store is not None,
+            }
+
+    def _add(self, key: str, entry: ResponseCacheEntry):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self.bytes_held += entry.nbytes
+        while self.bytes_held > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        self.bytes_held -= self._entries.pop(key).nbytes
+
+
+response_cache = ResponseCache(
+    max_bytes=int(float(os.getenv("RESPONSE_CACHE_MB", "0")) * 1024 * 1024),
+    ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+    path=os.getenv("RESPONSE_CACHE_PATH") or None,
+)
+if response_cache.store is not None:
+    os.register_at_fork(after_in_child=response_cache.store.reconnect)
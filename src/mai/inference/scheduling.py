@@ -0,0 +1,61 @@
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+# Priority classes from most to least urgent. Executors always run queued requests of a more urgent class first.
+PRIORITIES = ("interactive", "normal", "bulk")
+
+
+def validate_priority(priority: str) -> str:
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority '{priority}', expected one of: {', '.join(PRIORITIES)}.")
+    return priority
+
+
+class RequestSchedule:
+    """
+    How inference executors order one request: its priority class, the monotonic time after
+    which it is no longer worth running, and the tenant whose fair share it counts against.
+    """
+
+    def __init__(self, priority: str = "normal", deadline: Optional[float] = None, tenant: Optional[str] = None,
+                 arrived: Optional[float] = None):
+        self.priority = validate_priority(priority)
+        self.deadline = deadline
+        self.tenant = tenant
+        self.arrived = arrived if arrived is not None else time.monotonic()
+
+    def with_deadline_ms(self, deadline_ms: Optional[float]) -> "RequestSchedule":
+        """
+        Copy of this schedule whose deadline is `deadline_ms` after the request arrived.
+        """
+        if deadline_ms is None:
+            return self
+        if deadline_ms <= 0:
+            raise ValueError("The deadline must be a positive number of milliseconds.")
+        return RequestSchedule(self.priority, self.arrived + deadline_ms / 1000, self.tenant, self.arrived)
+
+    def with_priority(self, priority: Optional[str]) -> "RequestSchedule":
+        if priority is None:
+            return self
+        return RequestSchedule(priority, self.deadline, self.tenant, self.arrived)
+
+    def expired(self, now: Optional[float] = None) -> bool:
+        return self.deadline is not None and (now if now is not None else time.monotonic()) >= self.deadline
+
+
+_current_schedule: ContextVar[RequestSchedule] = ContextVar("request_schedule", default=RequestSchedule())
+
+
+def current_schedule() -> RequestSchedule:
+    """
+    Schedule of the request being handled in the current context.
+    """
+    return _current_schedule.get()
+
+
+def set_schedule(schedule: RequestSchedule):
+    """
+    Schedule the work submitted from the current context, and from tasks it starts, with `schedule`.
+    """
+    _current_schedule.set(schedule)
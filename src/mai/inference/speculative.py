@@ -0,0 +1,291 @@
+import time
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+import torch
+from transformers import PreTrainedModel
+
+from mai.crosscutting.logging import get_logger
+from mai.inference.continuous_batching import DecodeSequence
+from mai.inference.kv_cache import build_cache, cache_layers, cache_length, crop_cache, is_legacy_cache
+
+logger = get_logger()
+
+# Prompt lookup matches the last few tokens, trying the longest n-gram first, and proposes what followed them
+PROMPT_LOOKUP_MAX_NGRAM_SIZE = 3
+PROMPT_LOOKUP_NUM_TOKENS = 10
+
+
+def token_probabilities(logits: torch.Tensor, temperature: float, top_p: float) -> torch.Tensor:
+    """
+    Next-token distribution for each row of logits after temperature and nucleus filtering.
+    """
+    probs = torch.softmax(logits.float() / temperature, dim=-1)
+    if top_p < 1.0:
+        sorted_probs, sorted_ids = probs.sort(dim=-1, descending=True)
+        # Keep the smallest set of tokens whose cumulative probability reaches top_p
+        sorted_probs[(sorted_probs.cumsum(dim=-1) - sorted_probs) > top_p] = 0
+        probs = torch.zeros_like(probs).scatter(-1, sorted_ids, sorted_probs)
+    return probs / probs.sum(dim=-1, keepdim=True)
+
+
+class CachedModel:
+    """
+    A model together with the KV cache of the tokens of one sequence it has processed.
+    """
+
+    def __init__(self, model: PreTrainedModel):
+        self.model = model
+        self._cache = None
+        self._legacy_cache = False
+
+    @property
+    def length(self) -> int:
+        return cache_length(self._cache) if self._cache else 0
+
+    def forward(self, input_ids: torch.Tensor) -> torch.Tensor:
+        """
+        Run the 1-D `input_ids` that follow the cached tokens and return their logits.
+        """
+        past_key_values = build_cache(self._cache, legacy=self._legacy_cache) if self._cache else None
+        outputs = self.model(input_ids.to(self.model.device)[None, :], past_key_values=past_key_values, use_cache=True)
+        self._legacy_cache = is_legacy_cache(outputs.past_key_values)
+        self._cache = cache_layers(outputs.past_key_values)
+        return outputs.logits[0]
+
+    def crop(self, length: int):
+        """
+        Forget cached tokens after the first `length`, such as rejected draft tokens.
+        """
+        if self._cache and self.length > length:
+            self._cache = crop_cache(self._cache, length)
+
+
+class DraftModelProposer:
+    """
+    Proposes the next tokens by decoding a few steps with a smaller model that shares the target's tokenizer.
+    """
+
+    def __init__(self, model: PreTrainedModel, num_tokens: int):
+        self.draft = CachedModel(model)
+        self.num_tokens = num_tokens
+
+    def propose(self, tokens: torch.Tensor, sequence: DecodeSequence, limit: int) -> Tuple[List[int], Optional[torch.Tensor]]:
+        """
+        Draft up to `limit` tokens following `tokens`. Returns the draft token IDs and, when
+        sampling, the distribution each one was drawn from.
+        """
+        draft_ids, draft_probs = [], []
+        pending = tokens[self.draft.length:]
+        for _ in range(min(self.num_tokens, limit)):
+            logits = self.draft.forward(pending)[-1]
+            if sequence.do_sample and sequence.temperature > 0:
+                probs = token_probabilities(logits, sequence.temperature, sequence.top_p)
+                token_id = int(torch.multinomial(probs, 1))
+                draft_probs.append(probs)
+            else:
+                token_id = int(logits.argmax())
+            draft_ids.append(token_id)
+            pending = tokens.new_tensor([token_id])
+        return draft_ids, torch.stack(draft_probs) if draft_probs else None
+
+    def rollback(self, length: int):
+        self.draft.crop(length)
+
+
+class PromptLookupProposer:
+    """
+    Proposes the next tokens without a draft model: finds the last n tokens earlier in the
+    sequence, mostly the prompt, and proposes the tokens that followed them there. Code
+    completions often repeat identifiers and whole lines already present in the prompt.
+    """
+
+    def __init__(self, max_ngram_size: int = PROMPT_LOOKUP_MAX_NGRAM_SIZE, num_tokens: int = PROMPT_LOOKUP_NUM_TOKENS):
+        self.max_ngram_size = max_ngram_size
+        self.num_tokens = num_tokens
+
+    def propose(self, tokens: torch.Tensor, sequence: DecodeSequence, limit: int) -> Tuple[List[int], Optional[torch.Tensor]]:
+        token_ids = tokens.tolist()
+        limit = min(self.num_tokens, limit)
+        if limit <= 0:
+            return [], None
+        for size in range(min(self.max_ngram_size, len(token_ids) - 1), 0, -1):
+            ngram = token_ids[-size:]
+            # The most recent earlier occurrence is the likeliest to continue the same way
+            for start in range(len(token_ids) - size - 1, -1, -1):
+                if token_ids[start:start + size] == ngram:
+                    return token_ids[start + size:start + size + limit], None
+        return [], None
+
+    def rollback(self, length: int):
+        pass
+
+
+def verify(logits: torch.Tensor, draft_ids: List[int], draft_probs: Optional[torch.Tensor], sequence: DecodeSequence) -> List[int]:
+    """
+    Accept the longest valid prefix of the draft given the target's logits at each draft position
+    plus one more, and append the target's own next token. Greedy decoding accepts a draft token
+    only when it is the target's argmax, so the output is exactly what the target alone produces.
+    Sampling uses speculative rejection sampling, which preserves the target's distribution.
+    """
+    if not sequence.do_sample or sequence.temperature <= 0:
+        predicted = logits.argmax(dim=-1).tolist()
+        accepted = []
+        for draft_id, target_id in zip(draft_ids, predicted):
+            if draft_id != target_id:
+                break
+            accepted.append(draft_id)
+        return accepted + [predicted[len(accepted)]]
+
+    probs = token_probabilities(logits, sequence.temperature, sequence.top_p)
+    accepted = []
+    for position, draft_id in enumerate(draft_ids):
+        target = probs[position]
+        if draft_probs is None:
+            # A deterministic proposal: its distribution puts all mass on the draft token
+            draft = torch.zeros_like(target)
+            draft[draft_id] = 1.0
+        else:
+            draft = torch.zeros_like(target)
+            vocab_size = min(target.shape[-1], draft_probs.shape[-1])
+            draft[:vocab_size] = draft_probs[position, :vocab_size]
+        if float(torch.rand(())) * float(draft[draft_id]) < float(target[draft_id]):
+            accepted.append(draft_id)
+            continue
+        residual = (target - draft).clamp(min=0)
+        if residual.sum() <= 0:
+            residual = target
+        return accepted + [int(torch.multinomial(residual, 1))]
+    return accepted + [int(torch.multinomial(probs[-1], 1))]
+
+
+class SpeculativeStats:
+    """
+    Counters of speculative decoding for one generator.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.requests = 0
+        self.steps = 0
+        self.drafted_tokens = 0
+        self.accepted_tokens = 0
+        self.generated_tokens = 0
+        self.seconds = 0.0
+
+    def record(self, steps: int, drafted: int, accepted: int, generated: int, seconds: float):
+        with self._lock:
+            self.requests += 1
+            self.steps += steps
+            self.drafted_tokens += drafted
+            self.accepted_tokens += accepted
+            self.generated_tokens += generated
+            self.seconds += seconds
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "drafted_tokens": self.drafted_tokens,
+                "accepted_tokens": self.accepted_tokens,
+                "acceptance_rate": self.accepted_tokens / self.drafted_tokens if self.drafted_tokens else 0.0,
+                "accepted_per_step": self.accepted_tokens / self.steps if self.steps else 0.0,
+                "tokens_per_step": self.generated_tokens / self.steps if self.steps else 0.0,
+                "tokens_per_second": self.generated_tokens / self.seconds if self.seconds else 0.0,
+            }
+
+
+class SpeculativeDecoder:
+    """
+    Speculative decoding for single sequences: a cheap proposer drafts a few tokens and the
+    target model checks all of them in one forward pass, keeping the ones it agrees with.
+
+    The proposer is a smaller draft model sharing the target's tokenizer, which drafts up to
+    `num_draft_tokens` tokens per step, or prompt lookup, which copies the tokens that followed
+    the latest n-gram where it appeared earlier in the sequence. Decoding follows the same `max_new_tokens`, `temperature`,
+    `top_p`, `do_sample`, EOS, `streamer`, `cancellation_token` and `completion_stop` handling as continuous batching.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            model: PreTrainedModel,
+            eos_token_ids: set,
+            draft_model: Optional[PreTrainedModel] = None,
+            num_draft_tokens: int = 4):
+        self.name = name
+        self.model = model
+        self.eos_token_ids = eos_token_ids
+        self.draft_model = draft_model
+        self.num_draft_tokens = max(1, num_draft_tokens)
+        self.speculative_stats = {"draft_model": SpeculativeStats(), "prompt_lookup": SpeculativeStats()}
+
+    @staticmethod
+    def supports(parameters: Dict) -> bool:
+        """
+        Whether a request only uses settings the speculative decode loop honours.
+        Beam search, repetition penalties and custom logits processors or stopping
+        criteria go through `generate` instead.
+        """
+        config = parameters.get("generation_config")
+        settings = {**(config.to_dict() if config is not None else {}), **parameters}
+        return (
+            (settings.get("num_beams") or 1) == 1
+            and (settings.get("repetition_penalty") or 1.0) == 1.0
+            and not settings.get("logits_processor")
+            and not settings.get("stopping_criteria")
+        )
+
+    def generate(self, input_ids: torch.Tensor, parameters: Dict, prompt_lookup: bool = False) -> torch.Tensor:
+        """
+        Generate from a 1-D tensor of prompt token IDs and return the prompt plus new IDs.
+        Drafts come from prompt lookup when requested or when there is no draft model.
+        """
+        method = "prompt_lookup" if prompt_lookup or self.draft_model is None else "draft_model"
+        if method == "prompt_lookup":
+            proposer = PromptLookupProposer()
+        else:
+            proposer = DraftModelProposer(self.draft_model, self.num_draft_tokens)
+        sequence = DecodeSequence(input_ids, parameters, self.eos_token_ids)
+        target = CachedModel(self.model)
+        tokens = input_ids
+        steps = drafted = accepted = 0
+        started = time.perf_counter()
+
+        with torch.inference_mode():
+            while not sequence.finished:
+                # Leave room for the token the target adds after the accepted drafts
+                remaining = sequence.max_new_tokens - len(sequence.generated)
+                draft_ids, draft_probs = proposer.propose(tokens, sequence, remaining - 1)
+                logits = target.forward(torch.cat([tokens[target.length:], tokens.new_tensor(draft_ids)]))
+                new_ids = verify(logits[-(len(draft_ids) + 1):], draft_ids, draft_probs, sequence)
+
+                steps += 1
+                drafted += len(draft_ids)
+                accepted += len(new_ids) - 1
+                for token_id in new_ids:
+                    sequence.append(token_id)
+                    if sequence.finished:
+                        break
+
+                # Keep cached positions only for tokens that made it into the sequence
+                tokens = sequence.output_ids()
+                target.crop(tokens.shape[-1] - 1)
+                proposer.rollback(tokens.shape[-1] - 1)
+
+        sequence.finish()
+        elapsed = time.perf_counter() - started
+        generated = len(sequence.generated)
+        self.speculative_stats[method].record(steps, drafted, accepted, generated, elapsed)
+        logger.info(
+            f"Speculative decoding ({method}) on '{self.name}': {generated} tokens in {steps} steps, "
+            f"{accepted}/{drafted} draft tokens accepted ({accepted / drafted if drafted else 0:.0%}, "
+            f"{accepted / steps if steps else 0:.2f} per step), {generated / elapsed if elapsed else 0:.1f} tokens/s"
+        )
+        return sequence.output_ids()
+
+    def stats(self) -> Dict:
+        stats = {"prompt_lookup": self.speculative_stats["prompt_lookup"].stats()}
+        if self.draft_model is not None:
+            stats["draft_model"] = {"num_draft_tokens": self.num_draft_tokens, **self.speculative_stats["draft_model"].stats()}
+        return stats
@@ -0,0 +1,299 @@
+from typing import List, Optional, Sequence
+
+import torch
+from transformers import PreTrainedTokenizer, StoppingCriteria
+
+from mai.crosscutting.metrics import GenerationTiming
+from mai.inference.cancellation import CancellationToken
+from mai.inference.streaming import IncrementalDecoder
+
+
+class CancellationCriteria(StoppingCriteria):
+    """
+    Stops each batch row as soon as its cancellation token is set.
+    Checked by `generate` after every decode step.
+    """
+
+    def __init__(self, tokens: List[Optional[CancellationToken]], prompt_length: int, max_new_tokens: int):
+        self.tokens = tokens
+        self.prompt_length = prompt_length
+        self.max_new_tokens = max_new_tokens
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        done = [token is not None and token.cancelled for token in self.tokens]
+        generated = input_ids.shape[-1] - self.prompt_length
+        for token, cancelled in zip(self.tokens, done):
+            if cancelled:
+                token.record(self.max_new_tokens - generated)
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+class TimingCriteria(StoppingCriteria):
+    """
+    Never stops generation; marks when `generate` produced the first new token of each timed request.
+    """
+
+    def __init__(self, timings: List[GenerationTiming]):
+        self.timings = timings
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        for timing in self.timings:
+            timing.first_token()
+        self.timings = []
+        return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+
+# Modes of code-aware stopping: at the end of the line or of the block of code a completion starts in
+STOP_AT = ("line", "block")
+OPENING_BRACKETS = "([{"
+CLOSING_BRACKETS = ")]}"
+QUOTES = "\"'`"
+# Columns a tab counts for when comparing indentation
+TAB_WIDTH = 4
+
+
+def indentation(line: str) -> int:
+    return len(line[:len(line) - len(line.lstrip())].expandtabs(TAB_WIDTH))
+
+
+class CompletionStop:
+    """
+    Finds where a code completion ends while it is being generated: at the first of its `stop`
+    strings or, with `stop_at`, at the end of the line ("line") or of the block ("block") it starts
+    in. A block ends before a blank line or a line indented less than the completion's first line,
+    or right after a bracket that closes one opened before the completion.
+
+    Generated token IDs are fed in as they arrive and decoded incrementally, and only the text
+    they add is scanned, so the check costs the same at every decode step. `prefix` is the code
+    before the completion, whose last line the completion continues. `text` is the completion
+    up to where it ends, without the stop string.
+    """
+
+    def __init__(
+            self,
+            tokenizer: PreTrainedTokenizer,
+            prompt_ids: Sequence[int],
+            stop: Sequence[str] = (),
+            stop_at: Optional[str] = None,
+            prefix: str = ""):
+        if stop_at is not None and stop_at not in STOP_AT:
+            raise ValueError(f"Invalid stop_at '{stop_at}', expected one of: {', '.join(STOP_AT)}.")
+        self.decoder = IncrementalDecoder(tokenizer, prompt_ids)
+        self.stop = [string for string in stop if string]
+        self.stop_at = stop_at
+        self.prefix = prefix
+        # Generated tokens fed so far; none are taken once the completion has ended
+        self.consumed = 0
+        # Where the completion ends in the decoded text, once known
+        self.end: Optional[int] = None
+        self._emitted = 0
+        self._scanned = 0
+
+        # Code structure of the text scanned so far. The first line continues the last line of the prefix.
+        self._cursor_line = prefix.rsplit("\n", 1)[-1]
+        self._first_line = True
+        self._line_start = 0
+        self._line_has_code = False
+        self._has_code = False
+        self._base_indent: Optional[int] = None
+        self._depth = 0
+        # Delimiter of the string being scanned, three quotes for strings that can span lines
+        self._quote: Optional[str] = None
+        self._string_empty = False
+        # Quote that closed an empty string right before, which a third one turns into a triple quote
+        self._empty_quote: Optional[str] = None
+        # Quotes in a row seen towards closing a triple-quoted string
+        self._closing = 0
+        self._line_in_string = False
+        self._escaped = False
+        self._comment = False
+        for char in self._cursor_line:
+            self._is_code(char)
+
+    @property
+    def stopped(self) -> bool:
+        return self.end is not None
+
+    @property
+    def text(self) -> str:
+        return self.decoder.text[:self.end]
+
+    @property
+    def generated_ids(self) -> List[int]:
+        return self.decoder.generated_ids
+
+    def feed(self, token_ids: Sequence[int]):
+        """
+        Take newly generated tokens and check whether the completion ended with them.
+        """
+        if self.end is not None or not token_ids:
+            return
+        self.consumed += len(token_ids)
+        self.decoder.add(token_ids)
+        self._check()
+
+    def add(self, token_ids: Sequence[int]) -> str:
+        """
+        Feed newly generated tokens and return the text that can be streamed so far. Text that
+        may still turn out to be part of a stop string, or to follow the end of the block, is held back.
+        """
+        self.feed(token_ids)
+        return self._take(self._releasable())
+
+    def flush(self) -> str:
+        """
+        Return the rest of the completion's text, once no more tokens will follow.
+        """
+        if self.end is None:
+            self.decoder.flush()
+            self._check()
+        return self._take(self.end if self.end is not None else len(self.decoder.text))
+
+    def restart(self) -> "CompletionStop":
+        """
+        A fresh copy with the same prompt and settings, for checking another run of tokens.
+        """
+        context_ids = self.decoder.token_ids[:self.decoder.context_length]
+        return CompletionStop(self.decoder.tokenizer, context_ids, self.stop, self.stop_at, self.prefix)
+
+    def _take(self, end: int) -> str:
+        text = self.decoder.text[self._emitted:end]
+        self._emitted = max(self._emitted, end)
+        return text
+
+    def _releasable(self) -> int:
+        if self.end is not None:
+            return self.end
+        text = self.decoder.text
+        end = len(text)
+        for string in self.stop:
+            for length in range(min(len(string) - 1, len(text)), 0, -1):
+                if text.endswith(string[:length]):
+                    end = min(end, len(text) - length)
+                    break
+        if self.stop_at == "block" and self._has_code and not self._first_line and not self._line_has_code:
+            # A line without code yet may turn out blank or dedented, ending the block before it
+            end = min(end, self._line_start - 1)
+        return end
+
+    def _check(self):
+        text = self.decoder.text
+        if len(text) == self._scanned:
+            return
+        ends = []
+        if self.stop:
+            ends.extend(
+                position for position in (
+                    text.find(string, max(0, self._scanned - len(string) + 1)) for string in self.stop
+                ) if position >= 0
+            )
+        if self.stop_at is not None:
+            end = self._scan(text)
+            if end is not None:
+                ends.append(end)
+        self._scanned = len(text)
+        if ends:
+            self.end = min(ends)
+
+    def _scan(self, text: str) -> Optional[int]:
+        """
+        Follow lines, indentation and brackets through the new text and return where the line or block ends in it.
+        """
+        for position in range(self._scanned, len(text)):
+            char = text[position]
+            if char == "\n":
+                if self._has_code:
+                    if self.stop_at == "line":
+                        return position
+                    # Lines inside open brackets or strings continue the statement, whatever their layout
+                    if not self._first_line and not self._line_has_code and self._depth == 0 and self._quote is None:
+                        return self._line_start - 1
+                self._first_line = False
+                self._line_start = position + 1
+                self._line_has_code = False
+                # Triple-quoted strings go on across lines, other strings and comments end with theirs
+                if self._quote is not None and len(self._quote) == 1:
+                    self._quote = None
+                self._line_in_string = self._quote is not None
+                self._escaped = self._comment = False
+                self._empty_quote = None
+                self._closing = 0
+                continue
+
+            code = self._is_code(char)
+            if char.isspace():
+                continue
+            closes = code and char in CLOSING_BRACKETS and self._depth == 0
+            if not self._line_has_code:
+                self._line_has_code = True
+                line = self._cursor_line + text[:position] if self._first_line else text[self._line_start:position]
+                if self._base_indent is None:
+                    self._base_indent = indentation(line)
+                elif (self.stop_at == "block" and indentation(line) < self._base_indent and not closes
+                      and self._depth == 0 and not self._line_in_string):
+                    return self._line_start - 1
+            self._has_code = True
+            if code and self.stop_at == "block":
+                if char in OPENING_BRACKETS:
+                    self._depth += 1
+                elif char in CLOSING_BRACKETS:
+                    self._depth -= 1
+                    if closes:
+                        return position + 1
+        return None
+
+    def _is_code(self, char: str) -> bool:
+        """
+        Track string literals, including triple-quoted ones, and `#` line comments, and whether
+        `char` is outside both. `//` is not taken for a comment, since it is floor division in Python.
+        """
+        empty_quote, self._empty_quote = self._empty_quote, None
+        if self._comment:
+            return False
+        if self._quote is not None:
+            if self._escaped:
+                self._escaped = False
+                self._closing = 0
+            elif char == "\\":
+                self._escaped = True
+            elif len(self._quote) == 3:
+                self._closing = self._closing + 1 if char == self._quote[0] else 0
+                if self._closing == 3:
+                    self._quote = None
+            elif char == self._quote:
+                if self._string_empty:
+                    self._empty_quote = char
+                self._quote = None
+            self._string_empty = False
+            return False
+        if char in QUOTES:
+            if char == empty_quote and char != "`":
+                self._quote = char * 3
+                self._closing = 0
+            else:
+                self._quote = char
+                self._string_empty = True
+            return False
+        if char == "#":
+            self._comment = True
+            return False
+        return True
+
+
+class CompletionStopCriteria(StoppingCriteria):
+    """
+    Feeds each batch row's new tokens to its `CompletionStop` and stops the row once its completion has ended.
+    Checked by `generate` after every decode step.
+    """
+
+    def __init__(self, stops: List[Optional[CompletionStop]], prompt_length: int):
+        self.stops = stops
+        self.prompt_length = prompt_length
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        done = []
+        for row, stop in zip(input_ids, self.stops):
+            if stop is not None:
+                stop.feed(row[self.prompt_length + stop.consumed:].tolist())
+            done.append(stop is not None and stop.stopped)
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
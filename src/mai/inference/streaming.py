@@ -0,0 +1,177 @@
+import asyncio
+from typing import Callable, List, Optional, Sequence
+
+from transformers import PreTrainedTokenizer
+from transformers.generation import BaseStreamer
+
+# Marks the end of a stream in the streamer's queue
+_END_OF_STREAM = object()
+
+# Prompt tokens kept as decoding context for the first generated tokens
+CONTEXT_TOKENS = 5
+
+
+class IncrementalDecoder:
+    """
+    Turns generated token IDs into text as they arrive, decoding only a short window of
+    the newest tokens each time rather than the whole sequence.
+
+    The last few prompt tokens are used as context, so tokenizers that drop the leading
+    space of a sequence still decode the first new token's. Text is held back while it
+    ends in an incomplete multi-byte character.
+    """
+
+    def __init__(self, tokenizer: PreTrainedTokenizer, context_ids: Sequence[int] = ()):
+        self.tokenizer = tokenizer
+        self.token_ids: List[int] = list(context_ids)[-CONTEXT_TOKENS:]
+        self.context_length = len(self.token_ids)
+        self.text = ""
+        # Tokens before `_read_offset` are already part of `text`; decoding starts at `_prefix_offset`
+        self._prefix_offset = 0
+        self._read_offset = self.context_length
+        # A prompt that ends inside a multi-byte character leaves the whole character to the new text
+        while self._read_offset > 0 and self._decode(self.token_ids[:self._read_offset]).endswith("\ufffd"):
+            self._read_offset -= 1
+
+    @property
+    def generated_ids(self) -> List[int]:
+        return self.token_ids[self.context_length:]
+
+    def add(self, token_ids: Sequence[int]) -> str:
+        """
+        Append generated tokens and return the text they complete, if any.
+        """
+        self.token_ids.extend(token_ids)
+        return self._advance(final=False)
+
+    def flush(self) -> str:
+        """
+        Return the text still held back, once no more tokens will follow.
+        """
+        return self._advance(final=True)
+
+    def _decode(self, token_ids: List[int]) -> str:
+        return self.tokenizer.decode(token_ids, skip_special_tokens=True, clean_up_tokenization_spaces=False)
+
+    def _advance(self, final: bool) -> str:
+        if self._read_offset == len(self.token_ids):
+            return ""
+        prefix_text = self._decode(self.token_ids[self._prefix_offset:self._read_offset])
+        new_text = self._decode(self.token_ids[self._prefix_offset:])
+        if len(new_text) <= len(prefix_text) or (new_text.endswith("\ufffd") and not final):
+            return ""
+        delta = new_text[len(prefix_text):]
+        self._prefix_offset = self._read_offset
+        self._read_offset = len(self.token_ids)
+        self.text += delta
+        return delta
+
+
+def decode_new_tokens(tokenizer: PreTrainedTokenizer, prompt_ids: Sequence[int], new_ids: Sequence[int]) -> str:
+    """
+    Decode the tokens generated after a prompt, without decoding the prompt itself.
+    """
+    decoder = IncrementalDecoder(tokenizer, prompt_ids)
+    decoder.add(new_ids)
+    decoder.flush()
+    return decoder.text
+
+
+class IncrementalTextStreamer(BaseStreamer):
+    """
+    Token streamer that decodes new tokens incrementally and passes each piece of text to
+    `on_finalized_text`. The prompt, which generation puts first, only serves as context.
+
+    A generation with stop conditions sets `stop` to its `mai.inference.stopping.CompletionStop`,
+    which then does the decoding, so that nothing after the end of the completion is streamed.
+    """
+
+    def __init__(self, tokenizer: PreTrainedTokenizer):
+        self.tokenizer = tokenizer
+        self.decoder: Optional[IncrementalDecoder] = None
+        self.stop = None
+        self._started = False
+        self._generated = 0
+
+    def put(self, value):
+        if len(value.shape) > 1:
+            if value.shape[0] > 1:
+                raise ValueError("Token streamers only support a single sequence.")
+            value = value[0]
+        if not self._started:
+            self._started = True
+            if self.stop is None:
+                self.decoder = IncrementalDecoder(self.tokenizer, value.tolist())
+            return
+        token_ids = value.tolist()
+        self._generated += len(token_ids)
+        if self.stop is not None:
+            # Stopping criteria may have fed the stop these tokens already
+            text = self.stop.add(token_ids[max(0, self.stop.consumed - self._generated + len(token_ids)):])
+        else:
+            text = self.decoder.add(token_ids)
+        if text:
+            self.on_finalized_text(text)
+
+    def end(self):
+        if self.stop is not None:
+            text = self.stop.flush()
+        else:
+            text = self.decoder.flush() if self.decoder is not None else ""
+        self.on_finalized_text(text, stream_end=True)
+
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        raise NotImplementedError
+
+
+class AsyncTextStreamer(IncrementalTextStreamer):
+    """
+    Token streamer that hands decoded text from the generation thread to the event loop.
+
+    Pass it as the `streamer` generation parameter and iterate it with `async for`.
+    The prompt is skipped, so only newly generated text is yielded.
+    """
+
+    def __init__(self, tokenizer: PreTrainedTokenizer, loop: asyncio.AbstractEventLoop):
+        super().__init__(tokenizer)
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        """
+        Called from the generation thread whenever a chunk of text is ready.
+        """
+        if text:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, text)
+        if stream_end:
+            self.close()
+
+    def close(self):
+        """
+        End the stream. Safe to call more than once and from any thread.
+        """
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, _END_OF_STREAM)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        text = await self.queue.get()
+        if text is _END_OF_STREAM:
+            raise StopAsyncIteration
+        return text
+
+
+class RelayTextStreamer(IncrementalTextStreamer):
+    """
+    Token streamer that passes each finalized chunk of text to a callback, such as one
+    forwarding it from a worker process to the front end. The prompt is skipped.
+    """
+
+    def __init__(self, tokenizer: PreTrainedTokenizer, on_text: Callable[[str, bool], None]):
+        super().__init__(tokenizer)
+        self.on_text = on_text
+
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        if text or stream_end:
+            self.on_text(text, stream_end)
@@ -0,0 +1,42 @@
+from typing import Dict, Optional
+
+
+class TokenUsage:
+    """
+    Token counts of one request, filled in by the generator from the token IDs it already has.
+
+    `cached_tokens` counts the prompt tokens whose KV cache was reused rather than computed,
+    which are cheaper to serve. They are included in `prompt_tokens`.
+    """
+    __slots__ = ("prompt_tokens", "completion_tokens", "cached_tokens")
+
+    def __init__(self, prompt_tokens: int = 0, completion_tokens: int = 0, cached_tokens: int = 0):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cached_tokens = cached_tokens
+
+    def update(self, other: "TokenUsage"):
+        """
+        Take the counts of another copy, such as one filled in by a worker process.
+        """
+        self.prompt_tokens = other.prompt_tokens
+        self.completion_tokens = other.completion_tokens
+        self.cached_tokens = other.cached_tokens
+
+    def to_dict(self) -> Dict:
+        """
+        The counts as the `usage` object of an OpenAI-style response.
+        """
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.prompt_tokens + self.completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": self.cached_tokens},
+        }
+
+    @classmethod
+    def from_dict(cls, usage: Optional[Dict]) -> Optional["TokenUsage"]:
+        if not usage:
+            return None
+        details = usage.get("prompt_tokens_details") or {}
+        return cls(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), details.get("cached_tokens", 0))
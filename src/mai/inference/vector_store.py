@@ -0,0 +1,561 @@
+import json
+import os
+import shutil
+from threading import Lock, RLock
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from mai.crosscutting.logging import get_logger
+
+logger = get_logger()
+
+# Rows allocated for a new collection; capacity doubles as it fills
+INITIAL_CAPACITY = 1024
+
+# Rows scored at once by exact search, to bound the size of the score matrix
+SEARCH_BLOCK_ROWS = 65536
+
+# Training rows per IVF list used by k-means
+IVF_TRAINING_ROWS_PER_LIST = 256
+IVF_TRAINING_ITERATIONS = 10
+
+# Rows a collection's journal may hold, beyond the collection's own size, before it is compacted into a snapshot
+JOURNAL_COMPACT_MIN_ROWS = 1024
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """
+    Scale each row to unit length, so that dot products are cosine similarities.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Indices and values of the `k` largest scores in each row of `scores`, best first.
+    """
+    k = min(k, scores.shape[1])
+    indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    values = np.take_along_axis(scores, indices, axis=1)
+    order = np.argsort(-values, axis=1)
+    return np.take_along_axis(indices, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+
+class IVFIndex:
+    """
+    Inverted-file index: rows are assigned to the nearest of `n_lists` k-means centroids,
+    and a search only scores rows in the `n_probe` lists closest to the query.
+    """
+
+    def __init__(self, centroids: np.ndarray, n_probe: int):
+        self.centroids = centroids
+        self.n_probe = max(1, min(n_probe, len(centroids)))
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, n_lists: int, n_probe: int, seed: int = 0) -> "IVFIndex":
+        """
+        Spherical k-means on a sample of `vectors`, which must already be unit length.
+        """
+        rng = np.random.default_rng(seed)
+        n_lists = max(1, min(n_lists, len(vectors)))
+        sample_size = min(len(vectors), n_lists * IVF_TRAINING_ROWS_PER_LIST)
+        sample = np.asarray(vectors[rng.choice(len(vectors), sample_size, replace=False)])
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+
+        for _ in range(IVF_TRAINING_ITERATIONS):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            for list_id in range(n_lists):
+                members = sample[assignments == list_id]
+                if len(members):
+                    centroids[list_id] = members.sum(axis=0)
+                else:
+                    # Re-seed empty lists so every centroid stays useful
+                    centroids[list_id] = sample[rng.integers(sample_size)]
+            centroids = normalize_rows(centroids)
+        return cls(centroids, n_probe)
+
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), SEARCH_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + SEARCH_BLOCK_ROWS])
+            assignments[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return assignments
+
+    def probe(self, queries: np.ndarray, n_probe: Optional[int] = None) -> np.ndarray:
+        """
+        The lists to search for each query, as a `(queries, n_probe)` array.
+        """
+        n_probe = max(1, min(n_probe or self.n_probe, len(self.centroids)))
+        lists, _ = top_k(queries @ self.centroids.T, n_probe)
+        return lists
+
+
+class VectorCollection:
+    """
+    Named set of unit-length vectors with string IDs and optional metadata.
+
+    With a `directory`, vectors live in a memory-mapped `.npy` file, so a collection larger
+    than memory can be searched and survives restarts. Settings are kept in a JSON manifest,
+    IVF centroids in their own `.npy` file, and IDs and metadata in a JSON snapshot plus a
+    journal that each upsert or delete appends to. The journal is folded into a new snapshot
+    once it outgrows the collection, so a write costs time in proportion to its own rows.
+    Without a directory, the collection is kept in memory only.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            dimension: int,
+            model: Optional[str] = None,
+            layers: Optional[int] = None,
+            directory: Optional[str] = None,
+    ):
+        self.name = name
+        self.dimension = dimension
+        self.model = model
+        self.layers = layers
+        self.directory = directory
+        self.ids: List[str] = []
+        self.metadata: List[Optional[Dict]] = []
+        self.index: Optional[IVFIndex] = None
+        self._positions: Dict[str, int] = {}
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._lists: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._lock = RLock()
+        # Snapshot generation, and rows written to its journal since
+        self._generation = 0
+        self._journal_rows = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self._vectors = self._allocate(INITIAL_CAPACITY)
+
+    @property
+    def count(self) -> int:
+        return len(self.ids)
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.directory, "vectors.npy")
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, "manifest.json")
+
+    @property
+    def rows_path(self) -> str:
+        return os.path.join(self.directory, "rows.json")
+
+    @property
+    def journal_path(self) -> str:
+        return os.path.join(self.directory, f"journal-{self._generation}.jsonl")
+
+    @property
+    def centroids_path(self) -> str:
+        return os.path.join(self.directory, "centroids.npy")
+
+    @classmethod
+    def open(cls, directory: str) -> "VectorCollection":
+        """
+        Load a collection saved in `directory`. Vectors stay on disk and are paged in on use.
+        """
+        with open(os.path.join(directory, "manifest.json")) as manifest_file:
+            manifest = json.load(manifest_file)
+        collection = cls.__new__(cls)
+        collection.name = manifest["name"]
+        collection.dimension = manifest["dimension"]
+        collection.model = manifest.get("model")
+        collection.layers = manifest.get("layers")
+        collection.directory = directory
+        collection.index = None
+        collection._assignments = np.empty(0, dtype=np.int32)
+        collection._lists = None
+        collection._lock = RLock()
+        collection._journal_rows = 0
+        if os.path.isfile(collection.rows_path):
+            with open(collection.rows_path) as rows_file:
+                rows = json.load(rows_file)
+        else:
+            # Collections saved before the journal kept their rows in the manifest
+            rows = {"generation": 0, "ids": manifest.get("ids", []), "metadata": manifest.get("metadata", [])}
+        collection._generation = rows["generation"]
+        collection.ids = rows["ids"]
+        collection.metadata = rows["metadata"]
+        collection._positions = {vector_id: row for row, vector_id in enumerate(collection.ids)}
+        complete = collection._replay_journal()
+        collection._vectors = np.load(collection.vectors_path, mmap_mode="r+")
+        if not complete or not os.path.isfile(collection.rows_path):
+            # Start a clean journal after an interrupted write, and move rows out of an old manifest
+            collection.save()
+
+        index = manifest.get("index")
+        if index and os.path.isfile(collection.centroids_path):
+            collection.index = IVFIndex(np.load(collection.centroids_path), index["n_probe"])
+            collection._assignments = collection.index.assign(collection._vectors[:collection.count])
+        elif index:
+            collection.build_index(**index)
+        return collection
+
+    def upsert(self, ids: Sequence[str], vectors: np.ndarray, metadata: Optional[Sequence[Optional[Dict]]] = None):
+        """
+        Insert vectors, replacing any with the same ID. Vectors are normalized before storing.
+        """
+        vectors = normalize_rows(vectors)
+        if vectors.shape != (len(ids), self.dimension):
+            raise ValueError(
+                f"Expected {len(ids)} vectors of dimension {self.dimension}, got shape {tuple(vectors.shape)}"
+            )
+        metadata = list(metadata) if metadata is not None else [None] * len(ids)
+        if len(metadata) != len(ids):
+            raise ValueError("metadata must have one entry per ID")
+
+        with self._lock:
+            rows = self._place(ids, metadata)
+            self._reserve(self.count)
+            self._vectors[rows] = vectors
+            if self.index is not None:
+                self._assignments = self._resized(self._assignments, self.count)
+                self._assignments[rows] = self.index.assign(vectors)
+                self._lists = None
+            self._journal({"upsert": list(ids), "metadata": metadata})
+
+    def delete(self, ids: Sequence[str]) -> int:
+        """
+        Remove vectors by ID. Returns how many were found.
+        """
+        removed = []
+        with self._lock:
+            for vector_id in ids:
+                moved = self._remove(vector_id)
+                if moved is None:
+                    continue
+                row, last = moved
+                if row != last:
+                    self._vectors[row] = self._vectors[last]
+                    if self.index is not None:
+                        self._assignments[row] = self._assignments[last]
+                removed.append(vector_id)
+            if self.index is not None:
+                self._assignments = self._assignments[:self.count]
+                self._lists = None
+            if removed:
+                self._journal({"delete": removed})
+        return len(removed)
+
+    def build_index(self, n_lists: int, n_probe: int = 8):
+        """
+        Train an IVF index for approximate search. Later upserts are assigned to its lists.
+        """
+        with self._lock:
+            if self.count == 0:
+                raise ValueError(f"Collection '{self.name}' is empty")
+            vectors = self._vectors[:self.count]
+            self.index = IVFIndex.train(vectors, n_lists, n_probe)
+            self._assignments = self.index.assign(vectors)
+            self._lists = None
+            if self.directory is not None:
+                np.save(self.centroids_path, self.index.centroids)
+                self._write_manifest()
+
+    def drop_index(self):
+        with self._lock:
+            self.index = None
+            self._assignments = np.empty(0, dtype=np.int32)
+            self._lists = None
+            if self.directory is not None:
+                if os.path.exists(self.centroids_path):
+                    os.remove(self.centroids_path)
+                self._write_manifest()
+
+    def search(self, queries: np.ndarray, k: int = 10, exact: bool = False, n_probe: Optional[int] = None) -> List[List[Dict]]:
+        """
+        Cosine top-k for each query row. Uses the IVF index when one is built, unless `exact`.
+        """
+        queries = normalize_rows(queries)
+        if queries.shape[1] != self.dimension:
+            raise ValueError(f"Expected queries of dimension {self.dimension}, got {queries.shape[1]}")
+
+        with self._lock:
+            if self.count == 0 or k <= 0:
+                return [[] for _ in queries]
+            if self.index is not None and not exact:
+                rows, scores = self._search_index(queries, k, n_probe)
+            else:
+                rows, scores = self._search_exact(queries, k)
+            return [
+                [
+                    {"id": self.ids[row], "score": float(score), "metadata": self.metadata[row]}
+                    for row, score in zip(query_rows, query_scores)
+                ]
+                for query_rows, query_scores in zip(rows, scores)
+            ]
+
+    def describe(self) -> Dict:
+        return {
+            "name": self.name,
+            "dimension": self.dimension,
+            "model": self.model,
+            "layers": self.layers,
+            "count": self.count,
+            "index": self._index_settings(),
+            "persistent": self.directory is not None,
+        }
+
+    def save(self):
+        """
+        Flush vectors, write the manifest and fold the journal into a new snapshot of
+        IDs and metadata. No-op for in-memory collections.
+        """
+        if self.directory is None:
+            return
+        with self._lock:
+            self._vectors.flush()
+            self._write_manifest()
+            previous_journal = self.journal_path
+            self._write_json(self.rows_path, {"generation": self._generation + 1, "ids": self.ids, "metadata": self.metadata})
+            # The new snapshot starts an empty journal of the next generation
+            self._generation += 1
+            self._journal_rows = 0
+            if os.path.exists(previous_journal):
+                os.remove(previous_journal)
+
+    def _write_manifest(self):
+        self._write_json(self.manifest_path, {
+            "name": self.name,
+            "dimension": self.dimension,
+            "model": self.model,
+            "layers": self.layers,
+            "index": self._index_settings(),
+        })
+
+    @staticmethod
+    def _write_json(path: str, content: Dict):
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "w") as json_file:
+            json.dump(content, json_file)
+        os.replace(temporary_path, path)
+
+    def _journal(self, entry: Dict):
+        """
+        Append a write to the journal once its vectors are on disk, compacting the journal when it has grown large.
+        """
+        if self.directory is None:
+            return
+        self._vectors.flush()
+        with open(self.journal_path, "a") as journal_file:
+            journal_file.write(json.dumps(entry) + "\n")
+        self._journal_rows += len(entry.get("upsert") or entry.get("delete"))
+        if self._journal_rows > max(JOURNAL_COMPACT_MIN_ROWS, self.count):
+            self.save()
+
+    def _replay_journal(self) -> bool:
+        """
+        Apply the writes journaled since the snapshot to the IDs and metadata. The vectors already reflect them.
+        Returns False when an interrupted write left an incomplete entry.
+        """
+        complete = True
+        if not os.path.isfile(self.journal_path):
+            return complete
+        with open(self.journal_path) as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A write interrupted halfway through its journal line never completed
+                    logger.warning(f"Skipping an incomplete journal entry of vector collection '{self.name}'")
+                    complete = False
+                    continue
+                if "upsert" in entry:
+                    self._place(entry["upsert"], entry["metadata"])
+                    self._journal_rows += len(entry["upsert"])
+                else:
+                    for vector_id in entry["delete"]:
+                        self._remove(vector_id)
+                    self._journal_rows += len(entry["delete"])
+        return complete
+
+    def _place(self, ids: Sequence[str], metadata: Sequence[Optional[Dict]]) -> List[int]:
+        """
+        Rows for upserted IDs: their current rows, or new rows at the end. Sets their metadata.
+        """
+        rows = []
+        for vector_id, item_metadata in zip(ids, metadata):
+            row = self._positions.get(vector_id)
+            if row is None:
+                row = self.count
+                self._positions[vector_id] = row
+                self.ids.append(vector_id)
+                self.metadata.append(item_metadata)
+            else:
+                self.metadata[row] = item_metadata
+            rows.append(row)
+        return rows
+
+    def _remove(self, vector_id: str) -> Optional[Tuple[int, int]]:
+        """
+        Drop an ID, moving the last row's ID into its row to keep rows contiguous.
+        Returns the freed row and the moved last row, or None when the ID is absent.
+        """
+        row = self._positions.pop(vector_id, None)
+        if row is None:
+            return None
+        last = self.count - 1
+        if row != last:
+            self.ids[row] = self.ids[last]
+            self.metadata[row] = self.metadata[last]
+            self._positions[self.ids[row]] = row
+        self.ids.pop()
+        self.metadata.pop()
+        return row, last
+
+    def _index_settings(self) -> Optional[Dict]:
+        if self.index is None:
+            return None
+        return {"n_lists": len(self.index.centroids), "n_probe": self.index.n_probe}
+
+    def _search_exact(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score every row in blocks, keeping the running top-k per query.
+        """
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+            block = np.asarray(self._vectors[start:min(start + SEARCH_BLOCK_ROWS, self.count)])
+            rows, scores = top_k(queries @ block.T, k)
+            candidates = np.concatenate([best_rows, rows + start], axis=1)
+            candidate_scores = np.concatenate([best_scores, scores], axis=1)
+            order, best_scores = top_k(candidate_scores, k)
+            best_rows = np.take_along_axis(candidates, order, axis=1)
+        return best_rows, best_scores
+
+    def _search_index(self, queries: np.ndarray, k: int, n_probe: Optional[int]) -> Tuple[List, List]:
+        """
+        Score only the rows in the lists probed for each query.
+        """
+        members, offsets = self._inverted_lists()
+        all_rows, all_scores = [], []
+        for query, lists in zip(queries, self.index.probe(queries, n_probe)):
+            candidates = np.concatenate([members[offsets[list_id]:offsets[list_id + 1]] for list_id in lists])
+            if len(candidates) == 0:
+                all_rows.append([])
+                all_scores.append([])
+                continue
+            scores = np.asarray(self._vectors[candidates]) @ query
+            order, values = top_k(scores[None, :], k)
+            all_rows.append(candidates[order[0]])
+            all_scores.append(values[0])
+        return all_rows, all_scores
+
+    def _inverted_lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rows grouped by IVF list: the rows of list `i` are `members[offsets[i]:offsets[i + 1]]`.
+        Rebuilt after the collection changes.
+        """
+        if self._lists is None:
+            assignments = self._assignments[:self.count]
+            members = np.argsort(assignments, kind="stable")
+            counts = np.bincount(assignments, minlength=len(self.index.centroids))
+            self._lists = (members, np.concatenate([[0], np.cumsum(counts)]))
+        return self._lists
+
+    def _allocate(self, capacity: int) -> np.ndarray:
+        if self.directory is None:
+            return np.zeros((capacity, self.dimension), dtype=np.float32)
+        return np.lib.format.open_memmap(
+            self.vectors_path, mode="w+", dtype=np.float32, shape=(capacity, self.dimension)
+        )
+
+    def _reserve(self, rows: int):
+        """
+        Grow the vector storage to hold at least `rows` rows.
+        """
+        capacity = len(self._vectors)
+        if rows <= capacity:
+            return
+        while capacity < rows:
+            capacity *= 2
+        if self.directory is None:
+            self._vectors = self._resized(self._vectors, capacity)
+            return
+
+        # Write the larger file next to the current one, then swap it in
+        temporary_path = self.vectors_path + ".tmp"
+        grown = np.lib.format.open_memmap(
+            temporary_path, mode="w+", dtype=np.float32, shape=(capacity, self.dimension)
+        )
+        grown[:len(self._vectors)] = self._vectors
+        grown.flush()
+        del grown
+        self._vectors = None
+        os.replace(temporary_path, self.vectors_path)
+        self._vectors = np.load(self.vectors_path, mmap_mode="r+")
+
+    @staticmethod
+    def _resized(array: np.ndarray, rows: int) -> np.ndarray:
+        if len(array) >= rows:
+            return array
+        grown = np.zeros((max(rows, 2 * len(array)),) + array.shape[1:], dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+
+class VectorStore:
+    """
+    Collections by name, persisted under `directory` when one is given.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory
+        self.collections: Dict[str, VectorCollection] = {}
+        self._lock = Lock()
+        if directory and os.path.isdir(directory):
+            for name in sorted(os.listdir(directory)):
+                if os.path.isfile(os.path.join(directory, name, "manifest.json")):
+                    self.collections[name] = VectorCollection.open(os.path.join(directory, name))
+                    logger.info(f"Opened vector collection '{name}' with {self.collections[name].count} vectors")
+
+    def get(self, name: str) -> VectorCollection:
+        collection = self.collections.get(name)
+        if collection is None:
+            raise KeyError(f"Vector collection '{name}' does not exist")
+        return collection
+
+    def get_or_create(self, name: str, dimension: int, model: Optional[str] = None, layers: Optional[int] = None) -> VectorCollection:
+        """
+        Return the named collection, creating it on first use. An existing collection must
+        match the dimension, and the model and layers when a model is given.
+        """
+        with self._lock:
+            collection = self.collections.get(name)
+            if collection is not None:
+                if collection.dimension != dimension:
+                    raise ValueError(
+                        f"Collection '{name}' holds vectors of dimension {collection.dimension}, not {dimension}"
+                    )
+                if model is not None and (model, layers) != (collection.model, collection.layers):
+                    raise ValueError(
+                        f"Collection '{name}' was embedded with model '{collection.model}' and layers "
+                        f"{collection.layers}, not model '{model}' and layers {layers}"
+                    )
+            else:
+                if os.sep in name or name in ("", ".", ".."):
+                    raise ValueError(f"Invalid collection name '{name}'")
+                directory = os.path.join(self.directory, name) if self.directory else None
+                collection = VectorCollection(name, dimension, model=model, layers=layers, directory=directory)
+                collection.save()
+                self.collections[name] = collection
+            return collection
+
+    def drop(self, name: str):
+        with self._lock:
+            collection = self.get(name)
+            del self.collections[name]
+        if collection.directory is not None:
+            shutil.rmtree(collection.directory, ignore_errors=True)
+
+
+vector_store = VectorStore(os.getenv("VECTOR_STORE_DIR") or None)
@@ -8,7 +8,22 @@ COMPLETION_REQUEST_EXAMPLE = [
             "max_tokens": 50,
             "temperature": 0.7,
             "top_p": 1.0,
-        }
+        },
+        {
+            "model": "tinystarcoder",
+            "prompt": "def fibonacci(n):\n    ",
+            "suffix": "\n    return a\n",
+            "max_tokens": 50,
+            "temperature": 0,
+        },
+        {
+            "model": "tinystarcoder",
+            "prompt": "def is_even(n):\n",
+            "max_tokens": 100,
+            "temperature": 0,
+            "stop": ["\ndef "],
+            "stop_at": "block",
+        },
     ]
 
 # ChatMessage Example
@@ -60,6 +75,7 @@ COMPLETION_RESPONSE_EXAMPLE = [
                 "prompt_tokens": 10,
                 "completion_tokens": 50,
                 "total_tokens": 60,
+                "prompt_tokens_details": {"cached_tokens": 0},
             },
         }
     ]
@@ -69,6 +85,10 @@ EMBEDDING_REQUEST_EXAMPLE = [
         {
             "model": "deepseekcoder",
             "input": "Generate embeddings for this input text",
+        },
+        {
+            "model": "deepseekcoder",
+            "input": ["def add(a, b):", "class Stack:"],
         }
     ]
 
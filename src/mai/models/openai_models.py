@@ -1,5 +1,5 @@
-from typing import List, Optional
-from pydantic import BaseModel
+from typing import List, Literal, Optional, Union
+from pydantic import BaseModel, Field
 from .examples import (
     COMPLETION_REQUEST_EXAMPLE,
     CHAT_MESSAGE_EXAMPLE,
@@ -14,9 +14,26 @@ from .examples import (
 class CompletionRequest(BaseModel):
     model: str
     prompt: str
+    # Code after the cursor: the prompt is then the code before it, and the model fills in the middle
+    suffix: Optional[str] = None
     max_tokens: int = 100
     temperature: float = 0.7
     top_p: float = 1.0
+    stream: bool = False
+    # None caches deterministic requests only, True also caches sampled ones, False bypasses the cache
+    cache: Optional[bool] = None
+    # Speculate by copying continuations of the latest tokens from earlier in the prompt
+    prompt_lookup: bool = False
+    # Return the prompt followed by the completion rather than the completion alone
+    echo: bool = False
+    # Strings that end the completion when generated, left out of its text
+    stop: Optional[Union[str, List[str]]] = None
+    # End the completion at the end of the line, or of the block of code, it starts in
+    stop_at: Optional[Literal["line", "block"]] = None
+    # Override the X-Priority and X-Deadline-Ms headers: the request's priority class, and how many
+    # milliseconds after arrival it may wait in the queue before being dropped
+    priority: Optional[Literal["interactive", "normal", "bulk"]] = None
+    deadline_ms: Optional[float] = Field(default=None, gt=0)
 
 
 class ChatMessage(BaseModel):
@@ -28,6 +45,11 @@ class ChatCompletionRequest(BaseModel):
     model: str
     messages: List[ChatMessage]
     temperature: Optional[float] = 0.7
+    stream: bool = False
+    # Override the X-Priority and X-Deadline-Ms headers: the request's priority class, and how many
+    # milliseconds after arrival it may wait in the queue before being dropped
+    priority: Optional[Literal["interactive", "normal", "bulk"]] = None
+    deadline_ms: Optional[float] = Field(default=None, gt=0)
 
 
 # Response Models
@@ -49,10 +71,17 @@ class CompletionResponse(BaseModel):
 
 class EmbeddingRequest(BaseModel):
     model: str
-    input: str
+    # A string, a list of token IDs, or a list of either to embed in one call
+    input: Union[str, List[int], List[str], List[List[int]]]
+    # "float" returns lists of numbers, "base64" packs each vector as little-endian bytes
+    encoding_format: Literal["float", "base64"] = "float"
+    embedding_dtype: Literal["float32", "float16"] = "float32"
+    # Use only the first N transformer layers
+    layers: Optional[int] = None
 
 
 class EmbeddingResponse(BaseModel):
     model: str
-    embeddings: List[float]
-    input: str
+    # One vector for a single input, one vector per item for a list; base64 strings when requested
+    embeddings: Union[List[float], List[List[float]], str, List[str]]
+    input: Union[str, List[int], List[str], List[List[int]]]
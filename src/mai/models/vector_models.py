@@ -0,0 +1,48 @@
+from typing import Dict, List, Optional, Union
+from pydantic import BaseModel
+
+
+class CollectionUpsertRequest(BaseModel):
+    # Model used to embed `input`, and later text queries against the collection
+    model: Optional[str] = None
+    ids: List[str]
+    # Texts or token ID lists to embed, or precomputed `embeddings`
+    input: Optional[Union[List[str], List[List[int]]]] = None
+    embeddings: Optional[List[List[float]]] = None
+    metadata: Optional[List[Optional[Dict]]] = None
+    # Use only the first N transformer layers when embedding
+    layers: Optional[int] = None
+
+
+class CollectionIndexRequest(BaseModel):
+    # Number of k-means lists; 0 drops the index and goes back to exact search
+    n_lists: int = 64
+    # Lists searched per query by default
+    n_probe: int = 8
+
+
+class EmbeddingSearchRequest(BaseModel):
+    collection: str
+    # Query texts or token IDs, embedded with the collection's model, or precomputed `embeddings`
+    input: Optional[Union[str, List[str], List[int], List[List[int]]]] = None
+    embeddings: Optional[List[List[float]]] = None
+    top_k: int = 10
+    # Skip the approximate index and score every vector
+    exact: bool = False
+    n_probe: Optional[int] = None
+
+
+class SearchMatch(BaseModel):
+    id: str
+    score: float
+    metadata: Optional[Dict]
+
+
+class EmbeddingSearchResponse(BaseModel):
+    collection: str
+    # One list of matches per query, best first
+    results: List[List[SearchMatch]]
+
+
+class CollectionDeleteRequest(BaseModel):
+    ids: List[str]
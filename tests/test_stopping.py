@@ -0,0 +1,71 @@
+import sys
+from pathlib import Path
+
+import pytest
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+from transformers import PreTrainedTokenizerFast
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "src"))
+
+from mai.inference.stopping import CompletionStop
+
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    """
+    A byte-level tokenizer with one token per byte, so the tests need no downloaded model.
+    """
+    alphabet = pre_tokenizers.ByteLevel.alphabet()
+    tokenizer = Tokenizer(models.BPE(vocab={char: index for index, char in enumerate(sorted(alphabet))}, merges=[]))
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer)
+
+
+def complete(tokenizer, prefix: str, completion: str, **kwargs) -> str:
+    """
+    Feed a completion one token at a time and return the text kept once it stops.
+    """
+    stop = CompletionStop(tokenizer, tokenizer(prefix)["input_ids"], prefix=prefix, **kwargs)
+    for token_id in tokenizer(completion, add_special_tokens=False)["input_ids"]:
+        stop.add([token_id])
+        if stop.stopped:
+            break
+    stop.flush()
+    return stop.text
+
+
+def test_block_ends_at_dedent_and_blank_line(tokenizer):
+    assert complete(tokenizer, "def f(x):", "\n    return x\ndef g():\n", stop_at="block") == "\n    return x"
+    assert complete(tokenizer, "def f(x):\n    y = ", "x + 1\n    return y\n\ndef g():\n", stop_at="block") == "x + 1\n    return y"
+
+
+def test_block_continues_inside_open_brackets(tokenizer):
+    completion = "y = 1\n    z = (2,\n  3)\n    w = 4\nv = 5\n"
+    assert complete(tokenizer, "if x:\n    ", completion, stop_at="block") == "y = 1\n    z = (2,\n  3)\n    w = 4"
+
+
+def test_block_continues_through_docstring(tokenizer):
+    completion = 'Compute it.\n\n    Args:\n        x: input.\n    """\n    return x\n\ndef g():\n'
+    expected = 'Compute it.\n\n    Args:\n        x: input.\n    """\n    return x'
+    assert complete(tokenizer, 'def f(x):\n    """', completion, stop_at="block") == expected
+
+
+def test_block_continues_through_unindented_string(tokenizer):
+    completion = '    msg = """\nhello\n"""\n    return msg\nprint(msg)\n'
+    expected = '    msg = """\nhello\n"""\n    return msg'
+    assert complete(tokenizer, "def f():\n", completion, stop_at="block") == expected
+
+
+def test_floor_division_is_not_a_comment(tokenizer):
+    completion = "x = a // (b\n  + 1)\n    return x\nprint(1)\n"
+    assert complete(tokenizer, "def f(a, b):\n    ", completion, stop_at="block") == "x = a // (b\n  + 1)\n    return x"
+
+
+def test_empty_string_is_not_a_triple_quote(tokenizer):
+    assert complete(tokenizer, "x = ", '""\ny = 2\n\nz = 3', stop_at="block") == '""\ny = 2'
+
+
+def test_line_and_stop_strings(tokenizer):
+    assert complete(tokenizer, "def f(x):\n    return ", "x + 1\n    # done\n", stop_at="line") == "x + 1"
+    assert complete(tokenizer, "def f(x):", "\n    return x\n\n# end", stop=["\n\n"]) == "\n    return x"